@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'smartcar_app.compresion.CompresionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -127,3 +128,112 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# DRF: autenticación con el token firmado que emite /api/login/
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "smartcar_app.autenticacion.TokenFirmadoAuthentication",
+    ],
+    # Todo exige token salvo lo marcado con AllowAny (login, registro, salud)
+    "DEFAULT_PERMISSION_CLASSES": [
+        "rest_framework.permissions.IsAuthenticated",
+    ],
+    # Mismo JSON que el renderer de DRF, volcado con orjson si está instalado
+    "DEFAULT_RENDERER_CLASSES": [
+        "smartcar_app.renderizado.RenderizadorJSON",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+# Vigencia del token (segundos) y cache en memoria de usuarios autenticados
+SMARTCAR_TOKEN_MAX_AGE = 60 * 60 * 24 * 7
+SMARTCAR_AUTH_CACHE_TTL = 300
+SMARTCAR_AUTH_CACHE_SIZE = 1024
+
+# Correos de las cuentas que pueden ver los KPIs de todos los usuarios
+SMARTCAR_ADMINISTRADORES = []
+
+
+# Ingesta de eventos (KPIs): tamaño máximo del buffer, eventos por
+# bulk_create y segundos máximos entre escrituras
+SMARTCAR_EVENTOS_CAPACIDAD = 10000
+SMARTCAR_EVENTOS_LOTE = 500
+SMARTCAR_EVENTOS_INTERVALO = 2.0
+SMARTCAR_EVENTOS_MAX_POR_PETICION = 500
+
+
+# Paginación por cursor de listas, items e historial (sólo si el cliente
+# manda ?cursor= o ?page_size=)
+SMARTCAR_PAGE_SIZE = 50
+SMARTCAR_MAX_PAGE_SIZE = 500
+
+
+# Sync incremental: segundos de margen del watermark devuelto por /api/sync/
+SMARTCAR_SYNC_MARGEN = 5
+
+# Borrado lógico: días que se guardan los tombstones antes de que
+# purgar_borrados los elimine, y filas por lote de la purga
+SMARTCAR_PURGA_DIAS = 30
+SMARTCAR_PURGA_LOTE = 500
+
+
+# Compresión de respuestas (brotli si está instalado, si no gzip) a partir
+# de este tamaño en bytes
+SMARTCAR_COMPRESION_MINIMO = 1024
+
+
+# Alertas de presupuesto: fracción del presupuesto usada desde la que la
+# lista pasa a AMARILLA y a ROJA
+SMARTCAR_ALERTA_AMARILLA = "0.80"
+SMARTCAR_ALERTA_ROJA = "1.00"
+
+
+# Notificaciones push: proveedor por plataforma (subclases de
+# smartcar_app.push.ProveedorPush), intentos máximos y backoff en segundos.
+# El proveedor falso no sale a la red; en producción se reemplaza por los
+# de FCM / APNs.
+SMARTCAR_PUSH_PROVEEDORES = {
+    "ANDROID": "smartcar_app.push.ProveedorFalso",
+    "IOS": "smartcar_app.push.ProveedorFalso",
+    "WEB": "smartcar_app.push.ProveedorFalso",
+}
+SMARTCAR_PUSH_MAX_INTENTOS = 5
+SMARTCAR_PUSH_BACKOFF_BASE = 30
+SMARTCAR_PUSH_BACKOFF_MAX = 60 * 60
+
+
+# Precios online: fuentes (subclases de smartcar_app.precios.FuentePrecio),
+# consultas simultáneas, segundos que se cachea cada precio y circuit
+# breaker por fuente (fallos seguidos y segundos de enfriamiento)
+SMARTCAR_PRECIOS_FUENTES = ["smartcar_app.precios.FuenteLocal"]
+SMARTCAR_PRECIOS_CONCURRENCIA = 10
+SMARTCAR_PRECIOS_TTL = 6 * 60 * 60
+SMARTCAR_PRECIOS_FALLOS = 5
+SMARTCAR_PRECIOS_ENFRIAMIENTO = 60
+
+
+# Optimizador de compra (POST /api/listas/<id>/optimizar/): valor de cada
+# prioridad y hasta cuántos items pendientes se resuelve la mochila exacta
+SMARTCAR_OPTIMIZADOR_PESOS = {"A": 5, "M": 3, "B": 1}
+SMARTCAR_OPTIMIZADOR_EXACTO_MAX = 60
+
+
+# Analítica de gasto (/api/gastos/...): tiempo máximo en cache; la clave ya
+# cambia con cada escritura del usuario
+SMARTCAR_ANALITICA_CACHE_TIMEOUT = 60 * 60
+
+
+# Snapshot columnar para reportes entre usuarios (manage.py snapshot_columnar;
+# necesita numpy) y filas por lectura al exportar
+SMARTCAR_SNAPSHOT_DIR = BASE_DIR / "snapshots"
+SMARTCAR_SNAPSHOT_LOTE = 50_000
+
+
+# Precios atípicos (manage.py actualizar_referencias): últimos precios por
+# nombre para la mediana, mínimo de muestras para marcar, umbral del puntaje
+# robusto (MAD) y filas por transacción al actualizar
+SMARTCAR_ANOMALIAS_VENTANA = 200
+SMARTCAR_ANOMALIAS_MIN_MUESTRAS = 5
+SMARTCAR_ANOMALIAS_UMBRAL = "3.5"
+SMARTCAR_ANOMALIAS_LOTE = 5000
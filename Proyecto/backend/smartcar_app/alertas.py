@@ -0,0 +1,110 @@
+from decimal import Decimal
+
+from django.conf import settings
+
+from .models import Alerta, Lista
+from .push import encolar_push
+
+
+# Umbrales como fracción del presupuesto: AMARILLA desde el 80 % y ROJA
+# desde el 100 %.
+UMBRAL_AMARILLO = Decimal(str(getattr(settings, "SMARTCAR_ALERTA_AMARILLA", "0.80")))
+UMBRAL_ROJO = Decimal(str(getattr(settings, "SMARTCAR_ALERTA_ROJA", "1.00")))
+
+NIVELES = ("NINGUNA", "AMARILLA", "ROJA")
+
+
+def nivel_alerta(total, presupuesto):
+    """
+    NINGUNA / AMARILLA / ROJA según qué tanto del presupuesto se usó. Sin
+    presupuesto (0) no hay alertas.
+    """
+    if not presupuesto or presupuesto <= 0:
+        return "NINGUNA"
+    usado = (total or Decimal("0")) / presupuesto
+    if usado >= UMBRAL_ROJO:
+        return "ROJA"
+    if usado >= UMBRAL_AMARILLO:
+        return "AMARILLA"
+    return "NINGUNA"
+
+
+def estado_de(total, presupuesto):
+    if presupuesto and presupuesto > 0 and (total or Decimal("0")) > presupuesto:
+        return "SOBRE_PRESUPUESTO"
+    return "OK"
+
+
+def mensaje_alerta(nombre, nivel, total, presupuesto):
+    if nivel == "ROJA":
+        return f"La lista '{nombre}' alcanzó su presupuesto ({total} de {presupuesto})."[:255]
+    return (
+        f"La lista '{nombre}' ya usó el {int(UMBRAL_AMARILLO * 100)} % de su presupuesto "
+        f"({total} de {presupuesto})."
+    )[:255]
+
+
+def evaluar_alerta(lista_id):
+    """
+    Actualiza Lista.estado y Lista.alerta_activa con el total vigente y,
+    si se cruzó un umbral hacia arriba, registra una Alerta y/o encola una
+    notificación push según PreferenciasAlertas (in_app / push).
+
+    Es un SELECT (lista + preferencias) y, sólo cuando cambia el nivel o el
+    estado, un UPDATE condicionado al valor leído más, si corresponde, un
+    INSERT: nunca recorre los items. Si dos escrituras cruzan el mismo
+    umbral a la vez, sólo la que gana el UPDATE registra la Alerta.
+
+    Debe llamarse dentro de la transacción de la escritura que cambió el
+    total o el presupuesto (esa escritura ya incrementó Lista.version).
+    Devuelve la Alerta creada o None.
+    """
+    fila = (
+        Lista.objects.filter(pk=lista_id)
+        .values(
+            "nombre",
+            "presupuesto",
+            "total_calculado",
+            "estado",
+            "alerta_activa",
+            "usuario_id",
+            "usuario__preferencias_alertas__in_app",
+            "usuario__preferencias_alertas__push",
+        )
+        .first()
+    )
+    if fila is None:
+        return None
+
+    total, presupuesto = fila["total_calculado"], fila["presupuesto"]
+    nivel = nivel_alerta(total, presupuesto)
+    estado = estado_de(total, presupuesto)
+    if nivel == fila["alerta_activa"] and estado == fila["estado"]:
+        return None
+
+    cambiada = Lista.objects.filter(
+        pk=lista_id, alerta_activa=fila["alerta_activa"], estado=fila["estado"]
+    ).update(alerta_activa=nivel, estado=estado)
+    if not cambiada:
+        return None
+
+    if NIVELES.index(nivel) <= NIVELES.index(fila["alerta_activa"]):
+        return None
+
+    mensaje = mensaje_alerta(fila["nombre"], nivel, total, presupuesto)
+    # Sin fila de preferencias valen los defaults del modelo (in_app=True, push=False)
+    if fila["usuario__preferencias_alertas__push"]:
+        encolar_push(
+            fila["usuario_id"],
+            f"Presupuesto: {fila['nombre']}",
+            mensaje,
+            datos={"lista_id": lista_id, "tipo": nivel},
+        )
+    if fila["usuario__preferencias_alertas__in_app"] is False:
+        return None
+    return Alerta.objects.create(
+        lista_id=lista_id,
+        tipo=nivel,
+        mensaje=mensaje,
+        total_al_momento=total,
+    )
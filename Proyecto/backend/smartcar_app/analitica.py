@@ -0,0 +1,230 @@
+import re
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .gastos import DECIMAL, mes_de
+from .models import Compra, Historial, HistorialCategoria, Item, Lista, Usuario
+
+
+ANALITICA_CACHE_TIMEOUT = getattr(settings, "SMARTCAR_ANALITICA_CACHE_TIMEOUT", 60 * 60)
+
+_MES = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+class PeriodoInvalido(ValueError):
+    pass
+
+
+def leer_periodo(desde, hasta):
+    """
+    ('2025-01', '2025-06') o None en cada extremo; lanza PeriodoInvalido.
+    """
+    for valor in (desde, hasta):
+        if valor and not _MES.match(valor):
+            raise PeriodoInvalido("'desde' y 'hasta' van como AAAA-MM.")
+    if desde and hasta and desde > hasta:
+        raise PeriodoInvalido("'desde' no puede ser posterior a 'hasta'.")
+    return desde or None, hasta or None
+
+
+def _inicio_de_mes(mes, siguiente=False):
+    anio, numero = int(mes[:4]), int(mes[5:])
+    if siguiente:
+        anio, numero = (anio + 1, 1) if numero == 12 else (anio, numero + 1)
+    return timezone.make_aware(datetime(anio, numero, 1))
+
+
+def _filtrar_fechas(qs, campo, desde, hasta):
+    if desde:
+        qs = qs.filter(**{f"{campo}__gte": _inicio_de_mes(desde)})
+    if hasta:
+        qs = qs.filter(**{f"{campo}__lt": _inicio_de_mes(hasta, siguiente=True)})
+    return qs
+
+
+# ===========================
+# Vistas de gasto (un solo query agregado cada una)
+# ===========================
+# El gasto por categoría y por mes sale de Historial / HistorialCategoria,
+# que gastos.py mantiene al día en cada escritura: agrupar esos rollups es
+# mucho más barato que volver a recorrer los items. Tienda sólo existe en
+# Compra, y lo planeado contra lo pagado necesita los items comprados.
+
+def gasto_por_categoria(usuario_id, desde=None, hasta=None):
+    qs = HistorialCategoria.objects.filter(historial__usuario_id=usuario_id)
+    if desde:
+        qs = qs.filter(historial__mes__gte=desde)
+    if hasta:
+        qs = qs.filter(historial__mes__lte=hasta)
+    filas = (
+        qs.order_by()
+        .values("categoria")
+        .annotate(total=Sum("total"), numero_items=Sum("numero_items"))
+        .filter(numero_items__gt=0)
+        .order_by("-total", "categoria")
+    )
+    return [
+        {
+            "categoria": f["categoria"] or None,
+            "total": f["total"],
+            "numero_items": f["numero_items"],
+        }
+        for f in filas
+    ]
+
+
+def gasto_por_mes(usuario_id, desde=None, hasta=None):
+    qs = Historial.objects.filter(usuario_id=usuario_id, numero_items__gt=0)
+    if desde:
+        qs = qs.filter(mes__gte=desde)
+    if hasta:
+        qs = qs.filter(mes__lte=hasta)
+    return list(qs.order_by("mes").values("mes", "total", "numero_items"))
+
+
+def gasto_por_tienda(usuario_id, desde=None, hasta=None):
+    qs = _filtrar_fechas(
+        Compra.objects.filter(
+            item__lista__usuario_id=usuario_id,
+            item__deleted_at__isnull=True,
+            item__lista__deleted_at__isnull=True,
+        ),
+        "fecha",
+        desde,
+        hasta,
+    )
+    filas = (
+        qs.order_by()
+        .values("tienda")
+        .annotate(
+            total=Sum(
+                ExpressionWrapper(F("cantidad") * F("precio_unitario"), output_field=DECIMAL)
+            ),
+            numero_compras=Count("id"),
+        )
+        .order_by("-total", "tienda")
+    )
+    return [
+        {
+            "tienda": f["tienda"] or None,
+            "total": f["total"],
+            "numero_compras": f["numero_compras"],
+        }
+        for f in filas
+    ]
+
+
+def planeado_vs_pagado(usuario_id, desde=None, hasta=None):
+    """
+    Por mes de compra, lo planeado (cantidad * precio_unitario) contra lo
+    pagado (cantidad_comprada * precio_pagado) de los items comprados con
+    precio pagado.
+    """
+    qs = _filtrar_fechas(
+        Item.objects.filter(
+            lista__usuario_id=usuario_id,
+            lista__deleted_at__isnull=True,
+            comprado=True,
+            precio_pagado__isnull=False,
+            fecha_comprado__isnull=False,
+        ),
+        "fecha_comprado",
+        desde,
+        hasta,
+    )
+    filas = (
+        qs.annotate(mes_fecha=TruncMonth("fecha_comprado"))
+        .order_by()
+        .values("mes_fecha")
+        .annotate(
+            planeado=Sum(
+                ExpressionWrapper(F("cantidad") * F("precio_unitario"), output_field=DECIMAL)
+            ),
+            pagado=Sum(
+                ExpressionWrapper(
+                    Coalesce("cantidad_comprada", "cantidad") * F("precio_pagado"),
+                    output_field=DECIMAL,
+                )
+            ),
+            numero_items=Count("id"),
+        )
+        .order_by("mes_fecha")
+    )
+    resultado = []
+    for f in filas:
+        planeado, pagado = f["planeado"] or Decimal("0"), f["pagado"] or Decimal("0")
+        resultado.append(
+            {
+                "mes": mes_de(f["mes_fecha"]),
+                "planeado": planeado,
+                "pagado": pagado,
+                "diferencia": pagado - planeado,
+                "numero_items": f["numero_items"],
+            }
+        )
+    return resultado
+
+
+VISTAS_GASTO = {
+    "categorias": gasto_por_categoria,
+    "meses": gasto_por_mes,
+    "tiendas": gasto_por_tienda,
+    "planeado_vs_pagado": planeado_vs_pagado,
+}
+
+
+# ===========================
+# Cache por última escritura del usuario
+# ===========================
+def ultima_escritura(usuario_id):
+    """
+    Marca de la última escritura que puede cambiar la analítica de un
+    usuario: el updated_at más reciente de sus listas (toda escritura de
+    items lo mueve, también los borrados) y la última Compra. Un solo
+    SELECT con dos subconsultas por índice.
+    """
+    listas = (
+        Lista.todos.filter(usuario_id=OuterRef("pk"))
+        .order_by("-updated_at")
+        .values("updated_at")[:1]
+    )
+    compras = (
+        Compra.objects.filter(item__lista__usuario_id=OuterRef("pk"))
+        .order_by("-created_at")
+        .values("created_at")[:1]
+    )
+    fila = (
+        Usuario.objects.filter(pk=usuario_id)
+        .values(listas_at=Subquery(listas), compras_at=Subquery(compras))
+        .first()
+    )
+    if fila is None:
+        return None
+    return "-".join(
+        "%x" % int(fecha.timestamp() * 1_000_000) if fecha else "0"
+        for fecha in (fila["listas_at"], fila["compras_at"])
+    )
+
+
+def analitica_gasto(usuario_id, vista, desde=None, hasta=None):
+    """
+    El resultado de VISTAS_GASTO[vista], cacheado con la marca de la última
+    escritura del usuario en la clave: cualquier cambio lo invalida y, si
+    no hubo cambios, no se toca ninguna tabla de datos. None si el usuario
+    no existe.
+    """
+    marca = ultima_escritura(usuario_id)
+    if marca is None:
+        return None
+    key = f"analitica:{vista}:{usuario_id}:{marca}:{desde or ''}:{hasta or ''}"
+    resultado = cache.get(key)
+    if resultado is None:
+        resultado = VISTAS_GASTO[vista](usuario_id, desde, hasta)
+        cache.set(key, resultado, ANALITICA_CACHE_TIMEOUT)
+    return resultado
@@ -0,0 +1,188 @@
+import json
+from decimal import Decimal
+from statistics import median
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Compra, PrecioOnline, ReferenciaPrecio, WatermarkReferencia
+from .precios import normalizar_nombre
+
+
+# Últimos precios por nombre con los que se calcula la referencia
+VENTANA = getattr(settings, "SMARTCAR_ANOMALIAS_VENTANA", 200)
+# Con menos precios que esto no se marca nada (la mediana no dice mucho)
+MIN_MUESTRAS = getattr(settings, "SMARTCAR_ANOMALIAS_MIN_MUESTRAS", 5)
+# Puntaje robusto desde el que un precio es atípico (Iglewicz y Hoaglin: 3.5)
+UMBRAL = Decimal(str(getattr(settings, "SMARTCAR_ANOMALIAS_UMBRAL", "3.5")))
+# Filas de cada tabla de historial por transacción al actualizar
+LOTE = getattr(settings, "SMARTCAR_ANOMALIAS_LOTE", 5000)
+
+# 0.6745 = percentil 75 de la normal: hace el MAD comparable a la desviación estándar
+CONSTANTE_MAD = Decimal("0.6745")
+# Si todos los precios son iguales el MAD es 0: la escala nunca baja del 5 % de la mediana
+MAD_MINIMO_RELATIVO = Decimal("0.05")
+CENTAVO = Decimal("0.01")
+
+# watermark (WatermarkReferencia.nombre) -> (modelo, campo del precio, campo de la fecha)
+HISTORIALES = {
+    "referencias:compras": (Compra, "precio_unitario", "fecha"),
+    "referencias:precios_online": (PrecioOnline, "precio_consultado", "fecha_consulta"),
+}
+
+
+def clave_referencia(nombre):
+    return normalizar_nombre(nombre)[:100]
+
+
+# ===========================
+# Mediana y MAD
+# ===========================
+def estadisticos(precios):
+    """
+    (mediana, MAD) de una lista no vacía de Decimal, a dos decimales.
+    """
+    centro = median(precios)
+    mad = median(abs(precio - centro) for precio in precios)
+    return centro.quantize(CENTAVO), mad.quantize(CENTAVO)
+
+
+def puntaje_robusto(precio, mediana, mad):
+    escala = max(mad, mediana * MAD_MINIMO_RELATIVO, CENTAVO)
+    return CONSTANTE_MAD * abs(precio - mediana) / escala
+
+
+def es_atipico(precio, referencia):
+    """
+    True si 'precio' se aleja de la referencia ({mediana, mad, muestras} o
+    None) más de UMBRAL. Sin referencia, con pocas muestras o sin precio
+    (0, el default) no se marca.
+    """
+    if referencia is None or referencia["muestras"] < MIN_MUESTRAS:
+        return False
+    if precio is None or precio <= 0:
+        return False
+    return puntaje_robusto(precio, referencia["mediana"], referencia["mad"]) > UMBRAL
+
+
+# ===========================
+# Chequeo en las escrituras de items
+# ===========================
+# Una escritura no mira el historial: lee la fila ya calculada de su
+# nombre por la clave única (un SELECT por índice, o uno solo para todo un
+# lote). El resultado queda en Item.precio_atipico y vale con la
+# referencia que había al escribir.
+
+def precio_atipico(nombre, precio):
+    if precio is None or precio <= 0:
+        return False
+    referencia = (
+        ReferenciaPrecio.objects.filter(nombre=clave_referencia(nombre))
+        .values("mediana", "mad", "muestras")
+        .first()
+    )
+    return es_atipico(precio, referencia)
+
+
+def marcar_atipicos(items):
+    """
+    Pone precio_atipico en las instancias de Item (sin guardarlas) con un
+    solo query para todas.
+    """
+    # Pares y no dict: las instancias sin guardar no se pueden usar de clave
+    claves = [(item, clave_referencia(item.nombre)) for item in items]
+    if not claves:
+        return
+    referencias = {
+        fila["nombre"]: fila
+        for fila in ReferenciaPrecio.objects.filter(
+            nombre__in={clave for _, clave in claves}
+        ).values("nombre", "mediana", "mad", "muestras")
+    }
+    for item, clave in claves:
+        item.precio_atipico = es_atipico(item.precio_unitario, referencias.get(clave))
+
+
+# ===========================
+# Actualización incremental
+# ===========================
+def _acumular_lote(lote):
+    """
+    Lee hasta 'lote' filas nuevas de cada historial (id mayor al watermark),
+    las suma a la ventana de su nombre y recalcula mediana y MAD sólo de los
+    nombres tocados. Todo en una transacción con los watermarks: si se corta
+    a la mitad, la siguiente corrida retoma desde el mismo punto.
+    Devuelve (filas leídas, nombres actualizados).
+    """
+    with transaction.atomic():
+        nuevas, leidas = {}, 0
+        for nombre_watermark, (modelo, campo_precio, campo_fecha) in HISTORIALES.items():
+            watermark, _ = WatermarkReferencia.objects.select_for_update().get_or_create(
+                nombre=nombre_watermark
+            )
+            filas = list(
+                modelo.objects.filter(id__gt=watermark.ultimo_id)
+                .order_by("id")
+                .values_list("id", "item__nombre", campo_precio, campo_fecha)[:lote]
+            )
+            for _, nombre, precio, fecha in filas:
+                if precio is not None and precio > 0:
+                    nuevas.setdefault(clave_referencia(nombre), []).append((fecha, precio))
+            if filas:
+                watermark.ultimo_id = filas[-1][0]
+                watermark.save()
+            leidas += len(filas)
+
+        existentes = ReferenciaPrecio.objects.select_for_update().in_bulk(
+            list(nuevas), field_name="nombre"
+        )
+        ahora = timezone.now()
+        crear, editar = [], []
+        for nombre, muestras in nuevas.items():
+            referencia = existentes.get(nombre)
+            if referencia is None:
+                referencia = ReferenciaPrecio(nombre=nombre)
+                crear.append(referencia)
+                ventana = []
+            else:
+                editar.append(referencia)
+                ventana = json.loads(referencia.ventana)
+            ventana += [str(precio) for _, precio in sorted(muestras, key=lambda m: m[0])]
+            ventana = ventana[-VENTANA:]
+            referencia.mediana, referencia.mad = estadisticos([Decimal(p) for p in ventana])
+            referencia.muestras = len(ventana)
+            referencia.ventana = json.dumps(ventana)
+            referencia.updated_at = ahora
+
+        ReferenciaPrecio.objects.bulk_create(crear, batch_size=500)
+        ReferenciaPrecio.objects.bulk_update(
+            editar, ["mediana", "mad", "muestras", "ventana", "updated_at"], batch_size=500
+        )
+    return leidas, set(nuevas)
+
+
+def actualizar_referencias(lote=LOTE):
+    """
+    Suma a ReferenciaPrecio todas las compras y precios online que llegaron
+    desde la última corrida. Devuelve (filas leídas, nombres actualizados).
+    """
+    total, nombres = 0, set()
+    while True:
+        leidas, tocados = _acumular_lote(lote)
+        if not leidas:
+            break
+        total += leidas
+        nombres |= tocados
+    return total, len(nombres)
+
+
+def reconstruir_referencias(lote=LOTE):
+    """
+    Borra las referencias y los watermarks y las calcula desde todo el
+    historial (en lotes, igual que la actualización incremental).
+    """
+    with transaction.atomic():
+        ReferenciaPrecio.objects.all().delete()
+        WatermarkReferencia.objects.all().delete()
+    return actualizar_referencias(lote)
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from rest_framework import authentication, exceptions, permissions
+
+from .models import Usuario
+
+
+TOKEN_SALT = "smartcar.auth.token"
+TOKEN_MAX_AGE = getattr(settings, "SMARTCAR_TOKEN_MAX_AGE", 60 * 60 * 24 * 7)
+CACHE_TTL = getattr(settings, "SMARTCAR_AUTH_CACHE_TTL", 300)
+CACHE_TAMANO = getattr(settings, "SMARTCAR_AUTH_CACHE_SIZE", 1024)
+
+
+# ===========================
+# Tokens firmados (sin estado en el servidor)
+# ===========================
+def emitir_token(usuario):
+    """
+    Token firmado con SECRET_KEY que lleva el id del usuario y la hora de
+    emisión. No se guarda en ningún lado: basta con verificar la firma.
+    """
+    return signing.dumps({"uid": usuario.pk}, salt=TOKEN_SALT, compress=True)
+
+
+def leer_token(token):
+    """
+    Devuelve el id de usuario del token, o lanza AuthenticationFailed si la
+    firma no cuadra o ya venció.
+    """
+    try:
+        datos = signing.loads(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed("El token venció, vuelve a iniciar sesión.")
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed("Token inválido.")
+    return datos["uid"]
+
+
+# ===========================
+# Principal cacheado
+# ===========================
+class UsuarioAutenticado:
+    """
+    Lo que queda en request.user: sólo los datos que usan los endpoints, para
+    no tener que ir a la tabla usuarios en cada request.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, usuario):
+        self.id = self.pk = usuario.pk
+        self.nombre = usuario.nombre
+        self.correo = usuario.correo
+
+    def __str__(self):
+        return f"{self.nombre} <{self.correo}>"
+
+
+class CacheLRU:
+    """
+    Cache en memoria del proceso, con tamaño máximo (se va el menos usado)
+    y vencimiento por tiempo. Segura entre hilos.
+    """
+
+    def __init__(self, tamano, ttl):
+        self.tamano = tamano
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            valor, vence = entrada
+            if vence < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + self.ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.tamano:
+                self._datos.popitem(last=False)
+
+
+principales = CacheLRU(CACHE_TAMANO, CACHE_TTL)
+
+
+def principal_de(usuario_id):
+    principal = principales.get(usuario_id)
+    if principal is None:
+        try:
+            usuario = Usuario.objects.only("id", "nombre", "correo").get(pk=usuario_id)
+        except Usuario.DoesNotExist:
+            raise exceptions.AuthenticationFailed("El usuario del token ya no existe.")
+        principal = UsuarioAutenticado(usuario)
+        principales.set(usuario_id, principal)
+    return principal
+
+
+class TokenFirmadoAuthentication(authentication.BaseAuthentication):
+    """
+    Authorization: Bearer <token de /api/login/>
+
+    Si no viene el header la petición queda anónima y la rechaza el
+    permiso por defecto (IsAuthenticated) con 401, salvo en login, registro
+    y salud.
+    """
+
+    keyword = "Bearer"
+
+    def authenticate(self, request):
+        partes = authentication.get_authorization_header(request).split()
+        if not partes or partes[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(partes) != 2:
+            raise exceptions.AuthenticationFailed("Header Authorization mal formado.")
+        try:
+            token = partes[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed("Token inválido.")
+        return (principal_de(leer_token(token)), token)
+
+    def authenticate_header(self, request):
+        return self.keyword
+
+
+# ===========================
+# Permisos
+# ===========================
+class EsAdministrador(permissions.BasePermission):
+    """
+    Sólo las cuentas cuyo correo está en SMARTCAR_ADMINISTRADORES: para los
+    endpoints con datos de todos los usuarios (KPIs diarios).
+    """
+
+    message = "Sólo los administradores pueden ver esta información."
+
+    def has_permission(self, request, view):
+        usuario = request.user
+        if not (usuario and usuario.is_authenticated):
+            return False
+        return usuario.correo in getattr(settings, "SMARTCAR_ADMINISTRADORES", ())
@@ -0,0 +1,404 @@
+import json
+import os
+import shutil
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import (
+    BigIntegerField,
+    BooleanField,
+    ExpressionWrapper,
+    F,
+    IntegerField,
+    Max,
+    Q,
+)
+from django.db.models.functions import Cast, Coalesce, ExtractMonth, ExtractYear, Round
+from django.utils import timezone
+
+from .gastos import FECHA_HISTORIAL, GASTO_ITEM
+from .models import Compra, Item, PrecioOnline
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+
+# ===========================
+# Snapshot columnar para reportes entre usuarios
+# ===========================
+# Los reportes que recorren las tablas de todos los usuarios no se corren
+# sobre SQLite (bloquean a los que escriben y agrupan en Python): se
+# exportan items, compras y precios online a arrays de NumPy en disco, una
+# columna por archivo .npy, y los reportes los abren con mmap (sin
+# cargarlos en memoria) y agrupan vectorizado.
+#
+# Montos en centavos (int64), cantidades en centésimas, meses como AAAAMM
+# y textos repetidos (categoría, tienda, fuente, prioridad) como códigos
+# enteros contra un diccionario guardado en meta.json (código 0 = vacío).
+
+DIRECTORIO = getattr(
+    settings, "SMARTCAR_SNAPSHOT_DIR", os.path.join(settings.BASE_DIR, "snapshots")
+)
+# Filas por query al exportar: cada lote es una lectura corta
+LOTE_EXPORTACION = getattr(settings, "SMARTCAR_SNAPSHOT_LOTE", 50_000)
+
+
+class NumpyNoDisponible(RuntimeError):
+    pass
+
+
+def requiere_numpy():
+    if np is None:
+        raise NumpyNoDisponible("El snapshot columnar necesita numpy (pip install numpy).")
+
+
+def _centesimas(expresion):
+    return Cast(Round(expresion * 100), BigIntegerField())
+
+
+def _mes(campo):
+    return ExpressionWrapper(
+        ExtractYear(campo) * 100 + ExtractMonth(campo), output_field=IntegerField()
+    )
+
+
+# tabla -> (queryset, [(columna, dtype, expresión o campo, diccionario o None)])
+def tablas_snapshot():
+    return {
+        "items": (
+            Item.objects.filter(lista__deleted_at__isnull=True),
+            [
+                ("usuario", "int64", "lista__usuario_id", None),
+                ("lista", "int64", "lista_id", None),
+                ("categoria", "int32", "categoria", "categorias"),
+                ("prioridad", "int8", "prioridad", "prioridades"),
+                ("cantidad_centesimas", "int64", _centesimas(F("cantidad")), None),
+                ("precio_centavos", "int64", _centesimas(F("precio_unitario")), None),
+                (
+                    "subtotal_centavos",
+                    "int64",
+                    _centesimas(F("cantidad") * F("precio_unitario")),
+                    None,
+                ),
+                # Mismo gasto y mes que Historial (ver gastos.py)
+                ("gasto_centavos", "int64", _centesimas(GASTO_ITEM), None),
+                ("mes", "int32", _mes(FECHA_HISTORIAL), None),
+                ("comprado", "bool", "comprado", None),
+                (
+                    "tiene_pagado",
+                    "bool",
+                    ExpressionWrapper(Q(precio_pagado__isnull=False), output_field=BooleanField()),
+                    None,
+                ),
+                (
+                    "pagado_centavos",
+                    "int64",
+                    Coalesce(
+                        _centesimas(Coalesce("cantidad_comprada", "cantidad") * F("precio_pagado")),
+                        0,
+                    ),
+                    None,
+                ),
+            ],
+        ),
+        "compras": (
+            Compra.objects.filter(
+                item__deleted_at__isnull=True, item__lista__deleted_at__isnull=True
+            ),
+            [
+                ("usuario", "int64", "item__lista__usuario_id", None),
+                ("item", "int64", "item_id", None),
+                ("categoria", "int32", "item__categoria", "categorias"),
+                ("tienda", "int32", "tienda", "tiendas"),
+                ("cantidad_centesimas", "int64", _centesimas(F("cantidad")), None),
+                ("precio_centavos", "int64", _centesimas(F("precio_unitario")), None),
+                (
+                    "total_centavos",
+                    "int64",
+                    _centesimas(F("cantidad") * F("precio_unitario")),
+                    None,
+                ),
+                ("mes", "int32", _mes("fecha"), None),
+            ],
+        ),
+        "precios": (
+            PrecioOnline.objects.filter(
+                item__deleted_at__isnull=True, item__lista__deleted_at__isnull=True
+            ),
+            [
+                ("usuario", "int64", "item__lista__usuario_id", None),
+                ("item", "int64", "item_id", None),
+                ("categoria", "int32", "item__categoria", "categorias"),
+                ("fuente", "int32", "fuente", "fuentes"),
+                ("precio_centavos", "int64", _centesimas(F("precio_consultado")), None),
+                ("mes", "int32", _mes("fecha_consulta"), None),
+            ],
+        ),
+    }
+
+
+# ===========================
+# Exportación
+# ===========================
+def _exportar_tabla(carpeta, nombre, qs, columnas, diccionarios, lote):
+    """
+    Escribe las columnas de la tabla directo a .npy (open_memmap) leyendo
+    por keyset de id en lotes de 'lote' filas. Se fija el id máximo al
+    empezar: lo que se inserte durante la exportación queda para el
+    próximo snapshot. Devuelve cuántas filas se escribieron.
+    """
+    tope = qs.aggregate(tope=Max("id"))["tope"] or 0
+    qs = qs.filter(id__lte=tope)
+    total = qs.count()
+
+    anotaciones, campos = {}, ["id"]
+    for columna, _, fuente, _ in columnas:
+        if isinstance(fuente, str):
+            campos.append(fuente)
+        else:
+            anotaciones[f"col_{columna}"] = fuente
+            campos.append(f"col_{columna}")
+    filas_qs = qs.annotate(**anotaciones).order_by("id").values_list(*campos)
+
+    arrays = {
+        columna: np.lib.format.open_memmap(
+            os.path.join(carpeta, f"{nombre}.{columna}.npy"), mode="w+", dtype=dtype, shape=(total,)
+        )
+        for columna, dtype, _, _ in [("id", "int64", None, None)] + columnas
+    }
+
+    escritas, ultimo_id = 0, 0
+    while escritas < total:
+        filas = list(filas_qs.filter(id__gt=ultimo_id)[:lote])
+        if not filas:
+            break
+        # Si entre el count y la lectura se restauró algo, no pasarse del array
+        filas = filas[: total - escritas]
+        valores = list(zip(*filas))
+        fin = escritas + len(filas)
+        arrays["id"][escritas:fin] = valores[0]
+        for (columna, dtype, _, diccionario), datos in zip(columnas, valores[1:]):
+            if diccionario is not None:
+                codigos = diccionarios.setdefault(diccionario, {None: 0})
+                datos = [codigos.setdefault(v or None, len(codigos)) for v in datos]
+            arrays[columna][escritas:fin] = np.asarray(datos, dtype=dtype)
+        escritas, ultimo_id = fin, filas[-1][0]
+
+    for array in arrays.values():
+        array.flush()
+    return escritas
+
+
+def exportar_snapshot(directorio=DIRECTORIO, lote=LOTE_EXPORTACION, conservar=2):
+    """
+    Exporta un snapshot nuevo a <directorio>/snapshot-<fecha>/ y lo publica
+    como el actual (archivo ACTUAL) sólo cuando está completo. Borra los
+    snapshots viejos dejando 'conservar'. Devuelve la ruta del snapshot.
+    """
+    requiere_numpy()
+    os.makedirs(directorio, exist_ok=True)
+    nombre = "snapshot-" + timezone.now().strftime("%Y%m%dT%H%M%S%f")
+    temporal = os.path.join(directorio, nombre + ".tmp")
+    os.makedirs(temporal)
+
+    diccionarios = {}
+    meta = {"creado": timezone.now().isoformat(), "tablas": {}}
+    for tabla, (qs, columnas) in tablas_snapshot().items():
+        filas = _exportar_tabla(temporal, tabla, qs, columnas, diccionarios, lote)
+        meta["tablas"][tabla] = {
+            "filas": filas,
+            "columnas": {"id": "int64", **{c[0]: c[1] for c in columnas}},
+            "diccionarios": {c[0]: c[3] for c in columnas if c[3] is not None},
+        }
+    # {texto: código} -> [texto por código]
+    meta["diccionarios"] = {
+        nombre_dic: sorted(codigos, key=codigos.get) for nombre_dic, codigos in diccionarios.items()
+    }
+    with open(os.path.join(temporal, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    final = os.path.join(directorio, nombre)
+    os.rename(temporal, final)
+    puntero = os.path.join(directorio, "ACTUAL")
+    with open(puntero + ".tmp", "w", encoding="utf-8") as f:
+        f.write(nombre)
+    os.replace(puntero + ".tmp", puntero)
+
+    anteriores = sorted(
+        d for d in os.listdir(directorio) if d.startswith("snapshot-") and d != nombre
+    )
+    for viejo in anteriores[: max(len(anteriores) - (conservar - 1), 0)]:
+        shutil.rmtree(os.path.join(directorio, viejo), ignore_errors=True)
+    return final
+
+
+# ===========================
+# Lectura y reportes (vectorizados sobre mmap)
+# ===========================
+def centavos_a_decimal(centavos):
+    return Decimal(int(round(centavos))).scaleb(-2)
+
+
+class Snapshot:
+    """
+    Un snapshot exportado. Las columnas se abren con mmap la primera vez
+    que se piden: sólo se lee del disco lo que el reporte recorre.
+    """
+
+    def __init__(self, ruta):
+        requiere_numpy()
+        self.ruta = ruta
+        with open(os.path.join(ruta, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self._columnas = {}
+
+    @classmethod
+    def actual(cls, directorio=DIRECTORIO):
+        try:
+            with open(os.path.join(directorio, "ACTUAL"), encoding="utf-8") as f:
+                nombre = f.read().strip()
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"No hay snapshot en {directorio}: corre 'manage.py snapshot_columnar'."
+            )
+        return cls(os.path.join(directorio, nombre))
+
+    @property
+    def creado(self):
+        return self.meta["creado"]
+
+    def filas(self, tabla):
+        return self.meta["tablas"][tabla]["filas"]
+
+    def columna(self, tabla, nombre):
+        clave = (tabla, nombre)
+        if clave not in self._columnas:
+            array = np.load(os.path.join(self.ruta, f"{tabla}.{nombre}.npy"), mmap_mode="r")
+            self._columnas[clave] = array[: self.filas(tabla)]
+        return self._columnas[clave]
+
+    def etiquetas(self, tabla, columna):
+        """
+        Lista código -> texto si la columna está codificada, si no None.
+        """
+        diccionario = self.meta["tablas"][tabla]["diccionarios"].get(columna)
+        if diccionario is None:
+            return None
+        return self.meta["diccionarios"].get(diccionario, [None])
+
+    def filtro(self, tabla, usuario=None, desde=None, hasta=None, **iguales):
+        """
+        Máscara booleana de las filas que cumplen, o None si no hay filtro.
+        desde/hasta son meses AAAAMM (enteros); iguales compara columna == valor.
+        """
+        mascara = None
+        condiciones = []
+        if usuario is not None:
+            condiciones.append(self.columna(tabla, "usuario") == usuario)
+        if desde is not None:
+            condiciones.append(self.columna(tabla, "mes") >= desde)
+        if hasta is not None:
+            condiciones.append(self.columna(tabla, "mes") <= hasta)
+        for columna, valor in iguales.items():
+            condiciones.append(self.columna(tabla, columna) == valor)
+        for condicion in condiciones:
+            mascara = condicion if mascara is None else mascara & condicion
+        return mascara
+
+    def _grupos(self, tabla, por, mascara):
+        """
+        (etiquetas, código de grupo por fila [0..k)) para la columna 'por'.
+        Las codificadas ya son códigos densos; el resto pasa por np.unique.
+        """
+        claves = self.columna(tabla, por)
+        if mascara is not None:
+            claves = claves[mascara]
+        etiquetas = self.etiquetas(tabla, por)
+        if etiquetas is not None:
+            return etiquetas, np.asarray(claves, dtype=np.int64)
+        unicas, inversa = np.unique(claves, return_inverse=True)
+        return [v.item() for v in unicas], inversa.reshape(-1)
+
+    def sumar_por(self, tabla, por, valor, mascara=None):
+        """
+        [(grupo, suma de 'valor', filas)] de mayor a menor suma. Con
+        bincount la suma es exacta mientras el total no pase de 2^53
+        centavos por grupo.
+        """
+        etiquetas, grupos = self._grupos(tabla, por, mascara)
+        valores = self.columna(tabla, valor)
+        if mascara is not None:
+            valores = valores[mascara]
+        k = len(etiquetas)
+        sumas = np.bincount(grupos, weights=valores, minlength=k)
+        conteos = np.bincount(grupos, minlength=k)
+        presentes = np.flatnonzero(conteos)
+        orden = presentes[np.argsort(-sumas[presentes], kind="stable")]
+        return [(etiquetas[i], int(round(sumas[i])), int(conteos[i])) for i in orden]
+
+    def percentiles_por(self, tabla, por, valor, percentiles=(50, 90), mascara=None):
+        """
+        {grupo: [percentil...]} de 'valor' en cada grupo, con interpolación
+        lineal (como np.percentile). Un solo ordenamiento para todos los
+        grupos.
+        """
+        etiquetas, grupos = self._grupos(tabla, por, mascara)
+        valores = self.columna(tabla, valor)
+        if mascara is not None:
+            valores = valores[mascara]
+        orden = np.lexsort((valores, grupos))
+        valores = np.asarray(valores[orden], dtype=np.float64)
+        conteos = np.bincount(grupos, minlength=len(etiquetas))
+        inicios = np.concatenate(([0], np.cumsum(conteos)[:-1]))
+        presentes = np.flatnonzero(conteos)
+        inicios, conteos = inicios[presentes], conteos[presentes]
+
+        columnas = []
+        for p in percentiles:
+            posicion = inicios + (conteos - 1) * (p / 100)
+            abajo = np.floor(posicion).astype(np.int64)
+            arriba = np.minimum(abajo + 1, inicios + conteos - 1)
+            fraccion = posicion - abajo
+            columnas.append(valores[abajo] * (1 - fraccion) + valores[arriba] * fraccion)
+        return {
+            etiquetas[g]: [float(c[i]) for c in columnas] for i, g in enumerate(presentes)
+        }
+
+
+# Reportes con nombre (los usa 'manage.py reporte_columnar')
+def gasto_por_categoria(snapshot, **filtros):
+    mascara = snapshot.filtro("items", **filtros)
+    return snapshot.sumar_por("items", "categoria", "gasto_centavos", mascara)
+
+
+def gasto_por_mes(snapshot, **filtros):
+    mascara = snapshot.filtro("items", **filtros)
+    return sorted(snapshot.sumar_por("items", "mes", "gasto_centavos", mascara))
+
+
+def gasto_por_tienda(snapshot, **filtros):
+    mascara = snapshot.filtro("compras", **filtros)
+    return snapshot.sumar_por("compras", "tienda", "total_centavos", mascara)
+
+
+def gasto_por_usuario(snapshot, **filtros):
+    mascara = snapshot.filtro("items", **filtros)
+    return snapshot.sumar_por("items", "usuario", "gasto_centavos", mascara)
+
+
+def percentiles_precio_por_categoria(snapshot, percentiles=(50, 90, 99), **filtros):
+    mascara = snapshot.filtro("items", **filtros)
+    return snapshot.percentiles_por(
+        "items", "categoria", "precio_centavos", percentiles, mascara
+    )
+
+
+REPORTES = {
+    "categorias": gasto_por_categoria,
+    "meses": gasto_por_mes,
+    "tiendas": gasto_por_tienda,
+    "usuarios": gasto_por_usuario,
+    "percentiles_precio": percentiles_precio_por_categoria,
+}
@@ -0,0 +1,99 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depende del entorno
+    brotli = None
+
+
+# Respuestas más chicas que esto no se comprimen: el ahorro no paga el CPU
+TAMANO_MINIMO = getattr(settings, "SMARTCAR_COMPRESION_MINIMO", 1024)
+NIVEL_GZIP = getattr(settings, "SMARTCAR_COMPRESION_NIVEL_GZIP", 6)
+NIVEL_BROTLI = getattr(settings, "SMARTCAR_COMPRESION_NIVEL_BROTLI", 5)
+
+
+def codificaciones_aceptadas(accept_encoding):
+    """
+    {codificación: q} del header Accept-Encoding ('gzip;q=0.5, br').
+    """
+    aceptadas = {}
+    for parte in accept_encoding.split(","):
+        nombre, _, params = parte.strip().partition(";")
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre] = q
+    return aceptadas
+
+
+def elegir_codificacion(accept_encoding):
+    """
+    'br' o 'gzip' según lo que acepte el cliente (a igual q se prefiere br,
+    que comprime más el JSON), o None.
+    """
+    aceptadas = codificaciones_aceptadas(accept_encoding)
+    comodin = aceptadas.get("*", 0.0)
+    candidatas = []
+    if brotli is not None:
+        candidatas.append("br")
+    candidatas.append("gzip")
+
+    mejor, mejor_q = None, 0.0
+    for nombre in candidatas:
+        q = aceptadas.get(nombre, comodin)
+        if q > mejor_q:
+            mejor, mejor_q = nombre, q
+    return mejor
+
+
+def comprimir(contenido, codificacion):
+    if codificacion == "br":
+        return brotli.compress(contenido, quality=NIVEL_BROTLI)
+    return gzip.compress(contenido, compresslevel=NIVEL_GZIP, mtime=0)
+
+
+class CompresionMiddleware:
+    """
+    Comprime con brotli o gzip (lo que negocie Accept-Encoding) las
+    respuestas de más de TAMANO_MINIMO bytes. Como el GZipMiddleware de
+    Django, debilita el ETag (el cuerpo cambia, el recurso no) y agrega
+    Vary: Accept-Encoding.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if len(response.content) < TAMANO_MINIMO:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        codificacion = elegir_codificacion(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if codificacion is None:
+            return response
+
+        comprimido = comprimir(response.content, codificacion)
+        if len(comprimido) >= len(response.content):
+            return response
+
+        response.content = comprimido
+        response["Content-Length"] = str(len(comprimido))
+        response["Content-Encoding"] = codificacion
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
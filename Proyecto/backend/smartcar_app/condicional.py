@@ -0,0 +1,121 @@
+import hashlib
+import time
+
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# ===========================
+# GET condicional (ETag / Last-Modified)
+# ===========================
+# Todo lo que se ve de una lista y de sus items cambia junto con
+# Lista.version (cualquier escritura la incrementa) o Lista.updated_at, así
+# que esos dos campos bastan para validar la caché del cliente sin leer
+# los items ni serializar nada.
+
+
+def etag_lista(lista_id, version, updated_at, variante=""):
+    """
+    ETag fuerte de una lista. 'variante' distingue representaciones
+    distintas de la misma versión (p.ej. los items, o una página).
+    """
+    return _etag(lista_id, version, updated_at, variante)
+
+
+def etag_item(item):
+    return _etag(item.pk, item.version, item.updated_at)
+
+
+def _etag(pk, version, updated_at, variante=""):
+    # Formato: "<id>-<version>-<updated_at en µs, hex>[-<hash de la variante>]"
+    sello = int(updated_at.timestamp() * 1_000_000) if updated_at else 0
+    etag = f"{pk}-{version}-{sello:x}"
+    if variante:
+        etag += "-" + hashlib.sha1(variante.encode()).hexdigest()[:12]
+    return quote_etag(etag)
+
+
+def variante_de(request, prefijo):
+    """
+    Identifica la representación pedida: el recurso más los parámetros de
+    la URL que cambian la respuesta (página, tamaño de página).
+    """
+    params = sorted(
+        (clave, valor)
+        for clave, valor in request.query_params.items()
+        if clave in ("cursor", "page_size")
+    )
+    return prefijo + "?" + "&".join(f"{clave}={valor}" for clave, valor in params)
+
+
+def no_modificado(request, etag, ultima_modificacion):
+    """
+    304 si el cliente ya tiene esta representación, o None.
+    If-None-Match manda sobre If-Modified-Since (RFC 9110).
+
+    Last-Modified sólo tiene segundos y dos escrituras dentro del mismo
+    segundo dan la misma fecha, así que If-Modified-Since sólo responde 304
+    si la última modificación es de un segundo anterior al que manda el
+    cliente y ya pasó más de un segundo desde ella. Devolver la misma fecha
+    de Last-Modified nunca da 304: para revalidar se usa el ETag.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        # La comparación de If-None-Match es débil: W/"x" vale como "x"
+        etags = [e[2:] if e.startswith("W/") else e for e in etags]
+        if "*" in etags or etag in etags:
+            return con_validadores(
+                Response(status=status.HTTP_304_NOT_MODIFIED), etag, ultima_modificacion
+            )
+        return None
+
+    desde = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    if desde is not None and ultima_modificacion is not None:
+        marca = ultima_modificacion.timestamp()
+        if int(marca) < desde and time.time() - marca > 1:
+            return con_validadores(
+                Response(status=status.HTTP_304_NOT_MODIFIED), etag, ultima_modificacion
+            )
+    return None
+
+
+def con_validadores(response, etag, ultima_modificacion):
+    response["ETag"] = etag
+    if ultima_modificacion is not None:
+        response["Last-Modified"] = http_date(ultima_modificacion.timestamp())
+    # El cliente debe revalidar siempre: la respuesta puede cambiar en cualquier momento
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# ===========================
+# Concurrencia optimista (If-Match / version)
+# ===========================
+def version_esperada(request, pk):
+    """
+    La versión que el cliente cree estar editando: la del ETag en If-Match
+    o el campo 'version' del body. None si no manda ninguna (o If-Match: *).
+    Un ETag de otro recurso devuelve 0, que nunca coincide. Lanza
+    ValueError si el valor no se puede leer.
+    """
+    if_match = request.headers.get("If-Match")
+    if if_match:
+        etags = parse_etags(if_match)
+        if not etags:
+            raise ValueError("Header If-Match mal formado.")
+        if "*" in etags:
+            return None
+        partes = etags[0].removeprefix("W/").strip('"').split("-")
+        if len(partes) < 2 or not partes[1].isdigit():
+            raise ValueError("El ETag de If-Match no es de este servidor.")
+        return int(partes[1]) if partes[0] == str(pk) else 0
+
+    version = request.data.get("version") if hasattr(request.data, "get") else None
+    if version is None:
+        return None
+    try:
+        return int(version)
+    except (TypeError, ValueError):
+        raise ValueError("El campo 'version' debe ser un entero.")
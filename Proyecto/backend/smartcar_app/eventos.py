@@ -0,0 +1,165 @@
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .models import Evento
+
+
+logger = logging.getLogger(__name__)
+
+CAPACIDAD = getattr(settings, "SMARTCAR_EVENTOS_CAPACIDAD", 10000)
+TAMANO_LOTE = getattr(settings, "SMARTCAR_EVENTOS_LOTE", 500)
+INTERVALO = getattr(settings, "SMARTCAR_EVENTOS_INTERVALO", 2.0)
+
+
+class ColaLlena(Exception):
+    """
+    El buffer no tiene espacio para el lote: el cliente debe reintentar más
+    tarde (la vista responde 503 con Retry-After).
+    """
+
+
+class BufferEventos:
+    """
+    Buffer en memoria para los eventos de KPIs.
+
+    Las peticiones sólo encolan (no tocan la base de datos); un hilo de
+    fondo los escribe con bulk_create cuando se juntan 'tamano_lote'
+    eventos o cada 'intervalo' segundos, lo que pase primero. La cola tiene
+    tamaño máximo: si se llena, encolar() rechaza el lote completo en vez
+    de crecer sin límite. Al terminar el proceso se vacía lo pendiente.
+    """
+
+    def __init__(self, capacidad=CAPACIDAD, tamano_lote=TAMANO_LOTE, intervalo=INTERVALO):
+        self.capacidad = capacidad
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self.guardados = 0
+        self.descartados = 0
+
+    # ---------- productor ----------
+    def encolar(self, eventos):
+        """
+        Encola una lista de Evento sin guardar. Todo o nada: lanza ColaLlena
+        si el lote completo no cabe.
+        """
+        self._iniciar()
+        with self._lock:
+            if self._cola.qsize() + len(eventos) > self.capacidad:
+                raise ColaLlena()
+            for evento in eventos:
+                self._cola.put_nowait(evento)
+        if self._cola.qsize() >= self.tamano_lote:
+            self._despertar.set()
+        return len(eventos)
+
+    def pendientes(self):
+        return self._cola.qsize()
+
+    # ---------- consumidor ----------
+    def vaciar(self):
+        """
+        Escribe todo lo que haya en la cola, en lotes de tamano_lote.
+        Se puede llamar a mano (tests, comandos); el hilo de fondo la usa.
+        """
+        total = 0
+        while True:
+            lote = []
+            while len(lote) < self.tamano_lote:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            if not lote:
+                return total
+            total += self._guardar(lote)
+
+    def _guardar(self, lote):
+        # 'recibido' es la hora del INSERT y no la de encolar: un evento que
+        # esperó en la cola no puede quedar antes del watermark de rollup_kpis
+        # que ya avanzó mientras tanto
+        ahora = timezone.now()
+        for evento in lote:
+            evento.recibido = ahora
+        try:
+            with transaction.atomic():
+                Evento.objects.bulk_create(lote, batch_size=self.tamano_lote)
+            guardados = lote
+        except DatabaseError:
+            # Algún evento es inválido (p.ej. usuario borrado): se guardan
+            # uno por uno para no perder el resto del lote.
+            logger.exception("Falló el bulk_create de %s eventos; reintentando uno a uno", len(lote))
+            guardados = []
+            for evento in lote:
+                try:
+                    with transaction.atomic():
+                        evento.save(force_insert=True)
+                    guardados.append(evento)
+                except DatabaseError:
+                    self.descartados += 1
+                    logger.warning("Evento descartado: %s", evento)
+
+        self.guardados += len(guardados)
+        return len(guardados)
+
+    # ---------- hilo de fondo ----------
+    def _iniciar(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(
+                target=self._correr, name="smartcar-eventos", daemon=True
+            )
+            self._hilo.start()
+            atexit.register(self.detener)
+
+    def _correr(self):
+        while not self._detener.is_set():
+            self._despertar.wait(timeout=self.intervalo)
+            self._despertar.clear()
+            self._vaciar_y_cerrar()
+        self._vaciar_y_cerrar()
+
+    def _vaciar_y_cerrar(self):
+        try:
+            self.vaciar()
+        except Exception:
+            logger.exception("Error vaciando el buffer de eventos")
+        finally:
+            # La conexión es de este hilo; no la dejamos abierta entre lotes.
+            connection.close()
+
+    def detener(self, timeout=10):
+        """
+        Pide al hilo que vacíe lo pendiente y termine (se llama en atexit).
+        Si no termina en 'timeout' segundos sigue siendo el consumidor: no se
+        olvida ni se limpia la señal, así encolar() no arranca otro hilo
+        sobre la misma cola mientras éste escribe.
+        """
+        hilo = self._hilo
+        if hilo is None:
+            return
+        self._detener.set()
+        self._despertar.set()
+        hilo.join(timeout)
+        if hilo.is_alive():
+            logger.warning("El hilo de eventos no terminó en %s s", timeout)
+            return
+        with self._lock:
+            self._hilo = None
+            self._detener.clear()
+
+
+buffer_eventos = BufferEventos()
@@ -0,0 +1,202 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Case,
+    Count,
+    DateTimeField,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, NullIf, TruncMonth
+from django.utils import timezone
+
+from .models import Historial, HistorialCategoria, Item, Lista
+
+
+# ===========================
+# Gasto de un item en el historial mensual
+# ===========================
+# Un item cuenta en el mes en que se compró (si está comprado y se sabe
+# cuándo) o en el que se agregó. Si está comprado con precio pagado, cuenta
+# lo pagado; si no, lo planeado (cantidad * precio_unitario).
+
+DECIMAL = DecimalField(max_digits=20, decimal_places=4)
+
+FECHA_HISTORIAL = Case(
+    When(comprado=True, fecha_comprado__isnull=False, then=F("fecha_comprado")),
+    default=F("fecha_agregado"),
+    output_field=DateTimeField(),
+)
+
+GASTO_ITEM = Case(
+    When(
+        comprado=True,
+        precio_pagado__isnull=False,
+        then=ExpressionWrapper(
+            Coalesce("cantidad_comprada", "cantidad") * F("precio_pagado"),
+            output_field=DECIMAL,
+        ),
+    ),
+    default=ExpressionWrapper(F("cantidad") * F("precio_unitario"), output_field=DECIMAL),
+    output_field=DECIMAL,
+)
+
+
+def mes_de(fecha):
+    return timezone.localtime(fecha).strftime("%Y-%m")
+
+
+def aporte_historial(valores):
+    """
+    (mes, categoria, gasto) de un item, con la misma regla que GASTO_ITEM y
+    FECHA_HISTORIAL pero sobre valores ya cargados (ver totales.valores_item).
+    """
+    comprado = valores["comprado"]
+    if comprado and valores["fecha_comprado"] is not None:
+        fecha = valores["fecha_comprado"]
+    else:
+        fecha = valores["fecha_agregado"]
+    if comprado and valores["precio_pagado"] is not None:
+        cantidad = valores["cantidad_comprada"]
+        if cantidad is None:
+            cantidad = valores["cantidad"]
+        gasto = (cantidad or Decimal("0")) * valores["precio_pagado"]
+    else:
+        gasto = (valores["cantidad"] or Decimal("0")) * (valores["precio_unitario"] or Decimal("0"))
+    return mes_de(fecha), valores["categoria"] or "", gasto
+
+
+def usuario_de_lista(lista_id):
+    return Lista.objects.filter(pk=lista_id).values_list("usuario_id", flat=True).first()
+
+
+def aplicar_cambio_historial(anterior=None, nuevo=None):
+    """
+    Mueve el aporte de un item en Historial/HistorialCategoria: resta el
+    'anterior' y suma el 'nuevo' (dicts de valores_item con 'usuario_id';
+    None si el item no existía o ya no existe). Son unos pocos UPDATE por
+    cada mes/categoría tocado, sin leer los demás items. Debe llamarse dentro
+    de la transacción de la escritura del item.
+    """
+    aplicar_cambios_historial([anterior] if anterior else (), [nuevo] if nuevo else ())
+
+
+def aplicar_cambios_historial(anteriores=(), nuevos=()):
+    """
+    Lo mismo para varios items a la vez (lotes, borrar una lista): las
+    diferencias se juntan por (usuario, mes, categoría) y cada grupo tocado
+    es un solo juego de UPDATE, sin importar cuántos items traiga.
+    """
+    cambios = {}
+    for lote, signo in ((anteriores, -1), (nuevos, 1)):
+        for valores in lote:
+            mes, categoria, gasto = aporte_historial(valores)
+            clave = (valores["usuario_id"], mes, categoria)
+            total, n = cambios.get(clave, (Decimal("0"), 0))
+            cambios[clave] = (total + signo * gasto, n + signo)
+
+    for (usuario_id, mes, categoria), (gasto, n) in cambios.items():
+        if gasto or n:
+            _sumar_en_historial(usuario_id, mes, categoria, gasto, n)
+
+
+def _sumar_en_historial(usuario_id, mes, categoria, gasto, n):
+    historial_id = Historial.objects.get_or_create(usuario_id=usuario_id, mes=mes)[0].pk
+
+    filtro_categoria = {"historial_id": historial_id, "categoria": categoria}
+    suma_categoria = {"total": F("total") + gasto, "numero_items": F("numero_items") + n}
+    if not HistorialCategoria.objects.filter(**filtro_categoria).update(**suma_categoria):
+        try:
+            with transaction.atomic():
+                HistorialCategoria.objects.create(total=gasto, numero_items=n, **filtro_categoria)
+        except IntegrityError:
+            HistorialCategoria.objects.filter(**filtro_categoria).update(**suma_categoria)
+
+    # En el SET, F("total") es el valor anterior a este UPDATE
+    categorias = (
+        HistorialCategoria.objects.filter(historial_id=OuterRef("pk"), numero_items__gt=0)
+        .order_by()
+        .values("historial_id")
+        .annotate(c=Count("id"))
+        .values("c")
+    )
+    Historial.objects.filter(pk=historial_id).update(
+        total=F("total") + gasto,
+        numero_items=F("numero_items") + n,
+        promedio_por_categoria=ExpressionWrapper(
+            (F("total") + gasto) / NullIf(Subquery(categorias), 0),
+            output_field=DECIMAL,
+        ),
+    )
+
+
+# ===========================
+# Reconstrucción en bloque
+# ===========================
+def reconstruir_historial(usuario_ids=None):
+    """
+    Rehace Historial y HistorialCategoria desde los items con un solo query
+    agregado (GROUP BY usuario, mes, categoría) y bulk_create. Si se pasan
+    usuario_ids, sólo para esos usuarios. Devuelve cuántos meses quedaron.
+
+    Compra no entra en la suma: lo pagado ya está en el item (precio_pagado,
+    cantidad_comprada, fecha_comprado), que es lo que escribe la API, y las
+    filas de Compra son el detalle de esas mismas compras por tienda. Sumar
+    las dos contaría cada compra dos veces; Compra se agrega aparte en
+    analitica.gasto_por_tienda.
+    """
+    items = Item.objects.all()
+    if usuario_ids is not None:
+        items = items.filter(lista__usuario_id__in=usuario_ids)
+
+    filas = (
+        items.annotate(
+            mes_fecha=TruncMonth(FECHA_HISTORIAL),
+            cat=Coalesce("categoria", Value("")),
+        )
+        .order_by()
+        .values("lista__usuario_id", "mes_fecha", "cat")
+        .annotate(total=Sum(GASTO_ITEM), n=Count("id"))
+    )
+
+    meses = {}
+    for fila in filas:
+        clave = (fila["lista__usuario_id"], mes_de(fila["mes_fecha"]))
+        meses.setdefault(clave, []).append((fila["cat"], fila["total"] or Decimal("0"), fila["n"]))
+
+    with transaction.atomic():
+        existentes = Historial.objects.all()
+        if usuario_ids is not None:
+            existentes = existentes.filter(usuario_id__in=usuario_ids)
+        existentes.delete()
+
+        historiales = []
+        for (usuario_id, mes), categorias in meses.items():
+            total = sum(c[1] for c in categorias)
+            historiales.append(
+                Historial(
+                    usuario_id=usuario_id,
+                    mes=mes,
+                    total=total,
+                    numero_items=sum(c[2] for c in categorias),
+                    promedio_por_categoria=total / len(categorias),
+                )
+            )
+        Historial.objects.bulk_create(historiales, batch_size=500)
+
+        desglose = []
+        for historial in historiales:
+            for categoria, total, n in meses[(historial.usuario_id, historial.mes)]:
+                desglose.append(
+                    HistorialCategoria(historial=historial, categoria=categoria, total=total, numero_items=n)
+                )
+        HistorialCategoria.objects.bulk_create(desglose, batch_size=500)
+
+    return len(historiales)
@@ -0,0 +1,153 @@
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+from .models import Evento, KpiDiario, KpiMensualUsuario, KpiWatermark
+
+
+WATERMARK_EVENTOS = "eventos"
+
+
+# El watermark avanza por (recibido, id), el orden en que llegaron los
+# eventos, y no por ts: ts lo manda el cliente y puede ser anterior a lo ya
+# agregado (eventos guardados offline). Los rollups sí se agrupan por ts.
+
+def eventos_despues_de(watermark):
+    """
+    Eventos recibidos después de (watermark.ts, watermark.evento_id), en ese
+    orden.
+    """
+    qs = Evento.objects.all()
+    if watermark.ts is not None:
+        qs = qs.filter(recibido__gte=watermark.ts).filter(
+            Q(recibido__gt=watermark.ts) | Q(id__gt=watermark.evento_id)
+        )
+    return qs.order_by("recibido", "id")
+
+
+def eventos_hasta(watermark):
+    """
+    Eventos ya agregados: recibidos hasta (watermark.ts, watermark.evento_id).
+    """
+    if watermark.ts is None:
+        return Evento.objects.none()
+    return Evento.objects.filter(recibido__lte=watermark.ts).filter(
+        Q(recibido__lt=watermark.ts) | Q(id__lte=watermark.evento_id)
+    )
+
+
+def siguiente_corte(watermark, hasta, tamano):
+    """
+    (recibido, id) del último evento de la siguiente ventana: como mucho
+    'tamano' eventos y ninguno recibido desde 'hasta'. None si no hay nada
+    nuevo.
+    """
+    qs = eventos_despues_de(watermark).filter(recibido__lt=hasta)
+    ultimo = qs.values_list("recibido", "id")[tamano - 1:tamano].first()
+    if ultimo is None:
+        ultimo = qs.order_by("-recibido", "-id").values_list("recibido", "id").first()
+    return ultimo
+
+
+def acumular_ventana(watermark, corte):
+    """
+    Suma a los rollups los eventos entre el watermark y 'corte' (incluido) y
+    mueve el watermark, todo en una transacción: si se corta a la mitad, la
+    siguiente corrida retoma desde el mismo punto.
+
+    Se lee un solo query agregado por (usuario, día, tipo). Un día es activo
+    nuevo si es posterior a KpiMensualUsuario.ultimo_dia; si es anterior
+    (evento atrasado) se pregunta si ese día ya tenía eventos agregados.
+    """
+    corte_ts, corte_id = corte
+    filas = (
+        eventos_despues_de(watermark)
+        .filter(recibido__lte=corte_ts)
+        .filter(Q(recibido__lt=corte_ts) | Q(id__lte=corte_id))
+        .annotate(dia=TruncDate("ts"))
+        .order_by()
+        .values("usuario_id", "dia", "tipo")
+        .annotate(n=Count("id"))
+        .order_by("dia", "usuario_id", "tipo")
+    )
+    filas = list(filas)
+
+    with transaction.atomic():
+        claves_mes = {(f["usuario_id"], f["dia"].strftime("%Y-%m"), f["tipo"]) for f in filas}
+        claves_dia = {(f["dia"], f["tipo"]) for f in filas}
+
+        mensuales = {}
+        if claves_mes:
+            qs = KpiMensualUsuario.objects.select_for_update().filter(
+                usuario_id__in={c[0] for c in claves_mes},
+                mes__in={c[1] for c in claves_mes},
+                tipo__in={c[2] for c in claves_mes},
+            )
+            for kpi in qs:
+                if (kpi.usuario_id, kpi.mes, kpi.tipo) in claves_mes:
+                    mensuales[(kpi.usuario_id, kpi.mes, kpi.tipo)] = kpi
+        diarios = {}
+        if claves_dia:
+            qs = KpiDiario.objects.select_for_update().filter(
+                dia__in={c[0] for c in claves_dia},
+                tipo__in={c[1] for c in claves_dia},
+            )
+            for kpi in qs:
+                if (kpi.dia, kpi.tipo) in claves_dia:
+                    diarios[(kpi.dia, kpi.tipo)] = kpi
+
+        nuevos_mes, nuevos_dia = {}, {}
+        for fila in filas:
+            dia, tipo = fila["dia"], fila["tipo"]
+            clave_mes = (fila["usuario_id"], dia.strftime("%Y-%m"), tipo)
+            mensual = mensuales.get(clave_mes)
+            if mensual is None:
+                mensual = mensuales[clave_mes] = nuevos_mes[clave_mes] = KpiMensualUsuario(
+                    usuario_id=clave_mes[0], mes=clave_mes[1], tipo=tipo
+                )
+            diario = diarios.get((dia, tipo))
+            if diario is None:
+                diario = diarios[(dia, tipo)] = nuevos_dia[(dia, tipo)] = KpiDiario(
+                    dia=dia, tipo=tipo
+                )
+
+            mensual.total_eventos += fila["n"]
+            diario.total_eventos += fila["n"]
+            if mensual.ultimo_dia is None or dia > mensual.ultimo_dia:
+                mensual.ultimo_dia = dia
+                dia_nuevo = True
+            elif dia == mensual.ultimo_dia:
+                dia_nuevo = False
+            else:
+                dia_nuevo = not eventos_hasta(watermark).filter(
+                    usuario_id=fila["usuario_id"], tipo=tipo, ts__date=dia
+                ).exists()
+            if dia_nuevo:
+                mensual.dias_activos += 1
+                diario.usuarios_activos += 1
+
+        existentes_mes = [k for c, k in mensuales.items() if c not in nuevos_mes]
+        existentes_dia = [k for c, k in diarios.items() if c not in nuevos_dia]
+        KpiMensualUsuario.objects.bulk_create(nuevos_mes.values())
+        KpiDiario.objects.bulk_create(nuevos_dia.values())
+        KpiMensualUsuario.objects.bulk_update(
+            existentes_mes, ["total_eventos", "dias_activos", "ultimo_dia"]
+        )
+        KpiDiario.objects.bulk_update(existentes_dia, ["total_eventos", "usuarios_activos"])
+
+        watermark.ts, watermark.evento_id = corte_ts, corte_id
+        watermark.save()
+
+    return sum(f["n"] for f in filas)
+
+
+def obtener_watermark():
+    watermark, _ = KpiWatermark.objects.get_or_create(nombre=WATERMARK_EVENTOS)
+    return watermark
+
+
+def reiniciar_rollups():
+    with transaction.atomic():
+        KpiDiario.objects.all().delete()
+        KpiMensualUsuario.objects.all().delete()
+        KpiWatermark.objects.filter(nombre=WATERMARK_EVENTOS).delete()
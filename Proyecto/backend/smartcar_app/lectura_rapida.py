@@ -0,0 +1,84 @@
+from rest_framework import serializers
+
+from .serializers import ItemConPreciosSerializer, ItemSerializer, ListaSerializer
+from .totales import SUBTOTAL_ITEM
+
+
+# ===========================
+# Lectura rápida para listados (sólo GET)
+# ===========================
+# Mismo resultado que serializer_class(qs, many=True).data, pero leyendo
+# con .values() (sin instanciar modelos) y recorriendo un mapeo de campos
+# armado una sola vez a partir de los campos del propio serializer. Los
+# campos calculados en Python (SerializerMethodField) se reemplazan por
+# una anotación SQL equivalente.
+
+# Campos cuyo valor de la base ya es su representación (str, int, bool, pk)
+_SIN_CONVERSION = (
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+class LecturaRapida:
+    def __init__(self, serializer_class, anotaciones=None):
+        self.serializer_class = serializer_class
+        self.anotaciones = anotaciones or {}
+        self._mapeo = None
+
+    @property
+    def mapeo(self):
+        """
+        [(clave, columna de .values(), conversión o None)] en el orden de los
+        campos del serializer. Se arma la primera vez que se usa.
+        """
+        if self._mapeo is None:
+            mapeo = []
+            for nombre, campo in self.serializer_class().fields.items():
+                if campo.write_only:
+                    continue
+                if nombre in self.anotaciones:
+                    mapeo.append((nombre, nombre, None))
+                elif isinstance(campo, serializers.SerializerMethodField):
+                    raise ValueError(
+                        f"'{nombre}' es un SerializerMethodField sin anotación SQL equivalente."
+                    )
+                else:
+                    # 'mejor_precio.precio' -> 'mejor_precio__precio' (LEFT JOIN)
+                    columna = campo.source.replace(".", "__")
+                    convertir = campo.to_representation
+                    if isinstance(campo, _SIN_CONVERSION):
+                        convertir = None
+                    mapeo.append((nombre, columna, convertir))
+            self._mapeo = mapeo
+        return self._mapeo
+
+    def consulta(self, qs):
+        """
+        El queryset como .values() con sólo las columnas que se devuelven.
+        """
+        columnas = [columna for _, columna, _ in self.mapeo]
+        return qs.annotate(**self.anotaciones).values(*columnas)
+
+    def representar(self, filas):
+        mapeo = self.mapeo
+        datos = []
+        for fila in filas:
+            dato = {}
+            for clave, columna, convertir in mapeo:
+                valor = fila[columna]
+                if convertir is not None and valor is not None:
+                    valor = convertir(valor)
+                dato[clave] = valor
+            datos.append(dato)
+        return datos
+
+
+LECTURA_ITEMS = LecturaRapida(ItemSerializer, anotaciones={"subtotal": SUBTOTAL_ITEM})
+LECTURA_ITEMS_PRECIOS = LecturaRapida(
+    ItemConPreciosSerializer, anotaciones={"subtotal": SUBTOTAL_ITEM}
+)
+LECTURA_LISTAS = LecturaRapida(ListaSerializer)
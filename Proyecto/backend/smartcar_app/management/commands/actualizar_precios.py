@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from smartcar_app.models import Item
+from smartcar_app.precios import actualizar_precios, circuito_de, fuentes_configuradas
+
+
+class Command(BaseCommand):
+    help = (
+        "Consulta los precios online de los items (todas las fuentes a la vez, "
+        "con cache por nombre y fuente) y los guarda en PrecioOnline. Sin "
+        "argumentos recorre todos los items vigentes, por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lista", type=int, action="append", help="Id de lista (repetible).")
+        parser.add_argument("--usuario", type=int, help="Sólo las listas de este usuario.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Items por lote (default 500).",
+        )
+
+    def handle(self, *args, **options):
+        qs = Item.objects.all()
+        if options["lista"]:
+            qs = qs.filter(lista_id__in=options["lista"])
+        if options["usuario"]:
+            qs = qs.filter(lista__usuario_id=options["usuario"])
+
+        total = 0
+        ultimo_id = 0
+        while True:
+            ids = list(
+                qs.filter(pk__gt=ultimo_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[: options["batch_size"]]
+            )
+            if not ids:
+                break
+            ultimo_id = ids[-1]
+            total += len(actualizar_precios(Item.objects.filter(pk__in=ids)))
+            self.stdout.write(f"{total} precios guardados")
+
+        for fuente in fuentes_configuradas():
+            if circuito_de(fuente).abierto:
+                self.stdout.write(self.style.WARNING(f"Fuente '{fuente.nombre}' con circuito abierto."))
+        self.stdout.write(self.style.SUCCESS(f"{total} precios guardados en PrecioOnline."))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from smartcar_app.anomalias import LOTE, actualizar_referencias, reconstruir_referencias
+
+
+class Command(BaseCommand):
+    help = (
+        "Suma las compras y precios online nuevos (después del watermark de "
+        "cada tabla) a los precios de referencia por nombre (mediana y MAD) "
+        "con los que se marcan los precios atípicos de los items."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=LOTE,
+            help=f"Filas de cada tabla por transacción (default {LOTE}).",
+        )
+        parser.add_argument(
+            "--reconstruir",
+            action="store_true",
+            help="Borra las referencias y los watermarks y las calcula desde cero.",
+        )
+
+    def handle(self, *args, **options):
+        if options["reconstruir"]:
+            filas, nombres = reconstruir_referencias(options["lote"])
+        else:
+            filas, nombres = actualizar_referencias(options["lote"])
+        self.stdout.write(
+            self.style.SUCCESS(f"{filas} precios leídos, {nombres} referencias actualizadas.")
+        )
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from smartcar_app.push import despachar_pendientes
+
+
+class Command(BaseCommand):
+    help = (
+        "Envía las notificaciones push pendientes: las agrupa por plataforma en "
+        "lotes del tamaño de cada proveedor, las envía en paralelo y reintenta "
+        "con backoff las que fallan. Con --continuo queda corriendo como worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Notificaciones que se reservan por pasada (default 1000).",
+        )
+        parser.add_argument(
+            "--continuo",
+            action="store_true",
+            help="No termina: repite las pasadas, esperando --intervalo cuando no hay nada.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=2.0,
+            help="Segundos de espera cuando la cola está vacía (default 2).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            conteo = despachar_pendientes(options["batch_size"])
+            if conteo:
+                resumen = ", ".join(f"{estado}: {n}" for estado, n in sorted(conteo.items()))
+                self.stdout.write(resumen)
+            if not options["continuo"]:
+                break
+            if sum(conteo.values()) < options["batch_size"]:
+                time.sleep(options["intervalo"])
+
+        self.stdout.write(self.style.SUCCESS("Cola de push procesada."))
@@ -0,0 +1,117 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from smartcar_app.lectura_rapida import LECTURA_ITEMS_PRECIOS
+from smartcar_app.models import Alerta, Evento, Historial, Item, Lista, PrecioOnline
+from smartcar_app.paginacion import codificar_cursor, filtrar_desde_cursor
+
+
+def consultas_calientes():
+    """
+    Los querysets que ejecutan los endpoints más usados, con los mismos
+    filtros y orden que en views.py. Los ids no importan: EXPLAIN sólo mira
+    el plan.
+    """
+    cursor = codificar_cursor(timezone.now(), 1)
+    return [
+        ("GET /api/listas/", Lista.objects.filter(usuario_id=1).order_by("-fecha_creacion")),
+        (
+            "GET /api/listas/ (cursor)",
+            filtrar_desde_cursor(Lista.objects.filter(usuario_id=1), "fecha_creacion", cursor),
+        ),
+        (
+            "GET /api/items/ (cursor)",
+            filtrar_desde_cursor(
+                Item.objects.filter(lista_id=1), "fecha_agregado", cursor, descendente=False
+            ),
+        ),
+        (
+            "GET /api/items/?precios=1",
+            LECTURA_ITEMS_PRECIOS.consulta(
+                Item.objects.filter(lista_id=1).order_by("fecha_agregado", "id")
+            ),
+        ),
+        ("Items vivos de una lista", Item.objects.filter(lista_id=1, deleted_at__isnull=True)),
+        (
+            "GET /api/sync/ (listas cambiadas)",
+            Lista.todos.filter(usuario_id=1, updated_at__gt=timezone.now()),
+        ),
+        (
+            "GET /api/sync/ (items cambiados)",
+            Item.todos.filter(lista_id__in=[1, 2], updated_at__gt=timezone.now()),
+        ),
+        (
+            "purgar_borrados (items)",
+            Item.todos.filter(deleted_at__lt=timezone.now()).order_by("deleted_at", "id"),
+        ),
+        (
+            "GET /api/historial/<id>/ (cursor)",
+            filtrar_desde_cursor(
+                Historial.objects.filter(usuario_id=1), "mes", codificar_cursor("2025-10", 1)
+            ),
+        ),
+        ("Eventos de un usuario", Evento.objects.filter(usuario_id=1).order_by("-ts")),
+        ("Alertas de una lista", Alerta.objects.filter(lista_id=1).order_by("-fecha_hora")),
+        (
+            "Precios online de un item",
+            PrecioOnline.objects.filter(item_id=1).order_by("-fecha_consulta"),
+        ),
+    ]
+
+
+def problemas_del_plan(plan):
+    """
+    En un plan de SQLite (EXPLAIN QUERY PLAN) una lectura con índice sale
+    como 'SEARCH ... USING INDEX'. 'SCAN <tabla>' es un recorrido completo y
+    'USE TEMP B-TREE FOR ORDER BY' es un sort aparte.
+    """
+    problemas = []
+    for linea in plan.splitlines():
+        linea = linea.strip()
+        if "SCAN" in linea and "USING" not in linea:
+            problemas.append(linea)
+        if "TEMP B-TREE" in linea:
+            problemas.append(linea)
+    return problemas
+
+
+class Command(BaseCommand):
+    help = (
+        "Corre EXPLAIN sobre las consultas de los endpoints calientes y falla "
+        "si alguna hace un recorrido de tabla o un sort en vez de usar un índice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verbose-plan",
+            action="store_true",
+            help="Imprime el plan completo de cada consulta.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            self.stdout.write(
+                self.style.WARNING(
+                    f"El chequeo sólo sabe leer planes de SQLite (motor actual: {connection.vendor}); "
+                    "se imprimen los planes sin validarlos."
+                )
+            )
+
+        fallidas = []
+        for nombre, qs in consultas_calientes():
+            plan = qs.explain()
+            if options["verbose_plan"] or connection.vendor != "sqlite":
+                self.stdout.write(f"{nombre}:\n{plan}\n")
+            if connection.vendor != "sqlite":
+                continue
+
+            problemas = problemas_del_plan(plan)
+            if problemas:
+                fallidas.append(nombre)
+                self.stdout.write(self.style.ERROR(f"[X] {nombre}: {'; '.join(problemas)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"[OK] {nombre}"))
+
+        if fallidas:
+            raise CommandError(f"{len(fallidas)} consultas sin índice: {', '.join(fallidas)}")
@@ -0,0 +1,254 @@
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import groupby
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from smartcar_app.columnar import (
+    NumpyNoDisponible,
+    Snapshot,
+    exportar_snapshot,
+    gasto_por_categoria,
+    gasto_por_mes,
+    gasto_por_tienda,
+    percentiles_precio_por_categoria,
+    requiere_numpy,
+)
+from smartcar_app.gastos import DECIMAL, FECHA_HISTORIAL, GASTO_ITEM, mes_de
+from smartcar_app.models import Compra, Item, Lista, Usuario
+
+CATEGORIAS = [
+    None, "Lácteos", "Aseo", "Frutas", "Verduras", "Carnes", "Granos",
+    "Bebidas", "Panadería", "Mascotas", "Hogar", "Congelados", "Snacks",
+]
+TIENDAS = [None, "Éxito", "Jumbo", "D1", "Ara", "Olímpica", "Carulla", "Makro", "Plaza"]
+PERCENTILES = (50, 90, 99)
+
+
+def _centavos(valor):
+    # SQLite suma los decimales en punto flotante: se redondea, no se trunca
+    return int(((valor or Decimal("0")) * 100).quantize(Decimal("1")))
+
+
+def _percentil(ordenados, p):
+    posicion = (len(ordenados) - 1) * p / 100
+    abajo = int(posicion)
+    arriba = min(abajo + 1, len(ordenados) - 1)
+    fraccion = posicion - abajo
+    return ordenados[abajo] * (1 - fraccion) + ordenados[arriba] * fraccion
+
+
+# ===========================
+# Consultas equivalentes con el ORM
+# ===========================
+def orm_gasto_por_categoria():
+    filas = (
+        Item.objects.filter(lista__deleted_at__isnull=True)
+        .order_by()
+        .values("categoria")
+        .annotate(total=Sum(GASTO_ITEM), n=Count("id"))
+    )
+    return sorted(
+        ((f["categoria"] or None, _centavos(f["total"]), f["n"]) for f in filas),
+        key=lambda f: -f[1],
+    )
+
+
+def orm_gasto_por_mes():
+    filas = (
+        Item.objects.filter(lista__deleted_at__isnull=True)
+        .annotate(mes_fecha=TruncMonth(FECHA_HISTORIAL))
+        .order_by()
+        .values("mes_fecha")
+        .annotate(total=Sum(GASTO_ITEM), n=Count("id"))
+    )
+    return sorted(
+        (int(mes_de(f["mes_fecha"]).replace("-", "")), _centavos(f["total"]), f["n"])
+        for f in filas
+    )
+
+
+def orm_gasto_por_tienda():
+    filas = (
+        Compra.objects.filter(item__deleted_at__isnull=True, item__lista__deleted_at__isnull=True)
+        .order_by()
+        .values("tienda")
+        .annotate(
+            total=Sum(
+                ExpressionWrapper(F("cantidad") * F("precio_unitario"), output_field=DECIMAL)
+            ),
+            n=Count("id"),
+        )
+    )
+    return sorted(
+        ((f["tienda"] or None, _centavos(f["total"]), f["n"]) for f in filas),
+        key=lambda f: -f[1],
+    )
+
+
+def orm_percentiles_precio_por_categoria():
+    # SQLite no tiene percentiles: hay que traer los precios ordenados
+    filas = (
+        Item.objects.filter(lista__deleted_at__isnull=True)
+        .annotate(cat=Coalesce("categoria", Value("")))
+        .order_by("cat", "precio_unitario")
+        .values_list("cat", "precio_unitario")
+        .iterator(chunk_size=50_000)
+    )
+    resultado = {}
+    for categoria, grupo in groupby(filas, key=lambda f: f[0]):
+        precios = [float(_centavos(precio)) for _, precio in grupo]
+        resultado[categoria or None] = [_percentil(precios, p) for p in PERCENTILES]
+    return resultado
+
+
+def _iguales(a, b):
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(
+            all(abs(x - y) < 0.5 for x, y in zip(a[k], b[k])) for k in a
+        )
+    return sorted(a, key=str) == sorted(b, key=str)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de los reportes entre usuarios: consultas del ORM sobre "
+        "SQLite contra el snapshot columnar, sobre datos sintéticos en una "
+        "base de prueba aparte (no toca la base real)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--filas", type=int, default=5_000_000, help="Items sintéticos (default 5.000.000)."
+        )
+        parser.add_argument(
+            "--repeticiones", type=int, default=3, help="Corridas por medición (default 3)."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            requiere_numpy()
+        except NumpyNoDisponible as e:
+            raise CommandError(str(e))
+        if connection.vendor != "sqlite":
+            raise CommandError("El benchmark está pensado para SQLite.")
+
+        carpeta = tempfile.mkdtemp(prefix="smartcar-columnar-")
+        # Base de prueba en un archivo (no en memoria) para que se parezca a la real
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = f"{carpeta}/bench.sqlite3"
+        nombre_original = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.generar(options["filas"])
+            self.medir(carpeta, options["repeticiones"])
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+    def generar(self, filas):
+        inicio = time.perf_counter()
+        aleatorio = random.Random(42)
+        ahora = timezone.now()
+        n_usuarios = max(filas // 1000, 1)
+        n_listas = max(filas // 100, 1)
+
+        Usuario.objects.bulk_create(
+            [
+                Usuario(nombre=f"u{i}", correo=f"u{i}@bench.test", contrasena="x")
+                for i in range(n_usuarios)
+            ],
+            batch_size=5000,
+        )
+        usuarios = list(Usuario.objects.values_list("id", flat=True))
+        for desde in range(0, n_listas, 20_000):
+            Lista.objects.bulk_create(
+                [
+                    Lista(usuario_id=usuarios[i % n_usuarios], nombre=f"l{i}")
+                    for i in range(desde, min(desde + 20_000, n_listas))
+                ]
+            )
+        listas = list(Lista.objects.values_list("id", flat=True))
+
+        for desde in range(0, filas, 20_000):
+            items = []
+            for i in range(desde, min(desde + 20_000, filas)):
+                comprado = i % 3 == 0
+                precio = Decimal(aleatorio.randint(50, 5_000_00)) / 100
+                items.append(
+                    Item(
+                        lista_id=listas[i % n_listas],
+                        nombre=f"p{i}",
+                        categoria=CATEGORIAS[aleatorio.randrange(len(CATEGORIAS))],
+                        cantidad=Decimal(aleatorio.randint(1, 6)),
+                        precio_unitario=precio,
+                        prioridad="AMB"[i % 3],
+                        comprado=comprado,
+                        fecha_comprado=(
+                            ahora - timedelta(days=aleatorio.randrange(365)) if comprado else None
+                        ),
+                        precio_pagado=precio + aleatorio.randint(-100, 100) if comprado else None,
+                    )
+                )
+            Item.objects.bulk_create(items)
+            self.stdout.write(f"\ritems: {desde + len(items)}/{filas}", ending="")
+        self.stdout.write("")
+
+        primero = Item.objects.order_by("id").values_list("id", flat=True).first()
+        for desde in range(0, filas // 5, 20_000):
+            Compra.objects.bulk_create(
+                [
+                    Compra(
+                        item_id=primero + i * 5,
+                        cantidad=Decimal(aleatorio.randint(1, 6)),
+                        precio_unitario=Decimal(aleatorio.randint(50, 5_000_00)) / 100,
+                        tienda=TIENDAS[aleatorio.randrange(len(TIENDAS))],
+                    )
+                    for i in range(desde, min(desde + 20_000, filas // 5))
+                ]
+            )
+        self.stdout.write(
+            f"Datos: {n_usuarios} usuarios, {n_listas} listas, {filas} items, "
+            f"{filas // 5} compras ({time.perf_counter() - inicio:.1f} s)."
+        )
+
+    def medir(self, carpeta, repeticiones):
+        inicio = time.perf_counter()
+        ruta = exportar_snapshot(f"{carpeta}/snapshots")
+        self.stdout.write(f"Exportación del snapshot: {time.perf_counter() - inicio:.1f} s")
+
+        casos = [
+            ("gasto por categoría", orm_gasto_por_categoria, gasto_por_categoria),
+            ("gasto por mes", orm_gasto_por_mes, gasto_por_mes),
+            ("gasto por tienda", orm_gasto_por_tienda, gasto_por_tienda),
+            (
+                "p50/p90/p99 precio por categoría",
+                orm_percentiles_precio_por_categoria,
+                lambda s: percentiles_precio_por_categoria(s, PERCENTILES),
+            ),
+        ]
+        self.stdout.write(f"{'consulta':<34}{'ORM ms':>12}{'columnar ms':>14}{'x':>8}  igual")
+        for nombre, orm, columnar in casos:
+            t_orm, esperado = self.cronometrar(orm, repeticiones)
+            # Cada corrida abre el snapshot de nuevo: el costo del mmap entra en la medición
+            t_col, obtenido = self.cronometrar(lambda: columnar(Snapshot(ruta)), repeticiones)
+            self.stdout.write(
+                f"{nombre:<34}{t_orm:>12.1f}{t_col:>14.1f}{t_orm / t_col:>8.1f}  "
+                f"{'sí' if _iguales(esperado, obtenido) else 'NO'}"
+            )
+
+    def cronometrar(self, funcion, repeticiones):
+        mejor, resultado = None, None
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            duracion = (time.perf_counter() - inicio) * 1000
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        return mejor, resultado
@@ -0,0 +1,86 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from smartcar_app.compresion import brotli, comprimir
+from smartcar_app.models import Item
+from smartcar_app.renderizado import orjson, volcar_json, volcar_json_drf
+from smartcar_app.serializers import ItemSerializer
+
+
+def items_de_prueba(cantidad):
+    """
+    Items en memoria (sin base de datos) con valores parecidos a los reales.
+    """
+    ahora = timezone.now()
+    return [
+        Item(
+            id=i + 1,
+            lista_id=1,
+            nombre=f"Producto {i} ñandú",
+            categoria=("Lácteos", "Aseo", "Frutas", None)[i % 4],
+            cantidad=Decimal(i % 7 + 1),
+            unidad="und",
+            precio_unitario=Decimal("1234.50") + i,
+            prioridad="AMB"[i % 3],
+            nota="Comprar en la tienda de la esquina" if i % 5 == 0 else None,
+            comprado=i % 3 == 0,
+            fecha_agregado=ahora - timedelta(minutes=i),
+            fecha_comprado=ahora if i % 3 == 0 else None,
+            cantidad_comprada=Decimal("1.00") if i % 3 == 0 else None,
+            precio_pagado=Decimal("1200.00") if i % 3 == 0 else None,
+        )
+        for i in range(cantidad)
+    ]
+
+
+def medir(funcion, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el renderer JSON de DRF con RenderizadorJSON (orjson y "
+        "librería estándar) y el tamaño con gzip/brotli, sobre una lista de items."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=1000, help="Items en la lista (default 1000).")
+        parser.add_argument("--repeticiones", type=int, default=50, help="Corridas por medición (default 50).")
+
+    def handle(self, *args, **options):
+        items = items_de_prueba(options["items"])
+        repeticiones = options["repeticiones"]
+
+        ms, data = medir(lambda: {"items": ItemSerializer(items, many=True).data}, max(1, repeticiones // 10))
+        self.stdout.write(f"ItemSerializer (many=True), {len(items)} items: {ms:.2f} ms")
+
+        referencia = volcar_json_drf(data)
+        renderers = [("JSONRenderer de DRF", lambda: volcar_json_drf(data))]
+        if orjson is not None:
+            renderers.append(("RenderizadorJSON (orjson)", lambda: volcar_json(data)))
+        else:
+            self.stdout.write(self.style.WARNING("orjson no está instalado."))
+        renderers.append(
+            ("RenderizadorJSON (librería estándar)", lambda: volcar_json(data, usar_orjson=False))
+        )
+
+        for nombre, funcion in renderers:
+            ms, salida = medir(funcion, repeticiones)
+            igual = "idéntico" if salida == referencia else "DISTINTO"
+            self.stdout.write(f"{nombre}: {ms:.3f} ms, {len(salida)} bytes ({igual} a DRF)")
+
+        self.stdout.write(f"Sin comprimir: {len(referencia)} bytes")
+        ms, salida = medir(lambda: comprimir(referencia, "gzip"), repeticiones)
+        self.stdout.write(f"gzip: {len(salida)} bytes en {ms:.3f} ms")
+        if brotli is not None:
+            ms, salida = medir(lambda: comprimir(referencia, "br"), repeticiones)
+            self.stdout.write(f"brotli: {len(salida)} bytes en {ms:.3f} ms")
+        else:
+            self.stdout.write(self.style.WARNING("brotli no está instalado."))
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from smartcar_app.purga import (
+    MODELOS_PURGABLES,
+    RETENCION_DIAS,
+    TAMANO_LOTE,
+    limite_retencion,
+    pendientes_de_purga,
+    purgar_lote,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra definitivamente las listas e items borrados lógicamente hace más "
+        "de --dias días, en lotes acotados (una transacción por lote) y con una "
+        "pausa entre lotes para no acaparar la base de datos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=RETENCION_DIAS,
+            help=f"Retención de los tombstones en días (default {RETENCION_DIAS}).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=TAMANO_LOTE,
+            help=f"Filas por lote (default {TAMANO_LOTE}).",
+        )
+        parser.add_argument(
+            "--pausa",
+            type=float,
+            default=0.2,
+            help="Segundos de espera entre lotes (default 0.2).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Sólo cuenta lo que se purgaría.",
+        )
+
+    def handle(self, *args, **options):
+        limite = limite_retencion(options["dias"])
+        self.stdout.write(f"Purgando lo borrado antes de {limite:%Y-%m-%d %H:%M}.")
+
+        total = 0
+        for modelo in MODELOS_PURGABLES:
+            nombre = modelo._meta.verbose_name_plural
+            pendientes = pendientes_de_purga(modelo, limite)
+            if options["dry_run"]:
+                self.stdout.write(f"{nombre}: {pendientes} por purgar")
+                total += pendientes
+                continue
+
+            purgadas = 0
+            while True:
+                borradas = purgar_lote(modelo, limite, options["batch_size"])
+                if not borradas:
+                    break
+                purgadas += borradas
+                self.stdout.write(f"{nombre}: {purgadas}/{pendientes}")
+                if options["pausa"]:
+                    time.sleep(options["pausa"])
+            total += purgadas
+
+        accion = "por purgar" if options["dry_run"] else "purgadas"
+        self.stdout.write(self.style.SUCCESS(f"{total} filas {accion}."))
@@ -0,0 +1,105 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from smartcar_app.models import Lista
+from smartcar_app.totales import AGREGADOS_LISTA, CAMPOS_CONTADOR, agregado_real_subquery
+
+
+CENTAVO = Decimal("0.01")
+
+
+def _normalizar(campo, valor):
+    if campo in CAMPOS_CONTADOR:
+        return int(valor or 0)
+    return Decimal(valor or 0).quantize(CENTAVO)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara los agregados guardados en cada Lista (total_calculado, "
+        "numero_items, items_comprados, total_pendiente) con los valores "
+        "reales de sus items (un solo query agregado) y repara en bloque "
+        "los que se hayan desviado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lista",
+            type=int,
+            action="append",
+            dest="listas",
+            help="Id de lista a revisar (se puede repetir). Por defecto, todas.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Listas por cada UPDATE en bloque (default 500).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Solo reporta las diferencias, no escribe nada.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+
+        qs = Lista.objects.all()
+        if options["listas"]:
+            qs = qs.filter(pk__in=options["listas"])
+
+        campos = list(AGREGADOS_LISTA)
+        reales = {f"real_{campo}": agregado_real_subquery(campo) for campo in campos}
+        filas = (
+            qs.annotate(**reales)
+            .values("id", "resumen_al_dia", *campos, *reales)
+            .order_by("id")
+            .iterator(chunk_size=batch_size)
+        )
+
+        # Primero se leen todas las diferencias y luego se escribe, para no
+        # mezclar el cursor de lectura con los UPDATE en SQLite.
+        revisadas = 0
+        pendientes = []
+        for fila in filas:
+            revisadas += 1
+            lista = Lista(pk=fila["id"], resumen_al_dia=True)
+            diferencias = []
+            for campo in campos:
+                guardado = _normalizar(campo, fila[campo])
+                real = _normalizar(campo, fila[f"real_{campo}"])
+                setattr(lista, campo, real)
+                if guardado != real:
+                    diferencias.append(f"{campo}: {guardado} -> {real}")
+            if diferencias or not fila["resumen_al_dia"]:
+                self.stdout.write(f"Lista {fila['id']}: " + (", ".join(diferencias) or "al día"))
+                pendientes.append(lista)
+
+        reparadas = 0
+        for inicio in range(0, len(pendientes), batch_size):
+            reparadas += self._guardar(pendientes[inicio:inicio + batch_size], dry_run)
+
+        accion = "con diferencias" if dry_run else "reparadas"
+        self.stdout.write(
+            self.style.SUCCESS(f"{revisadas} listas revisadas, {reparadas} {accion}.")
+        )
+
+    def _guardar(self, listas, dry_run):
+        if not listas or dry_run:
+            return len(listas)
+        ahora = timezone.now()
+        for lista in listas:
+            lista.updated_at = ahora
+            # Cambian los totales que ven los clientes: invalida sus ETags
+            lista.version = F("version") + 1
+        with transaction.atomic():
+            Lista.objects.bulk_update(
+                listas, [*AGREGADOS_LISTA, "resumen_al_dia", "updated_at", "version"]
+            )
+        return len(listas)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from smartcar_app.gastos import reconstruir_historial
+
+
+class Command(BaseCommand):
+    help = (
+        "Rehace el historial mensual (Historial + HistorialCategoria) desde los "
+        "items con un solo query agregado. Sirve como backfill y para reparar "
+        "desvíos del mantenimiento incremental."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--usuario",
+            type=int,
+            action="append",
+            dest="usuarios",
+            help="Id de usuario a reconstruir (se puede repetir). Por defecto, todos.",
+        )
+
+    def handle(self, *args, **options):
+        meses = reconstruir_historial(options["usuarios"])
+        self.stdout.write(self.style.SUCCESS(f"{meses} meses de historial reconstruidos."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from smartcar_app.precios import reconstruir_precios_vigentes
+
+
+class Command(BaseCommand):
+    help = (
+        "Rehace PrecioVigente y MejorPrecio (último precio por item y fuente, "
+        "y el mejor por item) desde todo el historial de PrecioOnline."
+    )
+
+    def handle(self, *args, **options):
+        items = reconstruir_precios_vigentes()
+        self.stdout.write(self.style.SUCCESS(f"{items} items con precio vigente."))
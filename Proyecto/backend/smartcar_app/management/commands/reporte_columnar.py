@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from smartcar_app.columnar import (
+    DIRECTORIO,
+    REPORTES,
+    NumpyNoDisponible,
+    Snapshot,
+    centavos_a_decimal,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Corre un reporte sobre el último snapshot columnar (ver "
+        "snapshot_columnar), sin tocar la base de datos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("reporte", choices=sorted(REPORTES))
+        parser.add_argument("--directorio", default=DIRECTORIO)
+        parser.add_argument("--usuario", type=int, help="Sólo este usuario.")
+        parser.add_argument("--desde", type=int, help="Mes inicial como AAAAMM.")
+        parser.add_argument("--hasta", type=int, help="Mes final como AAAAMM.")
+        parser.add_argument("--limite", type=int, default=20, help="Filas a mostrar (default 20).")
+
+    def handle(self, *args, **options):
+        try:
+            snapshot = Snapshot.actual(options["directorio"])
+        except (NumpyNoDisponible, FileNotFoundError) as e:
+            raise CommandError(str(e))
+
+        filtros = {k: options[k] for k in ("usuario", "desde", "hasta") if options[k] is not None}
+        resultado = REPORTES[options["reporte"]](snapshot, **filtros)
+        self.stdout.write(f"Snapshot del {snapshot.creado}")
+
+        if isinstance(resultado, dict):
+            for grupo, valores in list(resultado.items())[: options["limite"]]:
+                percentiles = ", ".join(str(centavos_a_decimal(v)) for v in valores)
+                self.stdout.write(f"{grupo if grupo is not None else '(vacío)'}: {percentiles}")
+            return
+        for grupo, centavos, filas in resultado[: options["limite"]]:
+            self.stdout.write(
+                f"{grupo if grupo is not None else '(vacío)'}: "
+                f"{centavos_a_decimal(centavos)} ({filas} filas)"
+            )
@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from smartcar_app.kpis import (
+    acumular_ventana,
+    obtener_watermark,
+    reiniciar_rollups,
+    siguiente_corte,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Agrega los eventos nuevos (recibidos después del watermark) a los rollups "
+        "KpiDiario y KpiMensualUsuario. Se puede cortar y volver a correr: "
+        "cada ventana se guarda junto con el watermark."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ventana",
+            type=int,
+            default=2000,
+            help="Eventos por ventana/transacción (default 2000).",
+        )
+        parser.add_argument(
+            "--retraso",
+            type=int,
+            default=300,
+            help=(
+                "Segundos hacia atrás desde ahora en que los eventos recibidos todavía "
+                "no se agregan, para dar tiempo a que el buffer de ingesta escriba "
+                "(default 300)."
+            ),
+        )
+        parser.add_argument(
+            "--reconstruir",
+            action="store_true",
+            help="Borra los rollups y el watermark y agrega todo desde cero.",
+        )
+
+    def handle(self, *args, **options):
+        if options["reconstruir"]:
+            reiniciar_rollups()
+            self.stdout.write("Rollups borrados, se reconstruyen desde el primer evento.")
+
+        hasta = timezone.now() - timedelta(seconds=options["retraso"])
+        watermark = obtener_watermark()
+
+        total = 0
+        ventanas = 0
+        while True:
+            corte = siguiente_corte(watermark, hasta, options["ventana"])
+            if corte is None:
+                break
+            total += acumular_ventana(watermark, corte)
+            ventanas += 1
+            self.stdout.write(f"Ventana {ventanas}: {total} eventos hasta {watermark.ts}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} eventos agregados en {ventanas} ventanas. "
+                f"Watermark: {watermark.ts} / {watermark.evento_id}"
+            )
+        )
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from smartcar_app.columnar import (
+    DIRECTORIO,
+    LOTE_EXPORTACION,
+    NumpyNoDisponible,
+    Snapshot,
+    exportar_snapshot,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta items, compras y precios online a un snapshot columnar de "
+        "NumPy (un .npy por columna) para los reportes entre usuarios. Lee en "
+        "lotes cortos por id para no bloquear a quienes escriben."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--directorio",
+            default=DIRECTORIO,
+            help=f"Dónde se guardan los snapshots (default {DIRECTORIO}).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=LOTE_EXPORTACION,
+            help=f"Filas por lectura (default {LOTE_EXPORTACION}).",
+        )
+        parser.add_argument(
+            "--conservar",
+            type=int,
+            default=2,
+            help="Snapshots que se dejan en disco, contando el nuevo (default 2).",
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        try:
+            ruta = exportar_snapshot(
+                options["directorio"], options["batch_size"], max(options["conservar"], 1)
+            )
+        except NumpyNoDisponible as e:
+            raise CommandError(str(e))
+
+        snapshot = Snapshot(ruta)
+        for tabla in snapshot.meta["tablas"]:
+            self.stdout.write(f"{tabla}: {snapshot.filas(tabla)} filas")
+        self.stdout.write(
+            self.style.SUCCESS(f"Snapshot en {ruta} ({time.perf_counter() - inicio:.1f} s).")
+        )
@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lista',
+            name='numero_items',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lista',
+            name='items_comprados',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='lista',
+            name='total_pendiente',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        # Las listas que ya existen quedan marcadas como desfasadas: el primer
+        # resumen las recalcula en SQL. Las nuevas nacen al día (0 items).
+        migrations.AddField(
+            model_name='lista',
+            name='resumen_al_dia',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='lista',
+            name='resumen_al_dia',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0002_lista_agregados'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alerta',
+            index=models.Index(fields=['lista', 'fecha_hora'], name='idx_alerta_lista_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['usuario', 'ts'], name='idx_evento_usuario_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='historial',
+            index=models.Index(fields=['usuario', 'fecha_registro', 'id'], name='idx_historial_usuario_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['lista', 'fecha_agregado', 'id'], name='idx_item_lista_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['lista', 'deleted_at'], name='idx_item_lista_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='lista',
+            index=models.Index(fields=['usuario', 'fecha_creacion', 'id'], name='idx_lista_usuario_fecha'),
+        ),
+        migrations.AddIndex(
+            model_name='precioonline',
+            index=models.Index(fields=['item', 'fecha_consulta'], name='idx_precio_item_fecha'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:11
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0003_indices_rutas_calientes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='evento',
+            name='ts',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0004_evento_ts_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KpiDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('tipo', models.CharField(max_length=40)),
+                ('total_eventos', models.IntegerField(default=0)),
+                ('usuarios_activos', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'kpi_diario',
+            },
+        ),
+        migrations.CreateModel(
+            name='KpiMensualUsuario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.CharField(max_length=20)),
+                ('tipo', models.CharField(max_length=40)),
+                ('total_eventos', models.IntegerField(default=0)),
+                ('dias_activos', models.IntegerField(default=0)),
+                ('ultimo_dia', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'kpi_mensual_usuario',
+            },
+        ),
+        migrations.CreateModel(
+            name='KpiWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=40, unique=True)),
+                ('ts', models.DateTimeField(blank=True, null=True)),
+                ('evento_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'kpi_watermark',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['ts', 'id'], name='idx_evento_ts'),
+        ),
+        migrations.AddField(
+            model_name='kpimensualusuario',
+            name='usuario',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kpis_mensuales', to='smartcar_app.usuario'),
+        ),
+        migrations.AddConstraint(
+            model_name='kpidiario',
+            constraint=models.UniqueConstraint(fields=('dia', 'tipo'), name='uq_kpi_diario_dia_tipo'),
+        ),
+        migrations.AddConstraint(
+            model_name='kpimensualusuario',
+            constraint=models.UniqueConstraint(fields=('usuario', 'mes', 'tipo'), name='uq_kpi_mensual_usuario_mes_tipo'),
+        ),
+    ]
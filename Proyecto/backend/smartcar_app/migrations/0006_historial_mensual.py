@@ -0,0 +1,165 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:14
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Case, Count, DateTimeField, DecimalField, ExpressionWrapper, F, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+import django.db.models.deletion
+
+
+# Mismo gasto y mes que gastos.GASTO_ITEM / FECHA_HISTORIAL (copiados: una
+# migración no debe depender del código actual de la app)
+DECIMAL = DecimalField(max_digits=20, decimal_places=4)
+
+FECHA_HISTORIAL = Case(
+    When(comprado=True, fecha_comprado__isnull=False, then=F("fecha_comprado")),
+    default=F("fecha_agregado"),
+    output_field=DateTimeField(),
+)
+
+GASTO_ITEM = Case(
+    When(
+        comprado=True,
+        precio_pagado__isnull=False,
+        then=ExpressionWrapper(
+            Coalesce("cantidad_comprada", "cantidad") * F("precio_pagado"),
+            output_field=DECIMAL,
+        ),
+    ),
+    default=ExpressionWrapper(F("cantidad") * F("precio_unitario"), output_field=DECIMAL),
+    output_field=DECIMAL,
+)
+
+CAMPOS_HISTORIAL = ("usuario_id", "mes", "total", "numero_items", "promedio_por_categoria", "fecha_registro")
+
+
+def archivar_y_reconstruir(apps, schema_editor):
+    """
+    Hasta ahora había una fila de Historial por cada lista creada (con el
+    presupuesto en vez del gasto) o por cada POST /api/historial/. Se
+    guardan tal cual en HistorialLegado y Historial se rehace como agregado
+    por (usuario, mes) desde los items, con el mismo GROUP BY que
+    gastos.reconstruir_historial.
+    """
+    Historial = apps.get_model("smartcar_app", "Historial")
+    HistorialCategoria = apps.get_model("smartcar_app", "HistorialCategoria")
+    HistorialLegado = apps.get_model("smartcar_app", "HistorialLegado")
+    Item = apps.get_model("smartcar_app", "Item")
+
+    HistorialLegado.objects.bulk_create(
+        [
+            HistorialLegado(id_original=fila.pop("id"), **fila)
+            for fila in Historial.objects.order_by("id").values("id", *CAMPOS_HISTORIAL)
+        ],
+        batch_size=500,
+    )
+    Historial.objects.all().delete()
+
+    filas = (
+        Item.objects.filter(deleted_at__isnull=True)
+        .annotate(mes_fecha=TruncMonth(FECHA_HISTORIAL), cat=Coalesce("categoria", Value("")))
+        .order_by()
+        .values("lista__usuario_id", "mes_fecha", "cat")
+        .annotate(total=Sum(GASTO_ITEM), n=Count("id"))
+    )
+    meses = {}
+    for fila in filas:
+        mes = timezone.localtime(fila["mes_fecha"]).strftime("%Y-%m")
+        meses.setdefault((fila["lista__usuario_id"], mes), []).append(
+            (fila["cat"], fila["total"] or Decimal("0"), fila["n"])
+        )
+
+    for (usuario_id, mes), categorias in meses.items():
+        total = sum(c[1] for c in categorias)
+        historial = Historial.objects.create(
+            usuario_id=usuario_id,
+            mes=mes,
+            total=total,
+            numero_items=sum(c[2] for c in categorias),
+            promedio_por_categoria=total / len(categorias),
+        )
+        HistorialCategoria.objects.bulk_create(
+            [
+                HistorialCategoria(historial=historial, categoria=categoria, total=total, numero_items=n)
+                for categoria, total, n in categorias
+            ]
+        )
+
+
+def restaurar_legado(apps, schema_editor):
+    """
+    Vuelve a dejar en Historial las filas originales (mismo id y fecha) y
+    descarta el agregado, que se puede rehacer desde los items.
+    """
+    Historial = apps.get_model("smartcar_app", "Historial")
+    HistorialLegado = apps.get_model("smartcar_app", "HistorialLegado")
+
+    Historial.objects.all().delete()
+    restauradas = Historial.objects.bulk_create(
+        [
+            Historial(id=fila.pop("id_original"), **fila)
+            for fila in HistorialLegado.objects.order_by("id").values("id_original", *CAMPOS_HISTORIAL)
+        ],
+        batch_size=500,
+    )
+    # fecha_registro es auto_now_add: el INSERT puso la hora actual
+    fechas = dict(HistorialLegado.objects.values_list("id_original", "fecha_registro"))
+    for historial in restauradas:
+        historial.fecha_registro = fechas[historial.id]
+    Historial.objects.bulk_update(restauradas, ["fecha_registro"], batch_size=500)
+    HistorialLegado.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0005_kpi_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialCategoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('categoria', models.CharField(blank=True, default='', max_length=50)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('numero_items', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'historial_categorias',
+            },
+        ),
+        migrations.AddField(
+            model_name='historialcategoria',
+            name='historial',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='categorias', to='smartcar_app.historial'),
+        ),
+        migrations.CreateModel(
+            name='HistorialLegado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_original', models.BigIntegerField()),
+                ('mes', models.CharField(max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('numero_items', models.IntegerField(default=0)),
+                ('promedio_por_categoria', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('fecha_registro', models.DateTimeField()),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_legado', to='smartcar_app.usuario')),
+            ],
+            options={
+                'db_table': 'historial_legado',
+            },
+        ),
+        # Con las filas ya agrupadas por (usuario, mes) se puede exigir la unicidad
+        migrations.RunPython(archivar_y_reconstruir, restaurar_legado),
+        migrations.AddConstraint(
+            model_name='historial',
+            constraint=models.UniqueConstraint(fields=('usuario', 'mes'), name='uq_historial_usuario_mes'),
+        ),
+        migrations.AddConstraint(
+            model_name='historialcategoria',
+            constraint=models.UniqueConstraint(fields=('historial', 'categoria'), name='uq_historial_categoria'),
+        ),
+    ]
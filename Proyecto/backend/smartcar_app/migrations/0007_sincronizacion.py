@@ -0,0 +1,21 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0006_historial_mensual'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['lista', 'updated_at'], name='idx_item_lista_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='lista',
+            index=models.Index(fields=['usuario', 'updated_at'], name='idx_lista_usuario_updated'),
+        ),
+    ]
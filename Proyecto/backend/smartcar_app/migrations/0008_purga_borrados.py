@@ -0,0 +1,52 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:20
+
+from django.db import migrations, models
+import django.db.models.manager
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0007_sincronizacion'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='item',
+            options={'base_manager_name': 'todos'},
+        ),
+        migrations.AlterModelOptions(
+            name='lista',
+            options={'base_manager_name': 'todos'},
+        ),
+        migrations.AlterModelManagers(
+            name='item',
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('todos', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AlterModelManagers(
+            name='lista',
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('todos', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='item',
+            name='uq_item_nombre_por_lista',
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='idx_item_borrados'),
+        ),
+        migrations.AddIndex(
+            model_name='lista',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='idx_lista_borradas'),
+        ),
+        migrations.AddConstraint(
+            model_name='item',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('lista', 'nombre'), name='uq_item_nombre_por_lista'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0008_purga_borrados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacionPush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plataforma', models.CharField(choices=[('ANDROID', 'ANDROID'), ('IOS', 'IOS'), ('WEB', 'WEB')], max_length=10)),
+                ('titulo', models.CharField(max_length=100)),
+                ('cuerpo', models.CharField(max_length=255)),
+                ('datos_json', models.TextField(blank=True, null=True)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'PENDIENTE'), ('ENVIANDO', 'ENVIANDO'), ('ENVIADA', 'ENVIADA'), ('FALLIDA', 'FALLIDA'), ('DESCARTADA', 'DESCARTADA')], default='PENDIENTE', max_length=10)),
+                ('intentos', models.IntegerField(default=0)),
+                ('proximo_intento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ultimo_error', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('enviada_at', models.DateTimeField(blank=True, null=True)),
+                ('dispositivo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificaciones', to='smartcar_app.dispositivo')),
+            ],
+            options={
+                'db_table': 'notificaciones_push',
+                'indexes': [models.Index(fields=['estado', 'proximo_intento'], name='idx_push_estado_turno')],
+            },
+        ),
+    ]
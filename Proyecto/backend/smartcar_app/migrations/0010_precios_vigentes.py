@@ -0,0 +1,43 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0009_notificaciones_push'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MejorPrecio',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='mejor_precio', serialize=False, to='smartcar_app.item')),
+                ('fuente', models.CharField(max_length=100)),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fecha_consulta', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'mejores_precios',
+            },
+        ),
+        migrations.CreateModel(
+            name='PrecioVigente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fuente', models.CharField(max_length=100)),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fecha_consulta', models.DateTimeField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precios_vigentes', to='smartcar_app.item')),
+            ],
+            options={
+                'db_table': 'precios_vigentes',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='preciovigente',
+            constraint=models.UniqueConstraint(fields=('item', 'fuente'), name='uq_precio_vigente_item_fuente'),
+        ),
+    ]
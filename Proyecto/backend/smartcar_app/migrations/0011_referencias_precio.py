@@ -0,0 +1,33 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0010_precios_vigentes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenciaPrecio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('mediana', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('mad', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('muestras', models.IntegerField(default=0)),
+                ('ventana', models.TextField(default='[]')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'referencias_precio',
+            },
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='precio_atipico',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:53
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def recibido_desde_ts(apps, schema_editor):
+    # Hasta ahora el watermark avanzaba por ts: con recibido = ts los eventos
+    # ya agregados siguen quedando antes del watermark guardado
+    Evento = apps.get_model("smartcar_app", "Evento")
+    Evento.objects.update(recibido=F("ts"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0011_referencias_precio'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='evento',
+            name='idx_evento_ts',
+        ),
+        migrations.AddField(
+            model_name='evento',
+            name='recibido',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(recibido_desde_ts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='evento',
+            index=models.Index(fields=['recibido', 'id'], name='idx_evento_recibido'),
+        ),
+    ]
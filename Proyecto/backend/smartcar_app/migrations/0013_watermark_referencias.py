@@ -0,0 +1,51 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+# Nombres con los que anomalias.py guardaba sus watermarks en KpiWatermark
+NOMBRES = ("referencias:compras", "referencias:precios_online")
+
+
+def mover_desde_kpi(apps, schema_editor):
+    KpiWatermark = apps.get_model("smartcar_app", "KpiWatermark")
+    WatermarkReferencia = apps.get_model("smartcar_app", "WatermarkReferencia")
+    viejos = KpiWatermark.objects.filter(nombre__in=NOMBRES)
+    WatermarkReferencia.objects.bulk_create(
+        [WatermarkReferencia(nombre=w.nombre, ultimo_id=w.evento_id) for w in viejos]
+    )
+    viejos.delete()
+
+
+def devolver_a_kpi(apps, schema_editor):
+    KpiWatermark = apps.get_model("smartcar_app", "KpiWatermark")
+    WatermarkReferencia = apps.get_model("smartcar_app", "WatermarkReferencia")
+    KpiWatermark.objects.bulk_create(
+        [
+            KpiWatermark(nombre=w.nombre, evento_id=w.ultimo_id)
+            for w in WatermarkReferencia.objects.filter(nombre__in=NOMBRES)
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0012_eventos_recibido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatermarkReferencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=40, unique=True)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'referencias_watermark',
+            },
+        ),
+        migrations.RunPython(mover_desde_kpi, devolver_a_kpi),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0013_watermark_referencias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recomendacion',
+            name='firma',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='recomendacion',
+            constraint=models.UniqueConstraint(fields=('lista', 'firma'), name='uq_recomendacion_firma'),
+        ),
+    ]
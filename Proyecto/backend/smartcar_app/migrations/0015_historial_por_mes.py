@@ -0,0 +1,21 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0014_recomendacion_firma'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='historial',
+            name='idx_historial_usuario_fecha',
+        ),
+        migrations.AddIndex(
+            model_name='historial',
+            index=models.Index(fields=['usuario', 'mes', 'id'], name='idx_historial_usuario_mes'),
+        ),
+    ]
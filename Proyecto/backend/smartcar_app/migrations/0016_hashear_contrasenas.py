@@ -0,0 +1,33 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:34
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import migrations
+
+
+def hashear_contrasenas(apps, schema_editor):
+    """
+    Las cuentas creadas antes de guardar contraseñas con hash todavía la
+    tienen en texto plano; se reemplaza por su hash para que login sólo
+    tenga que hacer check_password.
+    """
+    Usuario = apps.get_model("smartcar_app", "Usuario")
+    planas = []
+    for usuario in Usuario.objects.only("id", "contrasena").iterator():
+        try:
+            identify_hasher(usuario.contrasena)
+        except ValueError:
+            usuario.contrasena = make_password(usuario.contrasena)
+            planas.append(usuario)
+    Usuario.objects.bulk_update(planas, ["contrasena"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0015_historial_por_mes'),
+    ]
+
+    operations = [
+        # El hash no se puede deshacer: hacia atrás las contraseñas quedan como están
+        migrations.RunPython(hashear_contrasenas, migrations.RunPython.noop),
+    ]
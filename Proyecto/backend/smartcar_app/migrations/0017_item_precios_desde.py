@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartcar_app', '0016_hashear_contrasenas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='precios_desde',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,18 @@
 from django.db import models
+from django.utils import timezone
+
+
+# ===========================
+# Borrado lógico
+# ===========================
+class VigentesManager(models.Manager):
+    """
+    Manager por defecto de los modelos con deleted_at: oculta lo borrado.
+    Para ver también los borrados (sync, purga) se usa el manager 'todos'.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 # ===========================
@@ -43,6 +57,11 @@ class Lista(models.Model):
     nombre = models.CharField(max_length=100)
     presupuesto = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total_calculado = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # agregados mantenidos por deltas en cada escritura de item (ver totales.py)
+    numero_items = models.IntegerField(default=0)
+    items_comprados = models.IntegerField(default=0)
+    total_pendiente = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    resumen_al_dia = models.BooleanField(default=True)
     estado = models.CharField(
         max_length=20,
         choices=ESTADO_CHOICES,
@@ -59,8 +78,30 @@ class Lista(models.Model):
     deleted_at = models.DateTimeField(null=True, blank=True)
     version = models.IntegerField(default=1)
 
+    objects = VigentesManager()
+    todos = models.Manager()
+
     class Meta:
         db_table = "listas"
+        base_manager_name = "todos"
+        indexes = [
+            # GET /api/listas/?usuario_id= (ordenado por fecha, paginado)
+            models.Index(
+                fields=["usuario", "fecha_creacion", "id"],
+                name="idx_lista_usuario_fecha",
+            ),
+            # GET /api/sync/ (qué listas cambiaron desde el watermark)
+            models.Index(
+                fields=["usuario", "updated_at"],
+                name="idx_lista_usuario_updated",
+            ),
+            # purgar_borrados (índice parcial: sólo las filas borradas)
+            models.Index(
+                fields=["deleted_at"],
+                condition=models.Q(deleted_at__isnull=False),
+                name="idx_lista_borradas",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.nombre} (usuario_id={self.usuario_id})"
@@ -103,20 +144,53 @@ class Item(models.Model):
     precio_pagado = models.DecimalField(
         max_digits=10, decimal_places=2, null=True, blank=True
     )
+    # precio_unitario muy lejos de ReferenciaPrecio al escribirse (anomalias.py)
+    precio_atipico = models.BooleanField(default=False)
+    # Desde cuándo valen sus PrecioOnline: al renombrarlo, lo consultado con
+    # el nombre anterior deja de contar (precios.olvidar_precios)
+    precios_desde = models.DateTimeField(null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
     version = models.IntegerField(default=1)
 
+    objects = VigentesManager()
+    todos = models.Manager()
+
     class Meta:
         db_table = "items"
+        base_manager_name = "todos"
         constraints = [
+            # Un item borrado no impide volver a agregar uno con el mismo nombre
             models.UniqueConstraint(
                 fields=["lista", "nombre"],
+                condition=models.Q(deleted_at__isnull=True),
                 name="uq_item_nombre_por_lista",
             )
         ]
+        indexes = [
+            # GET /api/items/?lista_id= (ordenado por fecha, paginado)
+            models.Index(
+                fields=["lista", "fecha_agregado", "id"],
+                name="idx_item_lista_fecha",
+            ),
+            models.Index(
+                fields=["lista", "deleted_at"],
+                name="idx_item_lista_deleted",
+            ),
+            # GET /api/sync/ (qué items de una lista cambiaron)
+            models.Index(
+                fields=["lista", "updated_at"],
+                name="idx_item_lista_updated",
+            ),
+            # purgar_borrados (índice parcial: sólo las filas borradas)
+            models.Index(
+                fields=["deleted_at"],
+                condition=models.Q(deleted_at__isnull=False),
+                name="idx_item_borrados",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.nombre} (lista_id={self.lista_id})"
@@ -140,11 +214,93 @@ class PrecioOnline(models.Model):
 
     class Meta:
         db_table = "precios_online"
+        indexes = [
+            models.Index(
+                fields=["item", "fecha_consulta"],
+                name="idx_precio_item_fecha",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.fuente} - {self.precio_consultado} (item_id={self.item_id})"
 
 
+# Último precio de cada fuente por item (proyección de PrecioOnline, la
+# mantiene precios.registrar_precios al insertar)
+class PrecioVigente(models.Model):
+    item = models.ForeignKey(
+        Item,
+        on_delete=models.CASCADE,
+        related_name="precios_vigentes",
+    )
+    fuente = models.CharField(max_length=100)
+    precio = models.DecimalField(max_digits=10, decimal_places=2)
+    fecha_consulta = models.DateTimeField()
+
+    class Meta:
+        db_table = "precios_vigentes"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["item", "fuente"],
+                name="uq_precio_vigente_item_fuente",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fuente} - {self.precio} (item_id={self.item_id})"
+
+
+# El menor de los precios vigentes de cada item (una fila por item)
+class MejorPrecio(models.Model):
+    item = models.OneToOneField(
+        Item,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="mejor_precio",
+    )
+    fuente = models.CharField(max_length=100)
+    precio = models.DecimalField(max_digits=10, decimal_places=2)
+    fecha_consulta = models.DateTimeField()
+
+    class Meta:
+        db_table = "mejores_precios"
+
+    def __str__(self):
+        return f"{self.fuente} - {self.precio} (item_id={self.item_id})"
+
+
+# Precio de referencia por nombre normalizado (mediana y MAD de las últimas
+# compras y precios online), lo mantiene anomalias.actualizar_referencias
+class ReferenciaPrecio(models.Model):
+    nombre = models.CharField(max_length=100, unique=True)
+    mediana = models.DecimalField(max_digits=10, decimal_places=2)
+    mad = models.DecimalField(max_digits=10, decimal_places=2)
+    muestras = models.IntegerField(default=0)
+    # Últimos precios (JSON, del más viejo al más nuevo) de los que sale la mediana
+    ventana = models.TextField(default="[]")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "referencias_precio"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.mediana} ± {self.mad} ({self.muestras})"
+
+
+# Hasta qué id de cada historial de precios (Compra, PrecioOnline) ya se
+# sumó a ReferenciaPrecio
+class WatermarkReferencia(models.Model):
+    nombre = models.CharField(max_length=40, unique=True)
+    ultimo_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "referencias_watermark"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.ultimo_id}"
+
+
 # ===========================
 # ALERTAS (LOG)
 # ===========================
@@ -166,6 +322,12 @@ class Alerta(models.Model):
 
     class Meta:
         db_table = "alertas"
+        indexes = [
+            models.Index(
+                fields=["lista", "fecha_hora"],
+                name="idx_alerta_lista_fecha",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.tipo} - {self.mensaje[:20]}..."
@@ -203,6 +365,7 @@ class Historial(models.Model):
         related_name="historial",
     )
     mes = models.CharField(max_length=20)  # p.ej. '2025-10'
+    # gasto del mes: lo pagado en items comprados, lo planeado en el resto
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     numero_items = models.IntegerField(default=0)
     promedio_por_categoria = models.DecimalField(
@@ -212,11 +375,79 @@ class Historial(models.Model):
 
     class Meta:
         db_table = "historial"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["usuario", "mes"],
+                name="uq_historial_usuario_mes",
+            )
+        ]
+        indexes = [
+            # GET /api/historial/<usuario_id>/ (ordenado por mes, paginado)
+            models.Index(
+                fields=["usuario", "mes", "id"],
+                name="idx_historial_usuario_mes",
+            ),
+        ]
 
     def __str__(self):
         return f"Historial {self.mes} (usuario_id={self.usuario_id})"
 
 
+class HistorialCategoria(models.Model):
+    """
+    Desglose por categoría de un mes de Historial; sirve para mantener
+    promedio_por_categoria sin volver a leer los items.
+    """
+    historial = models.ForeignKey(
+        Historial,
+        on_delete=models.CASCADE,
+        related_name="categorias",
+    )
+    categoria = models.CharField(max_length=50, blank=True, default="")  # "" = sin categoría
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    numero_items = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "historial_categorias"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["historial", "categoria"],
+                name="uq_historial_categoria",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.categoria or '(sin categoría)'} (historial_id={self.historial_id})"
+
+
+class HistorialLegado(models.Model):
+    """
+    Filas de Historial de antes de que fuera un agregado por (usuario, mes):
+    una por lista creada o por cada POST /api/historial/. No se pueden
+    rehacer desde los items, así que la migración 0006 las guarda aquí tal
+    cual y las devuelve a Historial si se revierte.
+    """
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        related_name="historial_legado",
+    )
+    id_original = models.BigIntegerField()
+    mes = models.CharField(max_length=20)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    numero_items = models.IntegerField(default=0)
+    promedio_por_categoria = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True
+    )
+    fecha_registro = models.DateTimeField()
+
+    class Meta:
+        db_table = "historial_legado"
+
+    def __str__(self):
+        return f"Historial legado {self.mes} (usuario_id={self.usuario_id})"
+
+
 # ===========================
 # COMPRAS (OPCIONAL)
 # ===========================
@@ -256,10 +487,19 @@ class Recomendacion(models.Model):
     presupuesto_no_usado = models.DecimalField(
         max_digits=10, decimal_places=2, null=True, blank=True
     )
+    # sha1 de los criterios del optimizador: una fila por (lista, criterios)
+    # que se reescribe en cada cálculo (ver optimizador.optimizar_lista)
+    firma = models.CharField(max_length=40, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = "recomendaciones"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["lista", "firma"],
+                name="uq_recomendacion_firma",
+            )
+        ]
 
 
 
@@ -311,6 +551,57 @@ class Dispositivo(models.Model):
         return f"{self.plataforma} - {self.usuario_id}"
 
 
+# ===========================
+# NOTIFICACIONES PUSH (OUTBOX)
+# ===========================
+class NotificacionPush(models.Model):
+    """
+    Bandeja de salida de push: se escribe en la misma transacción que el
+    cambio que la origina y la envía después el comando despachar_push
+    (ver push.py). Una fila por dispositivo.
+    """
+
+    ESTADO_CHOICES = [
+        ("PENDIENTE", "PENDIENTE"),
+        ("ENVIANDO", "ENVIANDO"),
+        ("ENVIADA", "ENVIADA"),
+        ("FALLIDA", "FALLIDA"),
+        ("DESCARTADA", "DESCARTADA"),
+    ]
+
+    dispositivo = models.ForeignKey(
+        Dispositivo,
+        on_delete=models.CASCADE,
+        related_name="notificaciones",
+    )
+    plataforma = models.CharField(max_length=10, choices=Dispositivo.PLATAFORMA_CHOICES)
+    titulo = models.CharField(max_length=100)
+    cuerpo = models.CharField(max_length=255)
+    # importante: TextField, NO JSONField
+    datos_json = models.TextField(null=True, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default="PENDIENTE")
+    intentos = models.IntegerField(default=0)
+    # Cuándo se puede (re)intentar; mientras está ENVIANDO, hasta cuándo
+    # la tiene reservada el worker
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.CharField(max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    enviada_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "notificaciones_push"
+        indexes = [
+            # despachar_push: lo pendiente cuyo turno ya llegó
+            models.Index(
+                fields=["estado", "proximo_intento"],
+                name="idx_push_estado_turno",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.estado} - {self.titulo} (dispositivo_id={self.dispositivo_id})"
+
+
 # ===========================
 # EVENTOS (KPIs)
 # ===========================
@@ -323,10 +614,92 @@ class Evento(models.Model):
     tipo = models.CharField(max_length=40)      # 'ABRE_APP', 'CREA_LISTA', etc.
     entidad = models.CharField(max_length=40, null=True, blank=True)  # 'listas', 'items', etc.
     entidad_id = models.IntegerField(null=True, blank=True)
-    ts = models.DateTimeField(auto_now_add=True)
+    # default (y no auto_now_add) para conservar la hora real del evento
+    # cuando se guarda en lote desde el buffer de ingesta
+    ts = models.DateTimeField(default=timezone.now)
+    # Hora en que lo guardó el servidor (no la manda el cliente; el buffer
+    # de ingesta la pone al escribir el lote): el watermark de rollup_kpis
+    # avanza por aquí, así un evento con ts viejo (cliente offline) igual
+    # se agrega
+    recibido = models.DateTimeField(default=timezone.now)
 
     class Meta:
         db_table = "eventos"
+        indexes = [
+            models.Index(
+                fields=["usuario", "ts"],
+                name="idx_evento_usuario_ts",
+            ),
+            # recorrido por watermark del comando rollup_kpis
+            models.Index(
+                fields=["recibido", "id"],
+                name="idx_evento_recibido",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.tipo} (usuario_id={self.usuario_id})"
+
+
+# ===========================
+# KPIs (ROLLUPS DE EVENTOS)
+# ===========================
+class KpiDiario(models.Model):
+    dia = models.DateField()
+    tipo = models.CharField(max_length=40)
+    total_eventos = models.IntegerField(default=0)
+    usuarios_activos = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "kpi_diario"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dia", "tipo"],
+                name="uq_kpi_diario_dia_tipo",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.tipo}: {self.total_eventos}"
+
+
+class KpiMensualUsuario(models.Model):
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        related_name="kpis_mensuales",
+    )
+    mes = models.CharField(max_length=20)  # p.ej. '2025-10', igual que Historial
+    tipo = models.CharField(max_length=40)
+    total_eventos = models.IntegerField(default=0)
+    dias_activos = models.IntegerField(default=0)
+    ultimo_dia = models.DateField(null=True, blank=True)
+
+    class Meta:
+        db_table = "kpi_mensual_usuario"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["usuario", "mes", "tipo"],
+                name="uq_kpi_mensual_usuario_mes_tipo",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.mes} {self.tipo} (usuario_id={self.usuario_id}): {self.total_eventos}"
+
+
+class KpiWatermark(models.Model):
+    """
+    Hasta dónde (recibido, id) de Evento ya se agregó en los rollups ('ts'
+    guarda el Evento.recibido del corte).
+    """
+    nombre = models.CharField(max_length=40, unique=True)
+    ts = models.DateTimeField(null=True, blank=True)
+    evento_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "kpi_watermark"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.ts} / {self.evento_id}"
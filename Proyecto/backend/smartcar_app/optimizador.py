@@ -0,0 +1,238 @@
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Item, Recomendacion, RecomendacionItem
+from .totales import subtotal_de
+
+
+# Valor de un item según su prioridad (A/M/B); se puede cambiar por petición
+PESOS_PRIORIDAD = getattr(settings, "SMARTCAR_OPTIMIZADOR_PESOS", {"A": 5, "M": 3, "B": 1})
+PESO_MAXIMO = 100
+# Hasta cuántos items pendientes se resuelve exacto; más, con el voraz
+MAX_ITEMS_EXACTO = getattr(settings, "SMARTCAR_OPTIMIZADOR_EXACTO_MAX", 60)
+OPTIMIZACION_CACHE_TIMEOUT = 60 * 60
+
+
+class CriteriosInvalidos(ValueError):
+    pass
+
+
+def leer_criterios(data):
+    """
+    {"pesos": {"A": 5, "M": 3, "B": 1}, "presupuesto": "120000.00" | None}
+    a partir del body (todo opcional). Lanza CriteriosInvalidos.
+    """
+    pesos = dict(PESOS_PRIORIDAD)
+    for prioridad, peso in (data.get("pesos") or {}).items():
+        if prioridad not in pesos:
+            raise CriteriosInvalidos(f"Prioridad desconocida en 'pesos': {prioridad}")
+        if isinstance(peso, bool) or not isinstance(peso, int) or not 0 <= peso <= PESO_MAXIMO:
+            raise CriteriosInvalidos(f"Los pesos son enteros entre 0 y {PESO_MAXIMO}.")
+        pesos[prioridad] = peso
+
+    presupuesto = data.get("presupuesto")
+    if presupuesto is not None:
+        try:
+            presupuesto = Decimal(str(presupuesto))
+        except InvalidOperation:
+            raise CriteriosInvalidos("'presupuesto' debe ser un número.")
+        if not presupuesto.is_finite() or presupuesto < 0:
+            raise CriteriosInvalidos("'presupuesto' debe ser un número no negativo.")
+        presupuesto = str(presupuesto)
+    return {"pesos": pesos, "presupuesto": presupuesto}
+
+
+# ===========================
+# Mochila 0/1: valor = peso de la prioridad, costo = subtotal
+# ===========================
+# candidatos: [(item_id, valor, costo)] con valor entero >= 0 y costo >= 0.
+# Ambos devuelven (ids elegidos, cota superior del valor óptimo).
+
+def mochila_exacta(candidatos, capacidad):
+    """
+    Programación dinámica sobre el valor (no sobre el dinero, que tiene
+    centavos y rangos grandes): minimo[v] es el menor costo con el que se
+    junta valor v. O(n * suma de valores), acotado por MAX_ITEMS_EXACTO y
+    PESO_MAXIMO. Entre soluciones de igual valor elige la más barata.
+    """
+    valor_total = sum(valor for _, valor, _ in candidatos)
+    minimo = [Decimal("0")] + [None] * valor_total
+    tomado = []
+    for _, valor, costo in candidatos:
+        fila = bytearray(valor_total + 1)
+        if valor > 0:
+            for v in range(valor_total, valor - 1, -1):
+                previo = minimo[v - valor]
+                if previo is not None and (minimo[v] is None or previo + costo < minimo[v]):
+                    minimo[v] = previo + costo
+                    fila[v] = 1
+        tomado.append(fila)
+
+    mejor = max(v for v, costo in enumerate(minimo) if costo is not None and costo <= capacidad)
+    elegidos = []
+    v = mejor
+    for i in range(len(candidatos) - 1, -1, -1):
+        if tomado[i][v]:
+            elegidos.append(candidatos[i][0])
+            v -= candidatos[i][1]
+    # Los de costo 0 no suben el costo: entran aunque no sumen valor
+    elegidos += [c[0] for c in candidatos if c[2] == 0 and c[0] not in elegidos]
+    return elegidos, mejor
+
+
+def _por_rendimiento(candidato):
+    _, valor, costo = candidato
+    return (-(Decimal(valor) / costo) if costo else Decimal("-Infinity"), costo)
+
+
+def mochila_voraz(candidatos, capacidad):
+    """
+    Toma por valor/costo de mayor a menor lo que todavía cabe, y se queda
+    con eso o con el mejor item suelto que quepa (lo que valga más: así
+    nunca baja de la mitad del óptimo). La cota es la de la mochila
+    fraccionaria (Dantzig): el óptimo no puede superarla.
+    """
+    ordenados = sorted(candidatos, key=_por_rendimiento)
+
+    elegidos, valor, usado = [], 0, Decimal("0")
+    for item_id, valor_item, costo in ordenados:
+        if usado + costo <= capacidad:
+            elegidos.append(item_id)
+            valor += valor_item
+            usado += costo
+
+    suelto = max(
+        (c for c in candidatos if c[2] <= capacidad), key=lambda c: c[1], default=None
+    )
+    if suelto is not None and suelto[1] > valor:
+        elegidos, valor = [suelto[0]], suelto[1]
+
+    cota, restante = Decimal("0"), capacidad
+    for _, valor_item, costo in ordenados:
+        if costo <= restante:
+            cota += valor_item
+            restante -= costo
+        else:
+            cota += Decimal(valor_item) * restante / costo
+            break
+    return elegidos, max(int(cota), valor)
+
+
+# ===========================
+# Optimización de una lista
+# ===========================
+def firma_criterios(criterios):
+    return hashlib.sha1(json.dumps(criterios, sort_keys=True).encode()).hexdigest()
+
+
+def clave_optimizacion(lista, criterios):
+    return f"optimizacion:{lista.pk}:{lista.version}:{firma_criterios(criterios)}"
+
+
+def optimizar_lista(lista, criterios):
+    """
+    Elige y ordena los items pendientes a comprar para maximizar el valor
+    por prioridad sin pasarse del presupuesto que queda (presupuesto menos
+    lo ya comprado). Guarda el resultado en Recomendacion +
+    RecomendacionItem (una fila por lista y criterios, que se reescribe
+    cuando la lista cambia) y lo memoiza por (lista, version, criterios):
+    si la lista no cambió, repetir la petición no toca la base.
+    """
+    key = clave_optimizacion(lista, criterios)
+    resultado = cache.get(key)
+    if resultado is not None:
+        return resultado
+
+    pesos = criterios["pesos"]
+    presupuesto = (
+        Decimal(criterios["presupuesto"])
+        if criterios["presupuesto"] is not None
+        else lista.presupuesto
+    )
+
+    gastado = Decimal("0")
+    pendientes = {}
+    for item in Item.objects.filter(lista_id=lista.pk).values(
+        "id", "nombre", "prioridad", "cantidad", "precio_unitario", "comprado"
+    ):
+        subtotal = subtotal_de(item["cantidad"], item["precio_unitario"])
+        if item["comprado"]:
+            gastado += subtotal
+        elif subtotal >= 0:
+            item["subtotal"] = subtotal
+            pendientes[item["id"]] = item
+
+    disponible = max(presupuesto - gastado, Decimal("0"))
+    candidatos = [
+        (item["id"], pesos.get(item["prioridad"], 0), item["subtotal"])
+        for item in pendientes.values()
+    ]
+    if sum(c[2] for c in candidatos) <= disponible:
+        metodo = "todos"
+        elegidos, cota = [c[0] for c in candidatos], sum(c[1] for c in candidatos)
+    elif len(candidatos) <= MAX_ITEMS_EXACTO:
+        metodo = "exacto"
+        elegidos, cota = mochila_exacta(candidatos, disponible)
+    else:
+        metodo = "voraz"
+        elegidos, cota = mochila_voraz(candidatos, disponible)
+
+    # Orden de compra: primero lo más prioritario y, dentro, lo más barato
+    elegidos = sorted(
+        (pendientes[item_id] for item_id in elegidos),
+        key=lambda item: (-pesos.get(item["prioridad"], 0), item["subtotal"], item["id"]),
+    )
+    total_usado = sum((item["subtotal"] for item in elegidos), Decimal("0")).quantize(
+        Decimal("0.01")
+    )
+
+    with transaction.atomic():
+        recomendacion, _ = Recomendacion.objects.update_or_create(
+            lista_id=lista.pk,
+            firma=firma_criterios(criterios),
+            defaults={
+                "criterios_json": json.dumps(
+                    dict(criterios, version=lista.version, metodo=metodo), sort_keys=True
+                ),
+                "total_usado": total_usado,
+                "presupuesto_no_usado": (disponible - total_usado).quantize(Decimal("0.01")),
+            },
+        )
+        RecomendacionItem.objects.filter(recomendacion=recomendacion).delete()
+        RecomendacionItem.objects.bulk_create(
+            [
+                RecomendacionItem(recomendacion=recomendacion, item_id=item["id"], orden=orden)
+                for orden, item in enumerate(elegidos, start=1)
+            ]
+        )
+
+    resultado = {
+        "recomendacion_id": recomendacion.pk,
+        "lista_id": lista.pk,
+        "version": lista.version,
+        "criterios": criterios,
+        "metodo": metodo,
+        "presupuesto_disponible": disponible,
+        "total_usado": recomendacion.total_usado,
+        "presupuesto_no_usado": recomendacion.presupuesto_no_usado,
+        "valor": sum(pesos.get(item["prioridad"], 0) for item in elegidos),
+        "cota_valor": cota,
+        "items": [
+            {
+                "orden": orden,
+                "item_id": item["id"],
+                "nombre": item["nombre"],
+                "prioridad": item["prioridad"],
+                "subtotal": item["subtotal"],
+            }
+            for orden, item in enumerate(elegidos, start=1)
+        ],
+        "descartados": sorted(set(pendientes) - {item["id"] for item in elegidos}),
+    }
+    cache.set(key, resultado, OPTIMIZACION_CACHE_TIMEOUT)
+    return resultado
@@ -0,0 +1,118 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+PAGE_SIZE_DEFAULT = getattr(settings, "SMARTCAR_PAGE_SIZE", 50)
+PAGE_SIZE_MAX = getattr(settings, "SMARTCAR_MAX_PAGE_SIZE", 500)
+
+# Mayor id que cabe en un INTEGER de SQLite; uno más grande en un cursor
+# manipulado haría fallar la consulta en vez de dar 400
+ID_MAXIMO = 2 ** 63 - 1
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def quiere_paginar(request):
+    """
+    Sólo se pagina si el cliente lo pide (cursor o page_size en la URL); sin
+    esos parámetros los endpoints devuelven todo como siempre, para que el
+    ApiService actual siga funcionando igual.
+    """
+    params = request.query_params
+    return "cursor" in params or "page_size" in params
+
+
+def codificar_cursor(fecha, pk):
+    # El campo de orden suele ser una fecha; si es texto (Historial.mes) va tal cual
+    if hasattr(fecha, "isoformat"):
+        fecha = fecha.isoformat()
+    crudo = json.dumps([fecha, pk]).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+
+def _decodificar(cursor, campo):
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        fecha, pk = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if campo.get_internal_type() == "DateTimeField":
+            fecha = parse_datetime(fecha)
+        elif not isinstance(fecha, str):
+            fecha = None
+        if fecha is None or isinstance(pk, bool) or not isinstance(pk, int):
+            raise ValueError
+        if not 0 < pk <= ID_MAXIMO:
+            raise ValueError
+        return fecha, pk
+    except (ValueError, TypeError):
+        raise CursorInvalido("Cursor inválido.")
+
+
+def _page_size(request):
+    valor = request.query_params.get("page_size")
+    if valor is None:
+        return PAGE_SIZE_DEFAULT
+    try:
+        valor = int(valor)
+    except ValueError:
+        raise CursorInvalido("'page_size' debe ser un entero.")
+    if valor < 1:
+        raise CursorInvalido("'page_size' debe ser mayor a 0.")
+    return min(valor, PAGE_SIZE_MAX)
+
+
+def filtrar_desde_cursor(qs, campo_fecha, cursor=None, descendente=True):
+    """
+    Ordena por (campo_fecha, id) y, si hay cursor, se queda con lo que viene
+    después. El filtro redundante 'fecha <= cursor' (o >=) es para que el
+    motor use un rango sobre el índice (usuario, fecha, id) en vez de
+    recorrerlo desde el principio filtrando. campo_fecha puede ser también
+    un campo de texto que ordene igual que la fecha (Historial.mes).
+    """
+    if descendente:
+        qs = qs.order_by(f"-{campo_fecha}", "-id")
+        op, op_rango = "lt", "lte"
+    else:
+        qs = qs.order_by(campo_fecha, "id")
+        op, op_rango = "gt", "gte"
+
+    if cursor:
+        fecha, pk = _decodificar(cursor, qs.model._meta.get_field(campo_fecha))
+        qs = qs.filter(**{f"{campo_fecha}__{op_rango}": fecha}).filter(
+            Q(**{f"{campo_fecha}__{op}": fecha}) | Q(**{f"id__{op}": pk})
+        )
+    return qs
+
+
+def paginar_keyset(qs, request, campo_fecha, descendente=True):
+    """
+    Paginación por cursor (keyset) sobre (campo_fecha, id).
+
+    En vez de OFFSET, cada página filtra a partir del último (fecha, id)
+    visto, así que pedir la página 1000 cuesta lo mismo que la primera si
+    hay un índice sobre esas columnas. Devuelve (objetos, siguiente_cursor);
+    siguiente_cursor es None en la última página.
+
+    Lanza CursorInvalido si el cursor o el page_size no son válidos.
+    """
+    page_size = _page_size(request)
+    cursor = request.query_params.get("cursor")
+
+    qs = filtrar_desde_cursor(qs, campo_fecha, cursor, descendente)
+
+    objetos = list(qs[: page_size + 1])
+    siguiente = None
+    if len(objetos) > page_size:
+        objetos = objetos[:page_size]
+        ultimo = objetos[-1]
+        if isinstance(ultimo, dict):
+            # queryset de .values()
+            siguiente = codificar_cursor(ultimo[campo_fecha], ultimo["id"])
+        else:
+            siguiente = codificar_cursor(getattr(ultimo, campo_fecha), ultimo.pk)
+    return objetos, siguiente
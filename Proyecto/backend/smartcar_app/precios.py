@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import logging
+import time
+import unicodedata
+import zlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.module_loading import import_string
+
+from .models import Item, MejorPrecio, PrecioOnline, PrecioVigente
+
+
+logger = logging.getLogger(__name__)
+
+# Rutas de las fuentes de precios (subclases de FuentePrecio)
+FUENTES = getattr(settings, "SMARTCAR_PRECIOS_FUENTES", ["smartcar_app.precios.FuenteLocal"])
+# Consultas en vuelo a la vez, sumando todas las fuentes
+CONCURRENCIA = getattr(settings, "SMARTCAR_PRECIOS_CONCURRENCIA", 10)
+# Segundos que vale un precio consultado (por nombre normalizado y fuente)
+CACHE_TTL = getattr(settings, "SMARTCAR_PRECIOS_TTL", 6 * 60 * 60)
+TIMEOUT_CONSULTA = getattr(settings, "SMARTCAR_PRECIOS_TIMEOUT", 10)
+# Circuit breaker: fallos seguidos que abren el circuito de una fuente y
+# segundos que queda abierto antes de dejar pasar una consulta de prueba
+FALLOS_PARA_ABRIR = getattr(settings, "SMARTCAR_PRECIOS_FALLOS", 5)
+ENFRIAMIENTO = getattr(settings, "SMARTCAR_PRECIOS_ENFRIAMIENTO", 60)
+
+# En la cache "sin precio" se guarda así, para distinguirlo de "no está"
+_SIN_PRECIO = ""
+
+
+def normalizar_nombre(nombre):
+    """
+    'Café  Molido ' -> 'cafe molido': minúsculas, sin tildes y con los
+    espacios colapsados. Es la clave con la que se consulta y cachea.
+    """
+    sin_tildes = unicodedata.normalize("NFKD", nombre or "")
+    sin_tildes = "".join(c for c in sin_tildes if not unicodedata.combining(c))
+    return " ".join(sin_tildes.lower().split())
+
+
+# ===========================
+# Fuentes
+# ===========================
+class FuentePrecio:
+    """
+    Una tienda o API de precios. Una subclase define 'nombre' (se guarda en
+    PrecioOnline.fuente) y la corrutina buscar(nombre_normalizado), que
+    devuelve el precio unitario como Decimal, None si no lo encuentra, o
+    lanza una excepción si la fuente falló.
+    """
+
+    nombre = None
+
+    async def buscar(self, nombre):
+        raise NotImplementedError
+
+
+class FuenteLocal(FuentePrecio):
+    """
+    Fuente de desarrollo que no sale a la red: un precio fijo por nombre
+    (derivado del nombre, así es estable entre corridas) o el de 'precios'.
+    """
+
+    nombre = "local"
+    precios = {}
+    latencia = 0
+
+    async def buscar(self, nombre):
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        if nombre in self.precios:
+            return self.precios[nombre]
+        if not nombre:
+            return None
+        return Decimal(100 + zlib.crc32(nombre.encode()) % 9900)
+
+
+_fuentes = None
+
+
+def fuentes_configuradas():
+    global _fuentes
+    if _fuentes is None:
+        _fuentes = [import_string(ruta)() for ruta in FUENTES]
+    return _fuentes
+
+
+# ===========================
+# Circuit breaker por fuente
+# ===========================
+class Circuito:
+    """
+    Cerrado: las consultas pasan. Tras FALLOS_PARA_ABRIR fallos seguidos se
+    abre y las consultas a esa fuente se saltan durante ENFRIAMIENTO
+    segundos; después pasa una de prueba (semiabierto): si sale bien se
+    cierra, si falla vuelve a abrirse.
+    """
+
+    def __init__(self, umbral=FALLOS_PARA_ABRIR, enfriamiento=ENFRIAMIENTO):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self.fallos = 0
+        self.abierto_hasta = None
+        self._probando = False
+
+    @property
+    def abierto(self):
+        return self.abierto_hasta is not None
+
+    def permite(self):
+        if self.abierto_hasta is None:
+            return True
+        if time.monotonic() < self.abierto_hasta or self._probando:
+            return False
+        self._probando = True
+        return True
+
+    def exito(self):
+        self.fallos = 0
+        self.abierto_hasta = None
+        self._probando = False
+
+    def fallo(self):
+        self.fallos += 1
+        self._probando = False
+        if self.abierto_hasta is not None or self.fallos >= self.umbral:
+            self.abierto_hasta = time.monotonic() + self.enfriamiento
+
+
+_circuitos = {}
+
+
+def circuito_de(fuente):
+    if fuente.nombre not in _circuitos:
+        _circuitos[fuente.nombre] = Circuito()
+    return _circuitos[fuente.nombre]
+
+
+# ===========================
+# Consulta concurrente
+# ===========================
+def clave_cache(fuente, nombre):
+    return "precio:%s:%s" % (fuente, hashlib.sha1(nombre.encode()).hexdigest())
+
+
+async def _consultar(fuente, nombre, semaforo):
+    circuito = circuito_de(fuente)
+    async with semaforo:
+        # Se mira al tener turno: si mientras esperaba la fuente acumuló
+        # fallos, ya no se le pega
+        if not circuito.permite():
+            return None, False
+        try:
+            precio = await asyncio.wait_for(fuente.buscar(nombre), TIMEOUT_CONSULTA)
+        except Exception:
+            logger.warning(
+                "Falló la fuente de precios %s para '%s'", fuente.nombre, nombre, exc_info=True
+            )
+            circuito.fallo()
+            return None, False
+    circuito.exito()
+    return precio, True
+
+
+async def consultar_precios(pares, concurrencia=CONCURRENCIA):
+    """
+    pares: [(nombre normalizado, fuente)] a consultar. Los consulta todos a
+    la vez, con a lo sumo 'concurrencia' en vuelo. Devuelve
+    {(nombre, fuente.nombre): (precio o None, respondió)}.
+    """
+    semaforo = asyncio.Semaphore(concurrencia)
+    resultados = await asyncio.gather(
+        *(_consultar(fuente, nombre, semaforo) for nombre, fuente in pares)
+    )
+    return {(nombre, fuente.nombre): r for (nombre, fuente), r in zip(pares, resultados)}
+
+
+def precios_por_nombre(nombres, fuentes=None):
+    """
+    {(nombre normalizado, fuente): precio} para los nombres dados. Lo que
+    está en la cache no se consulta; lo consultado se guarda CACHE_TTL
+    segundos (también "sin precio", para no repetir búsquedas vacías).
+    Las fuentes que fallaron o tienen el circuito abierto no aparecen.
+    """
+    fuentes = fuentes if fuentes is not None else fuentes_configuradas()
+    claves = {clave_cache(f.nombre, n): (n, f) for n in nombres for f in fuentes}
+    en_cache = cache.get_many(list(claves))
+
+    precios = {}
+    faltantes = []
+    for clave, (nombre, fuente) in claves.items():
+        if clave in en_cache:
+            if en_cache[clave] != _SIN_PRECIO:
+                precios[(nombre, fuente.nombre)] = Decimal(en_cache[clave])
+        else:
+            faltantes.append((nombre, fuente))
+
+    if faltantes:
+        consultados = asyncio.run(consultar_precios(faltantes))
+        nuevos = {}
+        for (nombre, fuente_nombre), (precio, respondio) in consultados.items():
+            if not respondio:
+                continue
+            nuevos[clave_cache(fuente_nombre, nombre)] = (
+                str(precio) if precio is not None else _SIN_PRECIO
+            )
+            if precio is not None:
+                precios[(nombre, fuente_nombre)] = precio
+        cache.set_many(nuevos, CACHE_TTL)
+    return precios
+
+
+def actualizar_precios(items_qs, fuentes=None):
+    """
+    Consulta los precios de los items del queryset (una vez por nombre
+    normalizado y fuente) y los guarda con registrar_precios. Devuelve
+    las filas creadas.
+    """
+    items = list(items_qs.values_list("id", "nombre"))
+    nombres = {item_id: normalizar_nombre(nombre) for item_id, nombre in items}
+    precios = precios_por_nombre(set(nombres.values()), fuentes)
+
+    por_nombre = {}
+    for (nombre, fuente), precio in precios.items():
+        por_nombre.setdefault(nombre, []).append((fuente, Decimal(precio).quantize(Decimal("0.01"))))
+
+    filas = [
+        PrecioOnline(item_id=item_id, fuente=fuente, precio_consultado=precio)
+        for item_id, nombre in nombres.items()
+        for fuente, precio in por_nombre.get(nombre, ())
+    ]
+    return registrar_precios(filas)
+
+
+def actualizar_precios_lista(lista_id, fuentes=None):
+    return actualizar_precios(Item.objects.filter(lista_id=lista_id), fuentes)
+
+
+# ===========================
+# Precio vigente y mejor precio (proyecciones de PrecioOnline)
+# ===========================
+def registrar_precios(filas):
+    """
+    Inserta las filas de PrecioOnline (un bulk_create) y, en la misma
+    transacción, actualiza PrecioVigente (último precio por item y fuente)
+    y MejorPrecio de los items tocados. Leer el mejor precio de una lista
+    es entonces un JOIN por PK, sin importar cuánto historial haya.
+    """
+    if not filas:
+        return []
+    with transaction.atomic():
+        creadas = PrecioOnline.objects.bulk_create(filas, batch_size=500)
+
+        # Si un item trae dos precios de la misma fuente vale el último
+        vigentes = {}
+        for fila in creadas:
+            vigentes[(fila.item_id, fila.fuente)] = PrecioVigente(
+                item_id=fila.item_id,
+                fuente=fila.fuente,
+                precio=fila.precio_consultado,
+                fecha_consulta=fila.fecha_consulta,
+            )
+        PrecioVigente.objects.bulk_create(
+            list(vigentes.values()),
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["item", "fuente"],
+            update_fields=["precio", "fecha_consulta"],
+        )
+        actualizar_mejores_precios({item_id for item_id, _ in vigentes})
+    return creadas
+
+
+def actualizar_mejores_precios(item_ids):
+    """
+    Recalcula MejorPrecio de esos items desde PrecioVigente (el menor
+    precio; a igual precio, el más reciente).
+    """
+    item_ids = list(item_ids)
+    for inicio in range(0, len(item_ids), 500):
+        lote = item_ids[inicio:inicio + 500]
+        mejores = {}
+        for fila in (
+            PrecioVigente.objects.filter(item_id__in=lote)
+            .order_by("item_id", "precio", "-fecha_consulta")
+            .values("item_id", "fuente", "precio", "fecha_consulta")
+        ):
+            mejores.setdefault(fila["item_id"], fila)
+        MejorPrecio.objects.bulk_create(
+            [MejorPrecio(**fila) for fila in mejores.values()],
+            update_conflicts=True,
+            unique_fields=["item"],
+            update_fields=["fuente", "precio", "fecha_consulta"],
+        )
+
+
+def olvidar_precios(item_ids, desde):
+    """
+    Para items renombrados: los precios que tenían eran de otro nombre.
+    Borra su PrecioVigente y MejorPrecio y marca Item.precios_desde, así
+    reconstruir_precios_vigentes tampoco los vuelve a tomar del historial.
+    Debe llamarse dentro de la transacción que guarda el nombre nuevo.
+    """
+    item_ids = list(item_ids)
+    if not item_ids:
+        return
+    Item.todos.filter(pk__in=item_ids).update(precios_desde=desde)
+    PrecioVigente.objects.filter(item_id__in=item_ids).delete()
+    MejorPrecio.objects.filter(item_id__in=item_ids).delete()
+
+
+def reconstruir_precios_vigentes():
+    """
+    Rehace PrecioVigente y MejorPrecio desde el historial de PrecioOnline
+    (para datos previos o para reparar), sin lo consultado antes de que el
+    item se renombrara. Devuelve cuántos items tienen precio.
+    """
+    # En orden por fecha: la última fila de cada (item, fuente) pisa a las anteriores
+    vigentes = {}
+    for fila in (
+        PrecioOnline.objects.filter(
+            Q(item__precios_desde__isnull=True) | Q(fecha_consulta__gte=F("item__precios_desde"))
+        )
+        .order_by("fecha_consulta", "id")
+        .values("item_id", "fuente", "precio_consultado", "fecha_consulta")
+        .iterator()
+    ):
+        vigentes[(fila["item_id"], fila["fuente"])] = PrecioVigente(
+            item_id=fila["item_id"],
+            fuente=fila["fuente"],
+            precio=fila["precio_consultado"],
+            fecha_consulta=fila["fecha_consulta"],
+        )
+
+    item_ids = {item_id for item_id, _ in vigentes}
+    with transaction.atomic():
+        PrecioVigente.objects.all().delete()
+        MejorPrecio.objects.all().delete()
+        PrecioVigente.objects.bulk_create(list(vigentes.values()), batch_size=500)
+        actualizar_mejores_precios(item_ids)
+    return len(item_ids)
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Item, Lista
+
+
+# Días que un borrado lógico se conserva como tombstone antes de purgarlo.
+# Un cliente que no sincroniza en ese plazo recibe un sync completo.
+RETENCION_DIAS = getattr(settings, "SMARTCAR_PURGA_DIAS", 30)
+TAMANO_LOTE = getattr(settings, "SMARTCAR_PURGA_LOTE", 500)
+
+# Primero los items y después las listas: cuando se purga una lista sus
+# items (borrados junto con ella) normalmente ya no existen, así que el
+# CASCADE de cada lote queda acotado.
+MODELOS_PURGABLES = (Item, Lista)
+
+
+def limite_retencion(dias=RETENCION_DIAS):
+    return timezone.now() - timedelta(days=dias)
+
+
+def purgar_lote(modelo, limite, tamano=TAMANO_LOTE):
+    """
+    Borra de verdad (con su CASCADE) hasta 'tamano' filas de 'modelo'
+    borradas lógicamente antes de 'limite', en su propia transacción para
+    soltar el lock de escritura entre lotes. Devuelve cuántas borró.
+    """
+    ids = list(
+        modelo.todos.filter(deleted_at__lt=limite)
+        .order_by("deleted_at", "id")
+        .values_list("id", flat=True)[:tamano]
+    )
+    if not ids:
+        return 0
+    with transaction.atomic():
+        modelo.todos.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def pendientes_de_purga(modelo, limite):
+    return modelo.todos.filter(deleted_at__lt=limite).count()
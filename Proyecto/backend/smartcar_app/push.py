@@ -0,0 +1,348 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Dispositivo, NotificacionPush
+
+
+logger = logging.getLogger(__name__)
+
+# plataforma -> ruta del proveedor (ver ProveedorPush)
+PROVEEDORES = getattr(
+    settings,
+    "SMARTCAR_PUSH_PROVEEDORES",
+    {
+        "ANDROID": "smartcar_app.push.ProveedorFalso",
+        "IOS": "smartcar_app.push.ProveedorFalso",
+        "WEB": "smartcar_app.push.ProveedorFalso",
+    },
+)
+MAX_INTENTOS = getattr(settings, "SMARTCAR_PUSH_MAX_INTENTOS", 5)
+# Reintentos: BACKOFF_BASE * 2^(intentos-1) segundos (con jitter), hasta BACKOFF_MAX
+BACKOFF_BASE = getattr(settings, "SMARTCAR_PUSH_BACKOFF_BASE", 30)
+BACKOFF_MAX = getattr(settings, "SMARTCAR_PUSH_BACKOFF_MAX", 60 * 60)
+# Cuánto tiempo reserva el worker las filas que está enviando; si se cae,
+# al vencer otro worker las retoma
+RESERVA = getattr(settings, "SMARTCAR_PUSH_RESERVA", 5 * 60)
+TIMEOUT_LOTE = getattr(settings, "SMARTCAR_PUSH_TIMEOUT", 30)
+
+ENVIADO = "ENVIADO"
+TOKEN_INVALIDO = "TOKEN_INVALIDO"
+ERROR = "ERROR"
+
+MensajePush = namedtuple("MensajePush", "id token titulo cuerpo datos")
+ResultadoPush = namedtuple("ResultadoPush", "id estado error", defaults=(None,))
+
+
+# ===========================
+# Encolar (outbox)
+# ===========================
+def encolar_push(usuario_id, titulo, cuerpo, datos=None):
+    """
+    Una NotificacionPush PENDIENTE por cada dispositivo activo del usuario.
+    Se llama dentro de la transacción del cambio que la origina: si esa
+    transacción se deshace, la notificación tampoco existe.
+    """
+    dispositivos = Dispositivo.objects.filter(usuario_id=usuario_id, activo=True).values_list(
+        "id", "plataforma"
+    )
+    datos_json = json.dumps(datos) if datos is not None else None
+    creadas = NotificacionPush.objects.bulk_create(
+        [
+            NotificacionPush(
+                dispositivo_id=dispositivo_id,
+                plataforma=plataforma,
+                titulo=titulo[:100],
+                cuerpo=cuerpo[:255],
+                datos_json=datos_json,
+            )
+            for dispositivo_id, plataforma in dispositivos
+        ]
+    )
+    return len(creadas)
+
+
+# ===========================
+# Proveedores
+# ===========================
+class ProveedorPush:
+    """
+    Backend de envío de una plataforma (FCM, APNs, Web Push...). Una
+    subclase define enviar_lote(mensajes) -> [ResultadoPush] como corrutina
+    y sus límites: hasta 'tamano_lote' mensajes por llamada, 'por_segundo'
+    mensajes por segundo y 'concurrencia' llamadas a la vez. Se configura
+    por plataforma en settings.SMARTCAR_PUSH_PROVEEDORES.
+
+    ResultadoPush.estado es ENVIADO, TOKEN_INVALIDO (el dispositivo ya no
+    existe: se desactiva) o ERROR (se reintenta).
+    """
+
+    tamano_lote = 500
+    por_segundo = 500
+    concurrencia = 4
+
+    def __init__(self, plataforma):
+        self.plataforma = plataforma
+
+    async def enviar_lote(self, mensajes):
+        raise NotImplementedError
+
+
+class ProveedorFalso(ProveedorPush):
+    """
+    Proveedor local que no sale a la red, para desarrollo y tests. Guarda
+    lo "enviado" en ProveedorFalso.enviados. Los tokens que empiezan con
+    'invalido' responden TOKEN_INVALIDO y los que empiezan con 'error'
+    responden ERROR.
+    """
+
+    enviados = []
+    latencia = 0
+
+    async def enviar_lote(self, mensajes):
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        resultados = []
+        for mensaje in mensajes:
+            if mensaje.token.startswith("invalido"):
+                resultados.append(ResultadoPush(mensaje.id, TOKEN_INVALIDO, "Token no registrado"))
+            elif mensaje.token.startswith("error"):
+                resultados.append(ResultadoPush(mensaje.id, ERROR, "Error del proveedor"))
+            else:
+                ProveedorFalso.enviados.append((self.plataforma, mensaje))
+                resultados.append(ResultadoPush(mensaje.id, ENVIADO))
+        return resultados
+
+
+_proveedores = {}
+
+
+def proveedor_para(plataforma):
+    """
+    El proveedor configurado para la plataforma, o None si no hay ninguno
+    (o su ruta no se puede importar).
+    """
+    proveedor = _proveedores.get(plataforma)
+    if proveedor is None:
+        ruta = PROVEEDORES.get(plataforma)
+        if ruta is None:
+            return None
+        try:
+            clase = import_string(ruta)
+        except ImportError:
+            logger.exception("No se pudo cargar el proveedor push de %s (%s)", plataforma, ruta)
+            return None
+        proveedor = _proveedores[plataforma] = clase(plataforma)
+    return proveedor
+
+
+class LimitadorTasa:
+    """
+    Token bucket para corrutinas: adquirir(n) espera hasta que haya n
+    fichas. Se recargan 'por_segundo' fichas por segundo hasta 'capacidad'.
+
+    Las fichas se reservan bajo un threading.Lock (no asyncio.Lock, que
+    queda atado a un event loop) y la espera es fuera del lock, así el
+    mismo limitador sirve para todas las pasadas del worker (cada una con
+    su asyncio.run) y para varios hilos.
+    """
+
+    def __init__(self, por_segundo, capacidad=None):
+        self.por_segundo = por_segundo
+        self.capacidad = capacidad or por_segundo
+        self._fichas = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self, n=1):
+        """
+        Descuenta n fichas (el saldo puede quedar negativo: es lo que ya
+        está reservado) y devuelve cuántos segundos hay que esperar.
+        """
+        # Un lote más grande que la capacidad espera al balde lleno
+        n = min(n, self.capacidad)
+        with self._lock:
+            ahora = time.monotonic()
+            self._fichas = min(
+                self.capacidad, self._fichas + (ahora - self._ultimo) * self.por_segundo
+            )
+            self._ultimo = ahora
+            self._fichas -= n
+            return max(0, -self._fichas / self.por_segundo)
+
+    async def adquirir(self, n=1):
+        espera = self.reservar(n)
+        if espera:
+            await asyncio.sleep(espera)
+
+
+# Un limitador por plataforma para toda la vida del proceso: la tasa del
+# proveedor se respeta también entre pasadas seguidas del worker
+_limitadores = {}
+_lock_limitadores = threading.Lock()
+
+
+def limitador_de(proveedor):
+    with _lock_limitadores:
+        limitador = _limitadores.get(proveedor.plataforma)
+        if limitador is None:
+            limitador = _limitadores[proveedor.plataforma] = LimitadorTasa(proveedor.por_segundo)
+        return limitador
+
+
+# ===========================
+# Envío concurrente
+# ===========================
+async def _enviar_lote(proveedor, lote, limitador, semaforo):
+    async with semaforo:
+        await limitador.adquirir(len(lote))
+        try:
+            resultados = await asyncio.wait_for(proveedor.enviar_lote(lote), TIMEOUT_LOTE)
+        except Exception as e:
+            logger.exception("Falló un lote de %s push (%s)", len(lote), proveedor.plataforma)
+            return [ResultadoPush(m.id, ERROR, str(e)[:255] or type(e).__name__) for m in lote]
+
+    # Lo que el proveedor no haya respondido cuenta como error
+    respondidos = {r.id for r in resultados}
+    return list(resultados) + [
+        ResultadoPush(m.id, ERROR, "Sin respuesta del proveedor")
+        for m in lote
+        if m.id not in respondidos
+    ]
+
+
+async def enviar_por_plataforma(grupos):
+    """
+    grupos: {plataforma: [MensajePush]}. Parte cada grupo en lotes del
+    tamaño del proveedor y los envía todos a la vez, respetando la
+    concurrencia y la tasa de cada proveedor. Devuelve [ResultadoPush].
+    """
+    tareas = []
+    sin_proveedor = []
+    for plataforma, mensajes in grupos.items():
+        proveedor = proveedor_para(plataforma)
+        if proveedor is None:
+            sin_proveedor += [
+                ResultadoPush(m.id, ERROR, f"Sin proveedor para {plataforma}") for m in mensajes
+            ]
+            continue
+        limitador = limitador_de(proveedor)
+        semaforo = asyncio.Semaphore(proveedor.concurrencia)
+        for inicio in range(0, len(mensajes), proveedor.tamano_lote):
+            lote = mensajes[inicio:inicio + proveedor.tamano_lote]
+            tareas.append(_enviar_lote(proveedor, lote, limitador, semaforo))
+
+    resultados = sin_proveedor
+    for lote in await asyncio.gather(*tareas):
+        resultados += lote
+    return resultados
+
+
+# ===========================
+# Worker
+# ===========================
+def espera_reintento(intentos):
+    espera = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (intentos - 1))
+    return timedelta(seconds=random.uniform(espera / 2, espera))
+
+
+def reservar_pendientes(limite, ahora):
+    """
+    Marca como ENVIANDO hasta 'limite' notificaciones cuyo turno llegó (o
+    cuya reserva venció) y las devuelve con su dispositivo.
+    """
+    ids = list(
+        NotificacionPush.objects.filter(
+            estado__in=("PENDIENTE", "ENVIANDO"), proximo_intento__lte=ahora
+        )
+        .order_by("proximo_intento", "id")
+        .values_list("id", flat=True)[:limite]
+    )
+    if not ids:
+        return []
+    hasta = ahora + timedelta(seconds=RESERVA)
+    NotificacionPush.objects.filter(
+        pk__in=ids, estado__in=("PENDIENTE", "ENVIANDO"), proximo_intento__lte=ahora
+    ).update(estado="ENVIANDO", proximo_intento=hasta)
+    # Sólo las que reservó este worker (otro pudo ganar algunas)
+    return list(
+        NotificacionPush.objects.filter(pk__in=ids, estado="ENVIANDO", proximo_intento=hasta)
+        .select_related("dispositivo")
+    )
+
+
+def despachar_pendientes(limite=1000):
+    """
+    Una pasada del worker: reserva, envía por plataforma y guarda el
+    resultado de cada notificación. Devuelve {estado: cantidad}.
+    """
+    ahora = timezone.now()
+    filas = reservar_pendientes(limite, ahora)
+    if not filas:
+        return {}
+
+    grupos = {}
+    for fila in filas:
+        if not fila.dispositivo.activo:
+            fila.estado, fila.ultimo_error = "DESCARTADA", "Dispositivo inactivo"
+            continue
+        if proveedor_para(fila.plataforma) is None:
+            # Reintentar no sirve hasta que se configure uno: falla ya y
+            # el resto de la pasada sigue
+            fila.estado = "FALLIDA"
+            fila.ultimo_error = f"Sin proveedor para {fila.plataforma}"
+            continue
+        datos = json.loads(fila.datos_json) if fila.datos_json else None
+        grupos.setdefault(fila.plataforma, []).append(
+            MensajePush(fila.pk, fila.dispositivo.push_token, fila.titulo, fila.cuerpo, datos)
+        )
+
+    resultados = asyncio.run(enviar_por_plataforma(grupos)) if grupos else []
+
+    ahora = timezone.now()
+    por_id = {fila.pk: fila for fila in filas}
+    muertos = set()
+    for resultado in resultados:
+        fila = por_id.get(resultado.id)
+        if fila is None:
+            logger.warning("Resultado push para una notificación desconocida: %s", resultado)
+            continue
+        fila.intentos += 1
+        fila.ultimo_error = resultado.error
+        if resultado.estado == ENVIADO:
+            fila.estado, fila.enviada_at = "ENVIADA", ahora
+        elif resultado.estado == TOKEN_INVALIDO:
+            fila.estado = "DESCARTADA"
+            muertos.add(fila.dispositivo_id)
+        elif fila.intentos >= MAX_INTENTOS:
+            fila.estado = "FALLIDA"
+        else:
+            fila.estado = "PENDIENTE"
+            fila.proximo_intento = ahora + espera_reintento(fila.intentos)
+
+    with transaction.atomic():
+        NotificacionPush.objects.bulk_update(
+            filas,
+            ["estado", "intentos", "proximo_intento", "ultimo_error", "enviada_at"],
+            batch_size=500,
+        )
+        if muertos:
+            Dispositivo.objects.filter(pk__in=muertos).update(activo=False)
+            NotificacionPush.objects.filter(
+                dispositivo_id__in=muertos, estado="PENDIENTE"
+            ).update(estado="DESCARTADA", ultimo_error="Dispositivo inactivo")
+
+    conteo = {}
+    for fila in filas:
+        conteo[fila.estado] = conteo.get(fila.estado, 0) + 1
+    return conteo
@@ -0,0 +1,295 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from .totales import SUBTOTAL_ITEM
+
+
+# Tiempo que se guardan las recomendaciones calculadas. La clave incluye
+# Lista.version, así que cualquier cambio en la lista invalida el valor.
+RECOMENDACIONES_CACHE_TIMEOUT = 60 * 60
+
+CANTIDAD_ALTA = Decimal("10")
+PRECIO_ELEVADO = Decimal("30000")
+POCOS_ITEMS = 2
+
+
+# ===========================
+# Estadísticas agregadas de una lista
+# ===========================
+# Orden en que el motor anterior recorría los items: cuando una regla nombra
+# "el primer item" que cumple algo, es el primero en este orden.
+ORDEN_ITEMS = ("fecha_agregado", "id")
+
+# Condiciones de las reglas que nombran un item, en SQL y sobre un item ya
+# cargado (deben decir lo mismo).
+CONDICIONES = {
+    "cantidad_alta": (Q(cantidad__gte=CANTIDAD_ALTA), lambda i: i.cantidad >= CANTIDAD_ALTA),
+    "precio_elevado": (
+        Q(precio_unitario__gt=PRECIO_ELEVADO),
+        lambda i: i.precio_unitario > PRECIO_ELEVADO,
+    ),
+    "precio_atipico": (Q(precio_atipico=True), lambda i: i.precio_atipico),
+    "valor_invalido": (
+        Q(cantidad__lte=0) | Q(precio_unitario__lt=0),
+        lambda i: i.cantidad <= 0 or i.precio_unitario < 0,
+    ),
+}
+
+
+class EstadisticasLista:
+    """
+    Resultado de UN solo query agregado sobre los items de una lista,
+    agrupado por categoría (o del mismo cálculo sobre items ya cargados, ver
+    de_items). Las reglas leen de aquí; sólo cuando el agregado dice que hay
+    un item que nombrar se busca cuál es (primer_item).
+    """
+
+    def __init__(self, filas, lista=None, items=None):
+        self.lista = lista
+        # Items ya cargados en ORDEN_ITEMS (de_items); None = se leen de la base
+        self.items = items
+        self.total = Decimal("0")
+        self.numero_items = 0
+        self.nombres_distintos = 0
+        self.por_categoria = {}
+        self.conteos = dict.fromkeys(CONDICIONES, 0)
+
+        for fila in filas:
+            subtotal = fila["total"] or Decimal("0")
+            self.total += subtotal
+            self.numero_items += fila["numero_items"]
+            self.nombres_distintos += fila["nombres_distintos"]
+            if fila["categoria"]:
+                self.por_categoria[fila["categoria"]] = subtotal
+            for condicion in CONDICIONES:
+                self.conteos[condicion] += fila[condicion]
+
+    @classmethod
+    def de_lista(cls, lista):
+        filas = (
+            lista.items.order_by()
+            .values("categoria")
+            .annotate(
+                total=Sum(SUBTOTAL_ITEM),
+                numero_items=Count("id"),
+                nombres_distintos=Count("nombre", distinct=True),
+                **{c: Count("id", filter=q) for c, (q, _) in CONDICIONES.items()},
+            )
+        )
+        return cls(filas, lista=lista)
+
+    @classmethod
+    def de_items(cls, items):
+        """
+        Las mismas filas que de_lista, calculadas en Python sobre items ya
+        cargados (p.ej. con prefetch_related), sin ir a la base de datos.
+        """
+        items = sorted(items, key=lambda i: (i.fecha_agregado, i.pk))
+        grupos = {}
+        for item in items:
+            fila = grupos.get(item.categoria)
+            if fila is None:
+                fila = grupos[item.categoria] = {
+                    "categoria": item.categoria,
+                    "total": Decimal("0"),
+                    "numero_items": 0,
+                    "nombres": set(),
+                    **dict.fromkeys(CONDICIONES, 0),
+                }
+            fila["total"] += item.cantidad * item.precio_unitario
+            fila["numero_items"] += 1
+            fila["nombres"].add(item.nombre)
+            for condicion, (_, cumple) in CONDICIONES.items():
+                if cumple(item):
+                    fila[condicion] += 1
+
+        filas = list(grupos.values())
+        for fila in filas:
+            fila["nombres_distintos"] = len(fila.pop("nombres"))
+        return cls(filas, items=items)
+
+    def primer_item(self, condicion):
+        """
+        El primer item (en ORDEN_ITEMS) que cumple la condición, como dict
+        con nombre, cantidad y precio_unitario; None si no hay ninguno.
+        """
+        if not self.conteos[condicion]:
+            return None
+        q, cumple = CONDICIONES[condicion]
+        if self.items is not None:
+            for item in self.items:
+                if cumple(item):
+                    return {
+                        "nombre": item.nombre,
+                        "cantidad": item.cantidad,
+                        "precio_unitario": item.precio_unitario,
+                    }
+            return None
+        return (
+            self.lista.items.filter(q)
+            .order_by(*ORDEN_ITEMS)
+            .values("nombre", "cantidad", "precio_unitario")
+            .first()
+        )
+
+    def primera_categoria(self, categorias):
+        """
+        De varias categorías empatadas, la del primer item en ORDEN_ITEMS
+        (la que el motor anterior habría visto primero).
+        """
+        if self.items is not None:
+            return next(i.categoria for i in self.items if i.categoria in categorias)
+        return (
+            self.lista.items.filter(categoria__in=categorias)
+            .order_by(*ORDEN_ITEMS)
+            .values_list("categoria", flat=True)
+            .first()
+        )
+
+    def nombres_en_orden(self):
+        if self.items is not None:
+            return [i.nombre for i in self.items]
+        return list(self.lista.items.order_by(*ORDEN_ITEMS).values_list("nombre", flat=True))
+
+
+# ===========================
+# Reglas
+# ===========================
+class Regla:
+    """
+    Una regla recibe la lista y sus estadísticas y devuelve el texto de la
+    recomendación, o None si no aplica. Para agregar una regla nueva basta
+    con crear una subclase y sumarla a REGLAS.
+    """
+
+    def evaluar(self, lista, stats):
+        raise NotImplementedError
+
+
+class SuperaPresupuesto(Regla):
+    def evaluar(self, lista, stats):
+        if stats.total > lista.presupuesto:
+            return "Has superado el presupuesto, considera reducir gastos."
+
+
+class CategoriaMayorGasto(Regla):
+    def evaluar(self, lista, stats):
+        if stats.por_categoria:
+            mayor = max(stats.por_categoria.values())
+            empatadas = [c for c, total in stats.por_categoria.items() if total == mayor]
+            if len(empatadas) > 1:
+                cat_mayor = stats.primera_categoria(empatadas)
+            else:
+                cat_mayor = empatadas[0]
+            return f"Estás gastando mucho en '{cat_mayor}'."
+
+
+class CantidadAlta(Regla):
+    def evaluar(self, lista, stats):
+        item = stats.primer_item("cantidad_alta")
+        if item is not None:
+            return (
+                f"La cantidad del ítem '{item['nombre']}' es bastante alta. "
+                "Revisa si realmente necesitas tanto."
+            )
+
+
+class PrecioElevado(Regla):
+    def evaluar(self, lista, stats):
+        item = stats.primer_item("precio_elevado")
+        if item is not None:
+            return (
+                f"El ítem '{item['nombre']}' tiene un precio elevado. "
+                "Considera buscar alternativas más económicas."
+            )
+
+
+class PrecioAtipico(Regla):
+    # Item.precio_atipico se marca al escribir el item (ver anomalias.py)
+    def evaluar(self, lista, stats):
+        item = stats.primer_item("precio_atipico")
+        if item is not None:
+            return (
+                f"El precio del ítem '{item['nombre']}' está muy lejos de lo "
+                "que se suele pagar por él. Revisa si lo escribiste bien."
+            )
+
+
+class ItemsDuplicados(Regla):
+    # Con uq_item_nombre_por_lista no debería pasar nunca; sólo si el
+    # agregado lo sugiere se leen los nombres para saber cuáles son.
+    def evaluar(self, lista, stats):
+        if stats.items is None and stats.nombres_distintos >= stats.numero_items:
+            return None
+        veces = {}
+        for nombre in stats.nombres_en_orden():
+            veces[nombre] = veces.get(nombre, 0) + 1
+        duplicados = [nombre for nombre, n in veces.items() if n > 1]
+        if duplicados:
+            return (
+                f"Tienes ítems duplicados en la lista: {', '.join(duplicados)}. "
+                "Elimina uno de ellos para evitar compras innecesarias."
+            )
+
+
+class PocosItems(Regla):
+    def evaluar(self, lista, stats):
+        if stats.numero_items <= POCOS_ITEMS:
+            return "Tu lista tiene pocos ítems. ¿Seguro que no olvidaste agregar algo importante?"
+
+
+class ValoresInvalidos(Regla):
+    # Manda el primer item con algún valor inválido; si tiene los dos, la cantidad
+    def evaluar(self, lista, stats):
+        item = stats.primer_item("valor_invalido")
+        if item is None:
+            return None
+        nombre = item["nombre"] or "(sin nombre)"
+        if item["cantidad"] <= 0:
+            return f"El ítem '{nombre}' tiene una cantidad inválida (debe ser mayor a 0)."
+        return f"El ítem '{nombre}' tiene un precio negativo, revisa su valor."
+
+
+# El orden de esta lista es el orden en que se devuelven los mensajes.
+REGLAS = [
+    SuperaPresupuesto(),
+    CategoriaMayorGasto(),
+    CantidadAlta(),
+    PrecioElevado(),
+    PrecioAtipico(),
+    ItemsDuplicados(),
+    PocosItems(),
+    ValoresInvalidos(),
+]
+
+
+def evaluar_reglas(lista, stats, reglas=None):
+    """
+    Evalúa todas las reglas en una sola pasada sobre las estadísticas.
+    """
+    recomendaciones = []
+    for regla in reglas or REGLAS:
+        mensaje = regla.evaluar(lista, stats)
+        if mensaje:
+            recomendaciones.append(mensaje)
+    return recomendaciones
+
+
+def recomendaciones_para(lista, items=None):
+    """
+    Recomendaciones de una lista, memoizadas por (lista.id, lista.version).
+    Si la versión no cambió no se toca la tabla de items. Si se pasan los
+    items ya cargados, las estadísticas salen de ellos y no de un query.
+    """
+    key = f"recomendaciones:{lista.pk}:{lista.version}"
+    resultado = cache.get(key)
+    if resultado is None:
+        if items is not None:
+            stats = EstadisticasLista.de_items(items)
+        else:
+            stats = EstadisticasLista.de_lista(lista)
+        resultado = evaluar_reglas(lista, stats)
+        cache.set(key, resultado, RECOMENDACIONES_CACHE_TIMEOUT)
+    return resultado
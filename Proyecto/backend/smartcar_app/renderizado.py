@@ -0,0 +1,65 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+
+# ===========================
+# Renderer JSON rápido
+# ===========================
+# Mismo JSON que el JSONRenderer de DRF (compacto, UTF-8, Decimal como
+# número, fechas ISO con 'Z'), pero sin crear un encoder por respuesta.
+# Con orjson instalado el volcado se hace en C; los tipos que orjson no
+# conoce (Decimal, y datetime para conservar el formato de DRF) pasan por
+# el mismo default() que usa DRF.
+
+_default_drf = JSONEncoder().default
+
+# Encoder de la librería estándar reutilizable (usa el acelerador en C
+# cuando no hay indentación)
+_encoder_stdlib = JSONEncoder(ensure_ascii=False, separators=(",", ":"), allow_nan=True)
+
+if orjson is not None:
+    _OPCIONES_ORJSON = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def volcar_json(data, usar_orjson=True):
+    """
+    bytes JSON de 'data' con las mismas reglas que JSONRenderer (compacto).
+    usar_orjson=False fuerza la librería estándar (para comparar).
+    """
+    if orjson is not None and usar_orjson:
+        try:
+            salida = orjson.dumps(data, default=_default_drf, option=_OPCIONES_ORJSON)
+        except TypeError:
+            # p.ej. enteros de más de 64 bits: que lo haga la librería estándar
+            salida = _encoder_stdlib.encode(data).encode()
+    else:
+        salida = _encoder_stdlib.encode(data).encode()
+    # Igual que DRF: \u2028 y \u2029 siempre escapados (JSON válido como JS)
+    if b"\xe2\x80\xa8" in salida or b"\xe2\x80\xa9" in salida:
+        salida = salida.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+    return salida
+
+
+class RenderizadorJSON(JSONRenderer):
+    """
+    JSONRenderer de DRF con volcado rápido. Si se pide indentación
+    (?format=json; indent=4, API navegable) se usa el camino normal de DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return volcar_json(data)
+
+
+# Para comparar en benchmarks
+def volcar_json_drf(data):
+    return JSONRenderer().render(data)
+
@@ -1,3 +1,4 @@
+from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
 from .models import (
     Usuario,
@@ -12,6 +13,8 @@ from .models import (
     RecomendacionItem,
     Dispositivo,
     Evento,
+    KpiDiario,
+    KpiMensualUsuario,
 )
 
 
@@ -25,11 +28,21 @@ class UsuarioSerializer(serializers.ModelSerializer):
             "id",
             "nombre",
             "correo",
-            "contrasena",         # ojo: en un proyecto real se encripta y no se expone
+            "contrasena",         # se guarda con hash y nunca se devuelve
             "moneda_preferida",
             "fecha_registro",
         ]
         read_only_fields = ["id", "fecha_registro"]
+        extra_kwargs = {"contrasena": {"write_only": True}}
+
+    def create(self, validated_data):
+        validated_data["contrasena"] = make_password(validated_data["contrasena"])
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        if "contrasena" in validated_data:
+            validated_data["contrasena"] = make_password(validated_data["contrasena"])
+        return super().update(instance, validated_data)
 
 
 # ===========================
@@ -60,6 +73,14 @@ class ListaSerializer(serializers.ModelSerializer):
             "updated_at",
         ]
 
+    def get_fields(self):
+        fields = super().get_fields()
+        # Con token el dueño sale del token (context["usuario_id"]) y no se
+        # valida contra la tabla usuarios; la vista lo pasa en save().
+        if self.context.get("usuario_id") is not None:
+            fields["usuario"] = serializers.PrimaryKeyRelatedField(read_only=True)
+        return fields
+
 
 # ===========================
 # ITEM
@@ -83,12 +104,14 @@ class ItemSerializer(serializers.ModelSerializer):
             "fecha_comprado",
             "cantidad_comprada",
             "precio_pagado",
+            "precio_atipico",
             "subtotal",
         ]
         read_only_fields = [
             "id",
             "fecha_agregado",
             "fecha_comprado",
+            "precio_atipico",
             "subtotal",
         ]
     def get_subtotal(self, obj):
@@ -98,6 +121,50 @@ class ItemSerializer(serializers.ModelSerializer):
             return 0
 
 
+class ItemConPreciosSerializer(ItemSerializer):
+    """
+    Item más su mejor precio online (MejorPrecio). Para listados conviene
+    select_related("mejor_precio") o la lectura rápida (un solo JOIN).
+    """
+    mejor_precio = serializers.DecimalField(
+        source="mejor_precio.precio", max_digits=10, decimal_places=2, read_only=True
+    )
+    mejor_precio_fuente = serializers.CharField(source="mejor_precio.fuente", read_only=True)
+
+    class Meta(ItemSerializer.Meta):
+        fields = ItemSerializer.Meta.fields + ["mejor_precio", "mejor_precio_fuente"]
+
+
+class ItemBulkSerializer(ItemSerializer):
+    """
+    Filas de /api/items/bulk/. La lista viene una sola vez en el body y la
+    restricción uq_item_nombre_por_lista se revisa en la vista para todo el
+    lote con un solo query, en vez de un query por fila.
+    """
+    class Meta(ItemSerializer.Meta):
+        fields = [f for f in ItemSerializer.Meta.fields if f != "lista"]
+        validators = []
+
+
+# ===========================
+# SYNC (con versión para If-Match; tombstones de lo borrado)
+# ===========================
+class ListaSyncSerializer(ListaSerializer):
+    class Meta(ListaSerializer.Meta):
+        fields = ListaSerializer.Meta.fields + ["version"]
+
+
+class ItemSyncSerializer(ItemSerializer):
+    class Meta(ItemSerializer.Meta):
+        fields = ItemSerializer.Meta.fields + ["version"]
+
+
+class TombstoneSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    version = serializers.IntegerField()
+    deleted_at = serializers.DateTimeField()
+
+
 # ===========================
 # ALERTA
 # ===========================
@@ -230,3 +297,45 @@ class EventoSerializer(serializers.ModelSerializer):
             "ts",
         ]
         read_only_fields = ["id", "ts"]
+
+
+class EventoEntradaSerializer(serializers.ModelSerializer):
+    """
+    Cada evento de POST /api/eventos/. El usuario es el mismo para todo el
+    lote (viene aparte), así que no se valida fila por fila.
+    """
+    class Meta:
+        model = Evento
+        fields = [
+            "tipo",
+            "entidad",
+            "entidad_id",
+            "ts",
+        ]
+        extra_kwargs = {"ts": {"required": False}}
+
+
+# ===========================
+# KPIs
+# ===========================
+class KpiDiarioSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = KpiDiario
+        fields = [
+            "dia",
+            "tipo",
+            "total_eventos",
+            "usuarios_activos",
+        ]
+
+
+class KpiMensualUsuarioSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = KpiMensualUsuario
+        fields = [
+            "usuario",
+            "mes",
+            "tipo",
+            "total_eventos",
+            "dias_activos",
+        ]
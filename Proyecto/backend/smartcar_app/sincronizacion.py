@@ -0,0 +1,92 @@
+import base64
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Item, Lista
+from .purga import limite_retencion
+
+
+# Segundos hacia atrás desde el inicio de la consulta que se devuelven como
+# watermark: cubre escrituras que tomaron su updated_at antes de que
+# empezara el sync pero se confirmaron después. Lo que cae en ese margen
+# llega repetido en el siguiente sync (el cliente aplica por id y version).
+MARGEN = getattr(settings, "SMARTCAR_SYNC_MARGEN", 5)
+
+
+class WatermarkInvalido(ValueError):
+    pass
+
+
+def codificar_watermark(fecha):
+    return base64.urlsafe_b64encode(fecha.isoformat().encode()).decode().rstrip("=")
+
+
+def leer_watermark(watermark):
+    try:
+        relleno = "=" * (-len(watermark) % 4)
+        fecha = parse_datetime(base64.urlsafe_b64decode(watermark + relleno).decode())
+    except (ValueError, TypeError, UnicodeDecodeError):
+        fecha = None
+    if fecha is None:
+        raise WatermarkInvalido("Watermark inválido.")
+    return fecha
+
+
+def cambios_desde(usuario_id, desde=None):
+    """
+    Lo que cambió en las listas del usuario después de 'desde' (None = todo):
+
+        {"listas": [...], "items": [...],
+         "listas_eliminadas": [...], "items_eliminados": [...],
+         "completo": bool, "watermark": <fecha para el siguiente sync>}
+
+    Si 'desde' es más viejo que la retención de los tombstones (ver
+    purga.py) puede que falten borrados ya purgados: se devuelve todo con
+    completo=True y el cliente reemplaza su copia local.
+
+    Cualquier escritura de un item también actualiza Lista.updated_at, así
+    que primero se buscan las listas cambiadas con el índice
+    (usuario, updated_at) y sólo en esas se buscan items con
+    (lista, updated_at). Sin cambios es una sola lectura de índice. Las
+    listas e items borrados (deleted_at) salen como tombstones.
+    """
+    watermark = timezone.now() - timedelta(seconds=MARGEN)
+
+    if desde is not None and desde < limite_retencion():
+        desde = None
+
+    if desde is None:
+        listas = list(Lista.objects.filter(usuario_id=usuario_id).order_by("id"))
+        items = list(
+            Item.objects.filter(lista__in=[l.pk for l in listas]).order_by("lista_id", "id")
+        )
+        return {
+            "listas": listas,
+            "items": items,
+            "listas_eliminadas": [],
+            "items_eliminados": [],
+            "completo": True,
+            "watermark": watermark,
+        }
+
+    listas = list(
+        Lista.todos.filter(usuario_id=usuario_id, updated_at__gt=desde).order_by("id")
+    )
+    items = []
+    if listas:
+        items = list(
+            Item.todos.filter(
+                lista_id__in=[l.pk for l in listas], updated_at__gt=desde
+            ).order_by("lista_id", "id")
+        )
+    return {
+        "listas": [l for l in listas if l.deleted_at is None],
+        "items": [i for i in items if i.deleted_at is None],
+        "listas_eliminadas": [l for l in listas if l.deleted_at is not None],
+        "items_eliminados": [i for i in items if i.deleted_at is not None],
+        "completo": False,
+        "watermark": watermark,
+    }
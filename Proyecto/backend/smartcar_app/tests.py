@@ -1,3 +1,1936 @@
+import asyncio
+import base64
+import gzip
+import itertools
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock, skipIf
+
+from django.apps import apps
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from . import columnar, compresion
+from .alertas import evaluar_alerta
+from .anomalias import actualizar_referencias, es_atipico, estadisticos
+from .autenticacion import UsuarioAutenticado, emitir_token, principales
+from .compresion import elegir_codificacion
+from .eventos import BufferEventos, ColaLlena
+from .gastos import mes_de, reconstruir_historial
+from .lectura_rapida import LECTURA_ITEMS, LECTURA_LISTAS
+from .management.commands.explicar_indices import consultas_calientes
+from .models import (
+    Alerta,
+    Compra,
+    Dispositivo,
+    Evento,
+    Historial,
+    HistorialCategoria,
+    Item,
+    KpiDiario,
+    KpiMensualUsuario,
+    KpiWatermark,
+    Lista,
+    MejorPrecio,
+    NotificacionPush,
+    PrecioOnline,
+    PrecioVigente,
+    PreferenciasAlertas,
+    Recomendacion,
+    ReferenciaPrecio,
+    Usuario,
+    WatermarkReferencia,
+)
+from .optimizador import mochila_exacta, mochila_voraz
+from .precios import (
+    CONCURRENCIA,
+    FALLOS_PARA_ABRIR,
+    FuenteLocal,
+    FuentePrecio,
+    _circuitos,
+    actualizar_precios_lista,
+    circuito_de,
+    clave_cache,
+    normalizar_nombre,
+    precios_por_nombre,
+    reconstruir_precios_vigentes,
+    registrar_precios,
+)
+from .purga import limite_retencion, pendientes_de_purga, purgar_lote
+from .push import (
+    PROVEEDORES,
+    LimitadorTasa,
+    ProveedorFalso,
+    _proveedores,
+    despachar_pendientes,
+    encolar_push,
+    limitador_de,
+    proveedor_para,
+)
+from .reglas import EstadisticasLista, evaluar_reglas
+from .renderizado import volcar_json
+from .serializers import ItemConPreciosSerializer, ItemSerializer, ListaSerializer
+from .sincronizacion import codificar_watermark
+from .totales import SUBTOTAL_ITEM, recalcular_total
+
+
+def autenticar(client, usuario):
+    """
+    Manda el token del usuario en todas las peticiones del cliente, con su
+    principal ya en la cache (así no suma queries a las mediciones).
+    """
+    principales.set(usuario.pk, UsuarioAutenticado(usuario))
+    client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {emitir_token(usuario)}"
+
+
+class UsuarioTestCase(TestCase):
+    """
+    Base de los tests: crea cls.usuario, el dueño de los datos de cada test,
+    y deja el cliente autenticado como él.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create(nombre="Ana", correo="ana@test.com", contrasena="x")
+
+    def setUp(self):
+        autenticar(self.client, self.usuario)
+
+
+class TotalesTests(UsuarioTestCase):
+    """
+    Agregados de Lista mantenidos por deltas en cada escritura de item, y
+    reconciliar_totales para repararlos.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.lista = Lista.objects.create(usuario=self.usuario, nombre="Mercado")
+
+    def crear_item(self, nombre, cantidad, precio):
+        respuesta = self.client.post(
+            "/api/items/",
+            {"lista": self.lista.pk, "nombre": nombre, "cantidad": cantidad, "precio_unitario": precio},
+            content_type="application/json",
+        )
+        self.assertEqual(respuesta.status_code, 201)
+        return respuesta.json()["id"]
+
+    def guardados(self):
+        self.lista.refresh_from_db()
+        return (
+            self.lista.total_calculado,
+            self.lista.numero_items,
+            self.lista.items_comprados,
+            self.lista.total_pendiente,
+        )
+
+    def assertTotalesAlDia(self, esperados):
+        self.assertEqual(self.guardados(), tuple(Decimal(str(v)) for v in esperados))
+        self.assertTrue(self.lista.resumen_al_dia)
+
+    def test_deltas_en_cada_escritura(self):
+        arroz = self.crear_item("arroz", "2", "1500")
+        self.assertTotalesAlDia((3000, 1, 0, 3000))
+        huevos = self.crear_item("huevos", "1", "800")
+        self.assertTotalesAlDia((3800, 2, 0, 3800))
+
+        respuesta = self.client.put(
+            f"/api/items/{arroz}/", {"cantidad": "3", "comprado": True}, content_type="application/json"
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTotalesAlDia((5300, 2, 1, 800))
+
+        self.assertEqual(self.client.delete(f"/api/items/{huevos}/").status_code, 200)
+        self.assertTotalesAlDia((4500, 1, 1, 0))
+
+    def test_reconciliar_totales(self):
+        self.crear_item("arroz", "2", "1500")
+        version = Lista.objects.get(pk=self.lista.pk).version
+        Lista.objects.filter(pk=self.lista.pk).update(total_calculado=Decimal("1"), numero_items=9)
+
+        call_command("reconciliar_totales", dry_run=True, stdout=StringIO())
+        self.assertEqual(self.guardados()[:2], (Decimal("1"), 9))
+
+        salida = StringIO()
+        call_command("reconciliar_totales", stdout=salida)
+        self.assertIn("1 reparadas", salida.getvalue())
+        self.assertTotalesAlDia((3000, 1, 0, 3000))
+        self.assertEqual(self.lista.version, version + 1)
+
+
+def recomendaciones_motor_anterior(lista, items):
+    """
+    El cálculo de GET /api/recomendaciones/ antes de reglas.py, tal cual,
+    sobre los items en el orden en que los recorría (fecha_agregado, id).
+    """
+    recomendaciones = []
+    total = sum(i.cantidad * i.precio_unitario for i in items)
+    if total > lista.presupuesto:
+        recomendaciones.append("Has superado el presupuesto, considera reducir gastos.")
+    categorias = {}
+    for i in items:
+        if i.categoria:
+            categorias[i.categoria] = categorias.get(i.categoria, 0) + i.cantidad * i.precio_unitario
+    if categorias:
+        recomendaciones.append(f"Estás gastando mucho en '{max(categorias, key=categorias.get)}'.")
+    for i in items:
+        if i.cantidad >= 10:
+            recomendaciones.append(
+                f"La cantidad del ítem '{i.nombre}' es bastante alta. Revisa si realmente necesitas tanto."
+            )
+            break
+    for i in items:
+        if i.precio_unitario > 30000:
+            recomendaciones.append(
+                f"El ítem '{i.nombre}' tiene un precio elevado. Considera buscar alternativas más económicas."
+            )
+            break
+    nombres = {}
+    for i in items:
+        nombres[i.nombre] = nombres.get(i.nombre, 0) + 1
+    duplicados = [n for n, count in nombres.items() if count > 1]
+    if duplicados:
+        recomendaciones.append(
+            f"Tienes ítems duplicados en la lista: {', '.join(duplicados)}. "
+            "Elimina uno de ellos para evitar compras innecesarias."
+        )
+    if len(items) <= 2:
+        recomendaciones.append(
+            "Tu lista tiene pocos ítems. ¿Seguro que no olvidaste agregar algo importante?"
+        )
+    for i in items:
+        if i.cantidad <= 0:
+            recomendaciones.append(
+                f"El ítem '{i.nombre or '(sin nombre)'}' tiene una cantidad inválida (debe ser mayor a 0)."
+            )
+            break
+        if i.precio_unitario < 0:
+            recomendaciones.append(
+                f"El ítem '{i.nombre or '(sin nombre)'}' tiene un precio negativo, revisa su valor."
+            )
+            break
+    return recomendaciones
+
+
+class ReglasTests(UsuarioTestCase):
+    """
+    reglas.py da los mismos mensajes, en el mismo orden, que el cálculo
+    anterior, tanto desde el query agregado como desde items ya cargados.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.lista = Lista.objects.create(
+            usuario=self.usuario, nombre="Quincena", presupuesto=Decimal("50000")
+        )
+        self.hace_una_hora = timezone.now() - timedelta(hours=1)
+
+    def crear(self, *filas):
+        # En orden de llegada, con fechas crecientes; los nombres van al revés
+        # del alfabeto para que "el primero" no coincida con el menor nombre
+        for minuto, (nombre, categoria, cantidad, precio) in enumerate(filas):
+            item = Item.objects.create(
+                lista=self.lista,
+                nombre=nombre,
+                categoria=categoria,
+                cantidad=Decimal(cantidad),
+                precio_unitario=Decimal(precio),
+            )
+            Item.objects.filter(pk=item.pk).update(
+                fecha_agregado=self.hace_una_hora + timedelta(minutes=minuto)
+            )
+        recalcular_total(self.lista)
+
+    def assertIgualAlMotorAnterior(self, esperado):
+        self.lista.refresh_from_db()
+        items = list(self.lista.items.order_by("fecha_agregado", "id"))
+        self.assertEqual(recomendaciones_motor_anterior(self.lista, items), esperado)
+        respuesta = self.client.get(f"/api/recomendaciones/{self.lista.pk}/")
+        self.assertEqual(respuesta.json(), esperado)
+        # Desde items ya cargados (y en otro orden) sale lo mismo
+        stats = EstadisticasLista.de_items(list(reversed(items)))
+        self.assertEqual(evaluar_reglas(self.lista, stats), esperado)
+
+    def test_primer_item_de_cada_regla(self):
+        self.crear(
+            ("zanahoria", "Verduras", "12", "1000"),
+            ("yogur", "Lácteos", "1", "40000"),
+            ("arroz", "Granos", "15", "35000"),
+            ("vino", "Lácteos", "-1", "1"),
+        )
+        self.assertIgualAlMotorAnterior(
+            [
+                "Has superado el presupuesto, considera reducir gastos.",
+                "Estás gastando mucho en 'Granos'.",
+                "La cantidad del ítem 'zanahoria' es bastante alta. Revisa si realmente necesitas tanto.",
+                "El ítem 'yogur' tiene un precio elevado. Considera buscar alternativas más económicas.",
+                "El ítem 'vino' tiene una cantidad inválida (debe ser mayor a 0).",
+            ]
+        )
+
+    def test_valores_invalidos_manda_el_primer_item(self):
+        # El precio negativo llega antes que la cantidad en cero
+        self.crear(("sal", None, "1", "-5"), ("pan", None, "0", "100"), ("te", None, "1", "1"))
+        self.assertIgualAlMotorAnterior(
+            ["El ítem 'sal' tiene un precio negativo, revisa su valor."]
+        )
+
+    def test_empate_de_categorias_y_pocos_items(self):
+        self.crear(("pera", "Frutas", "1", "300"), ("jabon", "Aseo", "2", "150"))
+        self.assertIgualAlMotorAnterior(
+            [
+                "Estás gastando mucho en 'Frutas'.",
+                "Tu lista tiene pocos ítems. ¿Seguro que no olvidaste agregar algo importante?",
+            ]
+        )
+
+    def test_duplicados_en_orden_de_llegada(self):
+        # uq_item_nombre_por_lista no deja guardarlos: sólo con items en memoria
+        ahora = timezone.now()
+        items = [
+            Item(
+                pk=pk,
+                lista=self.lista,
+                nombre=nombre,
+                categoria=categoria,
+                precio_unitario=Decimal("10"),
+                fecha_agregado=ahora + timedelta(minutes=pk),
+            )
+            for pk, nombre, categoria in ((1, "te", "A"), (2, "cafe", "B"), (3, "te", "B"), (4, "cafe", "A"))
+        ]
+        esperado = recomendaciones_motor_anterior(self.lista, items)
+        self.assertIn(
+            "Tienes ítems duplicados en la lista: te, cafe. "
+            "Elimina uno de ellos para evitar compras innecesarias.",
+            esperado,
+        )
+        stats = EstadisticasLista.de_items(list(reversed(items)))
+        self.assertEqual(evaluar_reglas(self.lista, stats), esperado)
+
+
+class ResumenTests(UsuarioTestCase):
+    """
+    /api/resumen_lista/ y /api/resumen_listas/ salen de los agregados
+    guardados, sin recorrer los items salvo en listas desfasadas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lista = Lista.objects.create(
+            usuario=cls.usuario,
+            nombre="Mes",
+            presupuesto=Decimal("5000"),
+            total_calculado=Decimal("6000"),
+            numero_items=2,
+            items_comprados=1,
+            total_pendiente=Decimal("2000"),
+        )
+
+    def test_resumen_con_un_select(self):
+        with self.assertNumQueries(1):
+            data = self.client.get(f"/api/resumen_lista/{self.lista.pk}/").json()
+        self.assertEqual(Decimal(str(data["total"])), Decimal("6000"))
+        self.assertTrue(data["supera_presupuesto"])
+        self.assertEqual((data["numero_items"], data["items_comprados"]), (2, 1))
+
+    def test_lista_desfasada_se_recalcula(self):
+        desfasada = Lista.objects.create(usuario=self.usuario, nombre="Vieja", resumen_al_dia=False)
+        Item.objects.create(lista=desfasada, nombre="pan", cantidad=Decimal("2"), precio_unitario=Decimal("700"))
+
+        url = "/api/resumen_listas/"
+        resumenes = {r["lista_id"]: r for r in self.client.get(url).json()["resumenes"]}
+        self.assertEqual(Decimal(str(resumenes[desfasada.pk]["total"])), Decimal("1400"))
+        self.assertEqual(Decimal(str(resumenes[self.lista.pk]["total"])), Decimal("6000"))
+
+        data = self.client.get(f"/api/resumen_lista/{desfasada.pk}/").json()
+        self.assertEqual((Decimal(str(data["total_pendiente"])), data["numero_items"]), (Decimal("1400"), 1))
+        desfasada.refresh_from_db()
+        self.assertTrue(desfasada.resumen_al_dia)
+
+
+class ItemsBulkTests(UsuarioTestCase):
+    """
+    POST /api/items/bulk/: todo o nada con errores por fila, y un solo
+    recálculo del total de la lista.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.lista = Lista.objects.create(usuario=self.usuario, nombre="Compras")
+        self.arroz = Item.objects.create(lista=self.lista, nombre="arroz", precio_unitario=Decimal("2000"))
+        self.sal = Item.objects.create(lista=self.lista, nombre="sal", precio_unitario=Decimal("900"))
+
+    def bulk(self, **datos):
+        return self.client.post(
+            "/api/items/bulk/", dict(datos, lista_id=self.lista.pk), content_type="application/json"
+        )
+
+    def test_errores_por_fila_sin_escribir_nada(self):
+        respuesta = self.bulk(
+            crear=[{"nombre": "pan", "precio_unitario": "500"}, {"nombre": "arroz"}],
+            actualizar=[{"id": self.arroz.pk, "cantidad": "x"}, {"id": 999999}],
+            eliminar=[self.sal.pk, 424242],
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        errores = respuesta.json()["errores"]
+        self.assertEqual(errores["crear"][0], {})
+        self.assertIn("nombre", errores["crear"][1])
+        self.assertIn("cantidad", errores["actualizar"][0])
+        self.assertIn("id", errores["actualizar"][1])
+        self.assertEqual(errores["eliminar"], [{}, {"id": ["El item no existe en esta lista."]}])
+        self.assertEqual(
+            sorted(Item.objects.filter(lista=self.lista).values_list("nombre", flat=True)),
+            ["arroz", "sal"],
+        )
+
+
+    def test_ids_bool_son_error_de_fila(self):
+        # True == 1: no debe tomarse como el id de ningún item
+        Item.objects.filter(pk=self.arroz.pk).update(id=1)
+        respuesta = self.bulk(
+            actualizar=[{"id": True, "nombre": "sal"}], eliminar=[True, False]
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        errores = respuesta.json()["errores"]
+        self.assertEqual(errores["actualizar"], [{"id": ["El id debe ser un entero."]}])
+        self.assertEqual(errores["eliminar"], [{"id": ["El id debe ser un entero."]}] * 2)
+        self.assertEqual(Item.objects.filter(lista=self.lista).count(), 2)
+    def test_lote_valido_con_un_solo_recalculo(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.bulk(
+                crear=[{"nombre": "pan", "cantidad": "2", "precio_unitario": "500"}],
+                actualizar=[{"id": self.arroz.pk, "comprado": True}],
+                eliminar=[self.sal.pk],
+            )
+        self.assertEqual(respuesta.status_code, 200)
+        data = respuesta.json()
+        self.assertEqual(data["eliminados"], [self.sal.pk])
+        self.assertEqual(Decimal(str(data["total_calculado"])), Decimal("3000"))
+        sumas = [
+            c["sql"] for c in consultas.captured_queries
+            if c["sql"].startswith("SELECT CAST(SUM(") and 'FROM "items"' in c["sql"]
+        ]
+        self.assertEqual(len(sumas), 1)
+
+        self.lista.refresh_from_db()
+        self.assertEqual((self.lista.numero_items, self.lista.items_comprados), (2, 1))
+        self.assertTrue(Item.todos.get(pk=self.sal.pk).deleted_at)
+
+
+class PaginacionTests(UsuarioTestCase):
+    """
+    Paginación por cursor: empates de fecha en el corte entre páginas, la
+    última página y cursores rotos o manipulados.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.lista = Lista.objects.create(usuario=self.usuario, nombre="Larga")
+        Item.objects.bulk_create(Item(lista=self.lista, nombre=f"item {i}") for i in range(7))
+        # Todos con la misma fecha: cada corte cae entre dos items empatados
+        Item.objects.update(fecha_agregado=timezone.now() - timedelta(hours=1))
+        self.url = f"/api/items/?lista_id={self.lista.pk}"
+
+    def recorrer(self, url, clave, page_size):
+        paginas, cursor = [], None
+        while True:
+            sufijo = f"&cursor={cursor}" if cursor else ""
+            separador = "&" if "?" in url else "?"
+            respuesta = self.client.get(f"{url}{separador}page_size={page_size}{sufijo}")
+            self.assertEqual(respuesta.status_code, 200)
+            data = respuesta.json()
+            paginas.append([fila["id"] for fila in data[clave]])
+            cursor = data["siguiente_cursor"]
+            if cursor is None:
+                return paginas
+
+    def test_fecha_igual_a_los_dos_lados_del_corte(self):
+        ids = list(Item.objects.order_by("id").values_list("id", flat=True))
+        paginas = self.recorrer(self.url, "items", 3)
+        self.assertEqual(paginas, [ids[:3], ids[3:6], ids[6:]])
+
+        ahora = timezone.now()
+        for i in range(5):
+            Lista.objects.create(usuario=self.usuario, nombre=f"otra {i}")
+        Lista.objects.update(fecha_creacion=ahora)
+        ids = list(Lista.objects.order_by("-id").values_list("id", flat=True))
+        paginas = self.recorrer("/api/listas/", "listas", 2)
+        self.assertEqual(paginas, [ids[:2], ids[2:4], ids[4:]])
+
+    def test_ultima_pagina(self):
+        # Página final justa: el cursor de la anterior lleva a una sin siguiente
+        paginas = self.recorrer(self.url, "items", 7)
+        self.assertEqual([len(p) for p in paginas], [7])
+        paginas = self.recorrer(self.url, "items", 6)
+        self.assertEqual([len(p) for p in paginas], [6, 1])
+
+        ultimo = Item.objects.latest("id")
+        cursor = base64.urlsafe_b64encode(
+            json.dumps([ultimo.fecha_agregado.isoformat(), ultimo.pk]).encode()
+        ).decode()
+        data = self.client.get(f"{self.url}&cursor={cursor}").json()
+        self.assertEqual((data["items"], data["siguiente_cursor"]), ([], None))
+
+    def test_cursor_invalido_400(self):
+        def cursor(valor):
+            return base64.urlsafe_b64encode(valor).decode().rstrip("=")
+
+        fecha = timezone.now().isoformat()
+        for malo in (
+            "no es base64!",
+            "e30",
+            cursor(b"\xff\xfe"),
+            cursor(b"{}"),
+            cursor(b"[1, 2]"),
+            cursor(json.dumps(["ayer", 1]).encode()),
+            cursor(json.dumps([fecha, "7"]).encode()),
+            cursor(json.dumps(["2025-13-45T00:00:00", 1]).encode()),
+            cursor(json.dumps([fecha, 2 ** 70]).encode()),
+        ):
+            respuesta = self.client.get(f"{self.url}&cursor={malo}")
+            self.assertEqual(respuesta.status_code, 400, malo)
+        for page_size in ("0", "x"):
+            respuesta = self.client.get(f"{self.url}&page_size={page_size}")
+            self.assertEqual(respuesta.status_code, 400, page_size)
+
+
+class ExplicarIndicesTests(TestCase):
+    """
+    explicar_indices sobre la base de tests (con todas las migraciones):
+    ninguna consulta caliente recorre una tabla ni ordena aparte.
+    """
+
+    def test_consultas_calientes_usan_indices(self):
+        # Con algún SCAN o TEMP B-TREE el comando termina en CommandError
+        salida = StringIO()
+        call_command("explicar_indices", stdout=salida)
+        self.assertNotIn("[X]", salida.getvalue())
+        self.assertEqual(salida.getvalue().count("[OK]"), len(consultas_calientes()))
+
+
+class BufferGrabado(BufferEventos):
+    """
+    BufferEventos que anota los lotes en vez de escribirlos: el hilo de
+    fondo no comparte la transacción del test.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.lotes = []
+        self.soltar = threading.Event()
+        self.soltar.set()
+
+    def _guardar(self, lote):
+        self.soltar.wait(5)
+        self.lotes.append(len(lote))
+        return len(lote)
+
+
+class BufferEventosTests(TestCase):
+    """
+    El hilo de fondo escribe por tamaño de lote o por intervalo, vacía todo
+    al detenerse y la cola llena rechaza el lote completo.
+    """
+
+    def buffer(self, **kwargs):
+        buffer = BufferGrabado(**kwargs)
+        self.addCleanup(buffer.detener)
+        return buffer
+
+    def eventos(self, n):
+        return [Evento(usuario_id=1, tipo="ABRE_APP") for _ in range(n)]
+
+    def esperar(self, condicion):
+        limite = time.monotonic() + 5
+        while not condicion():
+            self.assertLess(time.monotonic(), limite, "el hilo de eventos no escribió a tiempo")
+            time.sleep(0.01)
+
+    def test_lotes_por_tamano(self):
+        buffer = self.buffer(tamano_lote=5, intervalo=60)
+        buffer.encolar(self.eventos(3))
+        time.sleep(0.05)
+        self.assertEqual((buffer.lotes, buffer.pendientes()), ([], 3))
+
+        buffer.encolar(self.eventos(9))
+        self.esperar(lambda: sum(buffer.lotes) == 12)
+        self.assertEqual(buffer.lotes, [5, 5, 2])
+
+    def test_lote_por_intervalo(self):
+        buffer = self.buffer(tamano_lote=100, intervalo=0.05)
+        buffer.encolar(self.eventos(3))
+        self.esperar(lambda: buffer.lotes == [3])
+        self.assertEqual(buffer.pendientes(), 0)
+
+    def test_detener_vacia_lo_pendiente(self):
+        buffer = self.buffer(tamano_lote=100, intervalo=60)
+        buffer.encolar(self.eventos(4))
+        hilo = buffer._hilo
+        buffer.detener()
+        self.assertFalse(hilo.is_alive())
+        self.assertEqual((buffer.lotes, buffer.pendientes()), ([4], 0))
+
+        # Encolar de nuevo arranca otro hilo
+        buffer.encolar(self.eventos(1))
+        self.assertIsNot(buffer._hilo, hilo)
+
+    def test_detener_con_el_hilo_ocupado(self):
+        buffer = self.buffer(tamano_lote=2, intervalo=60)
+        buffer.soltar.clear()
+        buffer.encolar(self.eventos(2))
+        self.esperar(lambda: buffer.pendientes() == 0)
+        hilo = buffer._hilo
+
+        with self.assertLogs("smartcar_app.eventos", "WARNING"):
+            buffer.detener(timeout=0.05)
+        self.assertTrue(hilo.is_alive())
+        # Sigue siendo el único consumidor de la cola
+        buffer.encolar(self.eventos(1))
+        self.assertIs(buffer._hilo, hilo)
+
+        buffer.soltar.set()
+        buffer.detener()
+        self.assertFalse(hilo.is_alive())
+        self.assertEqual(buffer.lotes, [2, 1])
+
+    def test_cola_llena_rechaza_el_lote_completo(self):
+        buffer = self.buffer(capacidad=5, tamano_lote=100, intervalo=60)
+        buffer.encolar(self.eventos(3))
+        with self.assertRaises(ColaLlena):
+            buffer.encolar(self.eventos(3))
+        self.assertEqual(buffer.pendientes(), 3)
+        self.assertEqual(buffer.encolar(self.eventos(2)), 2)
+
+        buffer.detener()
+        self.assertEqual(buffer.lotes, [5])
+
+
+class CondicionalTests(UsuarioTestCase):
+    """
+    ETag / If-None-Match e If-Modified-Since (304) e If-Match / version
+    (409) en listas e items.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.lista = Lista.objects.create(usuario=self.usuario, nombre="Casa")
+        self.item = Item.objects.create(lista=self.lista, nombre="sal", precio_unitario=Decimal("900"))
+
+    def put(self, url, datos, **headers):
+        return self.client.put(url, datos, content_type="application/json", headers=headers)
+
+    def test_304_con_if_none_match(self):
+        for url in (f"/api/listas/{self.lista.pk}/", f"/api/items/{self.item.pk}/"):
+            etag = self.client.get(url)["ETag"]
+            respuesta = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(respuesta.status_code, 304)
+            self.assertEqual(respuesta["ETag"], etag)
+
+    def test_items_de_la_lista_condicionales(self):
+        url = f"/api/items/?lista_id={self.lista.pk}"
+        etag = self.client.get(url)["ETag"]
+        self.assertNotEqual(etag, self.client.get(url + "&page_size=1")["ETag"])
+
+        with self.assertNumQueries(1):  # sólo version/updated_at de la lista
+            self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+
+        # Cualquier escritura de un item cambia la versión de la lista
+        self.put(f"/api/items/{self.item.pk}/", {"cantidad": "2"})
+        respuesta = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta["ETag"], etag)
+
+    def test_if_modified_since_solo_con_segundos_cerrados(self):
+        url = f"/api/listas/{self.lista.pk}/"
+
+        def get(desde):
+            return self.client.get(url, headers={"If-Modified-Since": desde}).status_code
+
+        # Otra escritura en este mismo segundo tendría el mismo Last-Modified
+        self.assertEqual(get(self.client.get(url)["Last-Modified"]), 200)
+        self.assertEqual(get(http_date(time.time() + 60)), 200)
+
+        Lista.objects.filter(pk=self.lista.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(get(http_date(time.time())), 304)
+        self.assertEqual(get(self.client.get(url)["Last-Modified"]), 200)
+
+    def test_put_sin_version_devuelve_validadores_al_dia(self):
+        for modelo, pk, url in (
+            (Lista, self.lista.pk, f"/api/listas/{self.lista.pk}/"),
+            (Item, self.item.pk, f"/api/items/{self.item.pk}/"),
+        ):
+            respuesta = self.put(url, {"nombre": "nuevo"})
+            self.assertEqual(respuesta.status_code, 200)
+            version = modelo.objects.get(pk=pk).version
+            self.assertEqual(respuesta["ETag"].strip('"').split("-")[1], str(version))
+            # El ETag devuelto es el mismo que daría un GET y sirve de If-Match
+            self.assertEqual(respuesta["ETag"], self.client.get(url)["ETag"])
+            respuesta = self.put(url, {"nombre": "otro"}, **{"If-Match": respuesta["ETag"]})
+            self.assertEqual(respuesta.status_code, 200)
+
+    def test_if_match_viejo_409(self):
+        for url in (f"/api/listas/{self.lista.pk}/", f"/api/items/{self.item.pk}/"):
+            viejo = self.client.get(url)["ETag"]
+            self.assertEqual(self.put(url, {"nombre": "a"}, **{"If-Match": viejo}).status_code, 200)
+
+            respuesta = self.put(url, {"nombre": "b"}, **{"If-Match": viejo})
+            self.assertEqual(respuesta.status_code, 409)
+            self.assertEqual(respuesta.json()["actual"]["nombre"], "a")
+            self.assertEqual(respuesta["ETag"], self.client.get(url)["ETag"])
+            self.assertEqual(self.put(url, {"nombre": "b", "version": 1}).status_code, 409)
+            respuesta = self.client.delete(url, headers={"If-Match": viejo})
+            self.assertEqual(respuesta.status_code, 409)
+        self.assertTrue(Item.objects.filter(pk=self.item.pk).exists())
+        self.assertTrue(Lista.objects.filter(pk=self.lista.pk).exists())
+
+        self.assertEqual(self.put(f"/api/listas/{self.lista.pk}/", {"version": "x"}).status_code, 400)
+
+
+class SyncTests(UsuarioTestCase):
+    """
+    Borrado lógico y GET /api/sync/: deltas con tombstones desde el
+    watermark anterior, o todo con completo=true.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.lista = Lista.objects.create(usuario=self.usuario, nombre="Semana")
+        self.leche = Item.objects.create(lista=self.lista, nombre="leche", precio_unitario=Decimal("1000"))
+        self.pan = Item.objects.create(lista=self.lista, nombre="pan", precio_unitario=Decimal("500"))
+        # Todo esto ya lo tiene el cliente desde antes del primer sync
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        Lista.objects.update(updated_at=hace_una_hora)
+        Item.objects.update(updated_at=hace_una_hora)
+
+    def sync(self, desde=None):
+        params = {"desde": desde} if desde else {}
+        respuesta = self.client.get("/api/sync/", params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_borrar_y_volver_a_crear_con_el_mismo_nombre(self):
+        self.assertEqual(self.client.delete(f"/api/items/{self.pan.pk}/").status_code, 200)
+        borrado = Item.todos.get(pk=self.pan.pk)
+        self.assertIsNotNone(borrado.deleted_at)
+        self.assertFalse(Item.objects.filter(pk=self.pan.pk).exists())
+
+        # uq_item_nombre_por_lista sólo cuenta los vigentes
+        respuesta = self.client.post(
+            "/api/items/",
+            {"lista": self.lista.pk, "nombre": "pan", "precio_unitario": "600"},
+            content_type="application/json",
+        )
+        self.assertEqual(respuesta.status_code, 201)
+        respuesta = self.client.post(
+            "/api/items/",
+            {"lista": self.lista.pk, "nombre": "pan", "precio_unitario": "600"},
+            content_type="application/json",
+        )
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_deltas_y_tombstones(self):
+        primero = self.sync()
+        self.assertTrue(primero["completo"])
+        self.assertEqual([l["id"] for l in primero["listas"]], [self.lista.pk])
+        self.assertEqual({i["nombre"] for i in primero["items"]}, {"leche", "pan"})
+
+        # Sin cambios no llega nada
+        vacio = self.sync(primero["watermark"])
+        self.assertFalse(vacio["completo"])
+        self.assertEqual((vacio["listas"], vacio["items"], vacio["items_eliminados"]), ([], [], []))
+
+        self.client.put(
+            f"/api/items/{self.leche.pk}/", {"cantidad": "2"}, content_type="application/json"
+        )
+        self.client.delete(f"/api/items/{self.pan.pk}/")
+        delta = self.sync(primero["watermark"])
+        self.assertFalse(delta["completo"])
+        self.assertEqual([(i["id"], i["version"]) for i in delta["items"]], [(self.leche.pk, 2)])
+        self.assertEqual(
+            [(t["id"], t["version"]) for t in delta["items_eliminados"]], [(self.pan.pk, 2)]
+        )
+        self.assertIsNotNone(delta["items_eliminados"][0]["deleted_at"])
+        self.assertEqual([l["id"] for l in delta["listas"]], [self.lista.pk])
+
+        self.client.delete(f"/api/listas/{self.lista.pk}/")
+        delta = self.sync(primero["watermark"])
+        self.assertEqual(delta["listas"], [])
+        self.assertEqual([t["id"] for t in delta["listas_eliminadas"]], [self.lista.pk])
+        self.assertEqual(
+            {t["id"] for t in delta["items_eliminados"]}, {self.leche.pk, self.pan.pk}
+        )
+
+    def test_watermark_invalido_o_mas_viejo_que_la_retencion(self):
+        respuesta = self.client.get("/api/sync/", {"desde": "no-es"})
+        self.assertEqual(respuesta.status_code, 400)
+        viejo = codificar_watermark(limite_retencion() - timedelta(days=1))
+        self.client.delete(f"/api/items/{self.pan.pk}/")
+        completo = self.sync(viejo)
+        self.assertTrue(completo["completo"])
+        self.assertEqual([i["nombre"] for i in completo["items"]], ["leche"])
+        self.assertEqual(completo["items_eliminados"], [])
+
+
+class PurgaTests(UsuarioTestCase):
+    """
+    purgar_borrados: borra de verdad los tombstones más viejos que la
+    retención, en lotes acotados, y deja los recientes y lo vigente.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        viejo = limite_retencion() - timedelta(days=1)
+        reciente = timezone.now()
+        cls.vigente = Lista.objects.create(usuario=cls.usuario, nombre="Vigente")
+        cls.borrada_vieja = Lista.objects.create(usuario=cls.usuario, nombre="Vieja", deleted_at=viejo)
+        cls.borrada_reciente = Lista.objects.create(usuario=cls.usuario, nombre="Reciente", deleted_at=reciente)
+        for i in range(5):
+            Item.objects.create(lista=cls.vigente, nombre=f"viejo{i}", deleted_at=viejo)
+            Item.objects.create(lista=cls.borrada_vieja, nombre=f"item{i}", deleted_at=viejo)
+        Item.objects.create(lista=cls.vigente, nombre="reciente", deleted_at=reciente)
+        Item.objects.create(lista=cls.vigente, nombre="vigente")
+
+    def test_lote_acotado(self):
+        self.assertEqual(purgar_lote(Item, limite_retencion(), tamano=3), 3)
+        self.assertEqual(pendientes_de_purga(Item, limite_retencion()), 7)
+
+    def test_purga_por_lotes(self):
+        salida = StringIO()
+        call_command("purgar_borrados", dry_run=True, stdout=salida)
+        self.assertIn("11 filas por purgar", salida.getvalue())
+        self.assertEqual(Item.todos.count(), 12)
+
+        salida = StringIO()
+        call_command("purgar_borrados", batch_size=4, pausa=0, stdout=salida)
+        self.assertIn("11 filas purgadas", salida.getvalue())
+        self.assertIn("4/10", salida.getvalue())
+        self.assertEqual(
+            sorted(Item.todos.values_list("nombre", flat=True)), ["reciente", "vigente"]
+        )
+        self.assertEqual(
+            set(Lista.todos.values_list("pk", flat=True)),
+            {self.vigente.pk, self.borrada_reciente.pk},
+        )
+
+
+class RenderizadoYCompresionTests(UsuarioTestCase):
+    """
+    RenderizadorJSON da los mismos bytes que el JSONRenderer de DRF, y
+    CompresionMiddleware comprime según Accept-Encoding.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lista = Lista.objects.create(usuario=cls.usuario, nombre="Grande")
+        Item.objects.bulk_create(
+            Item(lista=cls.lista, nombre=f"producto {i}", precio_unitario=Decimal("1234.50"))
+            for i in range(60)
+        )
+
+    def test_mismo_json_que_drf(self):
+        datos = {
+            "total": Decimal("10.50"),
+            "fecha": timezone.now(),
+            "nombre": "Café\u2028ñ",
+            "grande": 2 ** 70,
+            "items": [{"id": 1, "nota": None, "comprado": True}],
+        }
+        esperado = JSONRenderer().render(datos)
+        self.assertEqual(volcar_json(datos), esperado)
+        self.assertEqual(volcar_json(datos, usar_orjson=False), esperado)
+
+    def test_elegir_codificacion(self):
+        preferida = "br" if compresion.brotli is not None else "gzip"
+        self.assertEqual(elegir_codificacion("gzip;q=0.5, br"), preferida)
+        self.assertEqual(elegir_codificacion("gzip, deflate"), "gzip")
+        self.assertEqual(elegir_codificacion("*"), preferida)
+        self.assertIsNone(elegir_codificacion("identity"))
+        self.assertIsNone(elegir_codificacion("gzip;q=0"))
+
+    def test_respuesta_comprimida(self):
+        url = f"/api/items/?lista_id={self.lista.pk}"
+        plano = self.client.get(url)
+        self.assertNotIn("Content-Encoding", plano)
+        self.assertIn("Accept-Encoding", plano["Vary"])
+
+        comprimido = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(comprimido["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(comprimido.content), plano.content)
+        self.assertLess(len(comprimido.content), len(plano.content))
+        self.assertEqual(comprimido["ETag"], "W/" + plano["ETag"])
+        # El ETag débil sigue sirviendo para If-None-Match
+        respuesta = self.client.get(url, headers={"If-None-Match": comprimido["ETag"]})
+        self.assertEqual(respuesta.status_code, 304)
+
+        # Las respuestas chicas no se comprimen
+        chica = self.client.get("/api/health/", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", chica)
+
+
+class LecturaRapidaTests(UsuarioTestCase):
+    """
+    Los GET de items y listas usan lectura_rapida; su JSON debe ser el mismo,
+    byte a byte, que el de ItemSerializer/ListaSerializer con el renderer de DRF.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lista = Lista.objects.create(
+            usuario=cls.usuario,
+            nombre="Mercado ñ",
+            presupuesto=Decimal("150000.50"),
+            total_calculado=Decimal("0.30"),
+            alerta_ultima_vista_at=timezone.now(),
+        )
+        Lista.objects.create(usuario=cls.usuario, nombre="Vacía")
+        ahora = timezone.now()
+        valores = [
+            ("pan", None, "0.10", "3.00", False),
+            ("leche", "Lácteos", "7.50", "1234.56", True),
+            ("huevos", "", "1.00", "0.00", False),
+            ("café  ", "Bebidas", "3.33", "9999999.99", True),
+            ("arroz", "Granos", "12.00", "0.07", False),
+        ]
+        for i, (nombre, categoria, cantidad, precio, comprado) in enumerate(valores):
+            item = Item.objects.create(
+                lista=cls.lista,
+                nombre=nombre,
+                categoria=categoria,
+                cantidad=Decimal(cantidad),
+                precio_unitario=Decimal(precio),
+                comprado=comprado,
+                fecha_comprado=ahora if comprado else None,
+                precio_pagado=Decimal("1200.10") if comprado else None,
+                cantidad_comprada=Decimal("2.00") if comprado else None,
+                nota="nota" if i % 2 else None,
+            )
+            # fechas distintas para que el orden sea estable
+            Item.objects.filter(pk=item.pk).update(fecha_agregado=ahora - timedelta(minutes=10 - i))
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_items_igual_a_item_serializer(self):
+        qs = Item.objects.filter(lista=self.lista).order_by("fecha_agregado", "id")
+        esperado = self.render({"items": ItemSerializer(qs, many=True).data})
+        rapido = self.render({"items": LECTURA_ITEMS.representar(LECTURA_ITEMS.consulta(qs))})
+        self.assertEqual(rapido, esperado)
+
+    def test_listas_igual_a_lista_serializer(self):
+        qs = Lista.objects.filter(usuario=self.usuario).order_by("-fecha_creacion")
+        esperado = self.render({"listas": ListaSerializer(qs, many=True).data})
+        rapido = self.render({"listas": LECTURA_LISTAS.representar(LECTURA_LISTAS.consulta(qs))})
+        self.assertEqual(rapido, esperado)
+
+    def test_endpoint_items(self):
+        response = self.client.get(f"/api/items/?lista_id={self.lista.pk}")
+        qs = Item.objects.filter(lista=self.lista)
+        self.assertEqual(response.content, self.render({"items": ItemSerializer(qs, many=True).data}))
+
+    def test_endpoint_items_paginado(self):
+        qs = list(Item.objects.filter(lista=self.lista).order_by("fecha_agregado", "id"))
+        response = self.client.get(f"/api/items/?lista_id={self.lista.pk}&page_size=3")
+        pagina = response.json()
+        self.assertEqual(
+            self.render({"items": pagina["items"]}),
+            self.render({"items": ItemSerializer(qs[:3], many=True).data}),
+        )
+
+        response = self.client.get(
+            f"/api/items/?lista_id={self.lista.pk}&page_size=3&cursor={pagina['siguiente_cursor']}"
+        )
+        pagina = response.json()
+        self.assertIsNone(pagina["siguiente_cursor"])
+        self.assertEqual([i["id"] for i in pagina["items"]], [i.id for i in qs[3:]])
+
+    def test_endpoint_listas(self):
+        response = self.client.get("/api/listas/")
+        qs = Lista.objects.filter(usuario=self.usuario).order_by("-fecha_creacion")
+        self.assertEqual(response.content, self.render({"listas": ListaSerializer(qs, many=True).data}))
+
+
+class PantallaTests(UsuarioTestCase):
+    """
+    GET /api/listas/<id>/pantalla/: items, resumen y recomendaciones en una
+    sola petición, iguales a los de los endpoints separados.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lista = Lista.objects.create(usuario=cls.usuario, nombre="Finde", presupuesto=Decimal("10000"))
+        Item.objects.create(lista=cls.lista, nombre="carne", cantidad=Decimal("2"), precio_unitario=Decimal("3000"))
+        Item.objects.create(lista=cls.lista, nombre="pan", precio_unitario=Decimal("500"), comprado=True)
+        recalcular_total(cls.lista)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.url = f"/api/listas/{self.lista.pk}/pantalla/"
+
+    def test_todas_las_secciones(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(set(data), {"lista", "items", "resumen", "recomendaciones"})
+        self.assertEqual(data["lista"]["id"], self.lista.pk)
+        self.assertEqual(
+            data["items"], self.client.get(f"/api/items/?lista_id={self.lista.pk}").json()["items"]
+        )
+        self.assertEqual(data["resumen"], self.client.get(f"/api/resumen_lista/{self.lista.pk}/").json())
+        self.assertEqual(
+            data["recomendaciones"],
+            self.client.get(f"/api/recomendaciones/{self.lista.pk}/").json(),
+        )
+
+    def test_secciones_y_etag(self):
+        with CaptureQueriesContext(connection) as consultas:
+            data = self.client.get(self.url, {"secciones": "resumen"}).json()
+        self.assertEqual(set(data), {"lista", "resumen"})
+        self.assertEqual(len(consultas), 1)  # sólo la lista: el resumen sale de sus agregados
+        self.assertEqual(Decimal(str(data["resumen"]["total"])), Decimal("6500"))
+
+        self.assertEqual(self.client.get(self.url, {"secciones": "items,otra"}).status_code, 400)
+
+        etag = self.client.get(self.url)["ETag"]
+        self.assertNotEqual(etag, self.client.get(self.url, {"secciones": "items"})["ETag"])
+        self.assertEqual(self.client.get(self.url, headers={"If-None-Match": etag}).status_code, 304)
+
+
+class AlertasTests(UsuarioTestCase):
+    """
+    Motor de alertas: estado y alerta_activa al día en cada escritura, y una
+    Alerta sólo al cruzar un umbral hacia arriba.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.lista = Lista.objects.create(usuario=self.usuario, nombre="Mes", presupuesto=Decimal("10000"))
+
+    def crear_item(self, nombre, precio):
+        respuesta = self.client.post(
+            "/api/items/",
+            {"lista": self.lista.pk, "nombre": nombre, "precio_unitario": precio},
+            content_type="application/json",
+        )
+        self.assertEqual(respuesta.status_code, 201)
+        return respuesta.json()["id"]
+
+    def estado(self):
+        self.lista.refresh_from_db()
+        return self.lista.alerta_activa, self.lista.estado
+
+    def alertas(self):
+        return list(Alerta.objects.filter(lista=self.lista).order_by("id").values_list("tipo", flat=True))
+
+    def test_cruces_sin_alertas_repetidas(self):
+        self.crear_item("carne", "8000")
+        self.assertEqual(self.estado(), ("AMARILLA", "OK"))
+        self.assertEqual(self.alertas(), ["AMARILLA"])
+
+        self.crear_item("pan", "500")
+        self.assertEqual(self.alertas(), ["AMARILLA"])
+
+        vino = self.crear_item("vino", "2000")
+        self.assertEqual(self.estado(), ("ROJA", "SOBRE_PRESUPUESTO"))
+        self.assertEqual(self.alertas(), ["AMARILLA", "ROJA"])
+
+        # Sigue sobre el presupuesto: no se repite la alerta
+        self.crear_item("queso", "700")
+        self.client.put(f"/api/items/{vino}/", {"cantidad": "2"}, content_type="application/json")
+        self.assertEqual(self.alertas(), ["AMARILLA", "ROJA"])
+
+        # Bajar no genera alerta; volver a subir sí
+        self.client.delete(f"/api/items/{vino}/")
+        self.assertEqual(self.estado(), ("AMARILLA", "OK"))
+        self.assertEqual(self.alertas(), ["AMARILLA", "ROJA"])
+        self.crear_item("torta", "3000")
+        self.assertEqual(self.alertas(), ["AMARILLA", "ROJA", "ROJA"])
+
+    def test_presupuesto_y_endpoint(self):
+        self.crear_item("carne", "12000")
+        self.assertEqual(self.estado(), ("ROJA", "SOBRE_PRESUPUESTO"))
+
+        respuesta = self.client.put(
+            f"/api/listas/{self.lista.pk}/", {"presupuesto": "50000"}, content_type="application/json"
+        )
+        self.assertEqual(respuesta.json()["alerta_activa"], "NINGUNA")
+        self.assertEqual(self.estado(), ("NINGUNA", "OK"))
+
+        data = self.client.get(f"/api/listas/{self.lista.pk}/alertas/").json()
+        self.assertEqual(([a["tipo"] for a in data["alertas"]], data["no_vistas"]), (["ROJA"], 1))
+        self.client.post(f"/api/listas/{self.lista.pk}/alertas/vistas/")
+        self.assertEqual(self.client.get(f"/api/listas/{self.lista.pk}/alertas/").json()["no_vistas"], 0)
+
+
+class PushTests(UsuarioTestCase):
+    """
+    Outbox de notificaciones push con el ProveedorFalso (sin red).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        PreferenciasAlertas.objects.create(usuario=cls.usuario, push=True)
+        cls.lista = Lista.objects.create(
+            usuario=cls.usuario, nombre="Semana", presupuesto=Decimal("100.00")
+        )
+
+    def setUp(self):
+        super().setUp()
+        ProveedorFalso.enviados = []
+
+    def dispositivo(self, token, plataforma="ANDROID"):
+        return Dispositivo.objects.create(usuario=self.usuario, push_token=token, plataforma=plataforma)
+
+    def superar_presupuesto(self):
+        Lista.objects.filter(pk=self.lista.pk).update(total_calculado=Decimal("120.00"))
+        return evaluar_alerta(self.lista.pk)
+
+    def test_limitador_por_proveedor_para_todo_el_proceso(self):
+        proveedor = proveedor_para("ANDROID")
+        self.assertIs(limitador_de(proveedor), limitador_de(proveedor_para("ANDROID")))
+        self.assertIsNot(limitador_de(proveedor), limitador_de(proveedor_para("IOS")))
+
+        # Lo gastado en una pasada (un asyncio.run) cuenta en la siguiente
+        limitador = LimitadorTasa(por_segundo=10)
+        asyncio.run(limitador.adquirir(10))
+        self.assertAlmostEqual(limitador.reservar(5), 0.5, places=1)
+        self.assertAlmostEqual(limitador.reservar(5), 1.0, places=1)
+
+    def test_alerta_encola_y_envia_por_plataforma(self):
+        self.dispositivo("tel-1")
+        self.dispositivo("web-1", "WEB")
+        self.superar_presupuesto()
+        self.assertEqual(NotificacionPush.objects.filter(estado="PENDIENTE").count(), 2)
+
+        conteo = despachar_pendientes()
+        self.assertEqual(conteo, {"ENVIADA": 2})
+        self.assertEqual(
+            sorted(plataforma for plataforma, _ in ProveedorFalso.enviados), ["ANDROID", "WEB"]
+        )
+        self.assertEqual(ProveedorFalso.enviados[0][1].datos["tipo"], "ROJA")
+
+    def test_token_invalido_desactiva_dispositivo(self):
+        muerto = self.dispositivo("invalido-1")
+        self.dispositivo("tel-1")
+        encolar_push(self.usuario.pk, "Hola", "Mensaje")
+
+        conteo = despachar_pendientes()
+        self.assertEqual(conteo, {"ENVIADA": 1, "DESCARTADA": 1})
+        muerto.refresh_from_db()
+        self.assertFalse(muerto.activo)
+
+        # Ya no recibe nada nuevo
+        self.assertEqual(encolar_push(self.usuario.pk, "Hola", "Otra vez"), 1)
+
+    def test_error_se_reintenta_con_backoff(self):
+        self.dispositivo("error-1")
+        encolar_push(self.usuario.pk, "Hola", "Mensaje")
+
+        self.assertEqual(despachar_pendientes(), {"PENDIENTE": 1})
+        notificacion = NotificacionPush.objects.get()
+        self.assertEqual(notificacion.intentos, 1)
+        self.assertGreater(notificacion.proximo_intento, timezone.now())
+        # Hasta que no llegue su turno no se vuelve a tomar
+        self.assertEqual(despachar_pendientes(), {})
+
+    def test_plataforma_sin_proveedor_falla_y_sigue(self):
+        self.dispositivo("tel-1")
+        self.dispositivo("web-1", "WEB")
+        self.dispositivo("ios-1", "IOS")
+        encolar_push(self.usuario.pk, "Hola", "Mensaje")
+
+        proveedores = {"ANDROID": PROVEEDORES["ANDROID"], "IOS": "smartcar_app.push.NoExiste"}
+        with (
+            mock.patch.dict(PROVEEDORES, proveedores, clear=True),
+            mock.patch.dict(_proveedores, clear=True),
+            self.assertLogs("smartcar_app.push", "ERROR"),
+        ):
+            conteo = despachar_pendientes()
+
+        self.assertEqual(conteo, {"ENVIADA": 1, "FALLIDA": 2})
+        self.assertEqual([p for p, _ in ProveedorFalso.enviados], ["ANDROID"])
+        fallida = NotificacionPush.objects.get(plataforma="WEB")
+        self.assertEqual(fallida.ultimo_error, "Sin proveedor para WEB")
+        self.assertEqual(despachar_pendientes(), {})
+
+
+class FuenteContada(FuentePrecio):
+    nombre = "contada"
+
+    def __init__(self, falla=False):
+        self.falla = falla
+        self.consultas = []
+
+    async def buscar(self, nombre):
+        self.consultas.append(nombre)
+        if self.falla:
+            raise ConnectionError("sin conexión")
+        return Decimal("2500") if nombre == "cafe molido" else None
+
+
+class PreciosTests(UsuarioTestCase):
+    """
+    Consulta de precios online con fuentes locales (sin red).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lista = Lista.objects.create(usuario=cls.usuario, nombre="Mes")
+        Item.objects.create(lista=cls.lista, nombre="Café  Molido")
+        Item.objects.create(lista=cls.lista, nombre="pan")
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        _circuitos.clear()
+
+    def test_normalizar_nombre(self):
+        self.assertEqual(normalizar_nombre("  Café  MOLIDO "), "cafe molido")
+
+    def test_guarda_precios_y_usa_cache(self):
+        fuente = FuenteContada()
+        creados = actualizar_precios_lista(self.lista.pk, [fuente, FuenteLocal()])
+        # 'contada' sólo conoce el café; 'local' da precio para ambos
+        self.assertEqual(len(creados), 3)
+        self.assertEqual(
+            PrecioOnline.objects.get(fuente="contada").precio_consultado, Decimal("2500.00")
+        )
+        self.assertEqual(sorted(fuente.consultas), ["cafe molido", "pan"])
+
+        actualizar_precios_lista(self.lista.pk, [fuente])
+        self.assertEqual(len(fuente.consultas), 2)
+
+    def test_circuito_abre_tras_fallos(self):
+        fuente = FuenteContada(falla=True)
+        nombres = [f"producto {i}" for i in range(FALLOS_PARA_ABRIR * 3)]
+        with self.assertLogs("smartcar_app.precios", "WARNING"):
+            self.assertEqual(precios_por_nombre(nombres, [fuente]), {})
+        self.assertTrue(circuito_de(fuente).abierto)
+        # Sólo las que ya estaban en vuelo cuando se abrió el circuito
+        self.assertLessEqual(len(fuente.consultas), FALLOS_PARA_ABRIR + CONCURRENCIA - 1)
+        self.assertLess(len(fuente.consultas), len(nombres))
+        # Los fallos no se cachean
+        self.assertIsNone(cache.get(clave_cache("contada", "producto 0")))
+
+
+class MejorPrecioTests(UsuarioTestCase):
+    """
+    PrecioVigente / MejorPrecio se mantienen al registrar precios y salen
+    en GET /api/items/?precios=1 con un solo JOIN.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lista = Lista.objects.create(usuario=cls.usuario, nombre="Feria")
+        cls.leche = Item.objects.create(lista=cls.lista, nombre="leche")
+        cls.pan = Item.objects.create(lista=cls.lista, nombre="pan")
+
+    def registrar(self, item, fuente, precio):
+        registrar_precios(
+            [PrecioOnline(item=item, fuente=fuente, precio_consultado=Decimal(precio))]
+        )
+
+    def test_vigente_por_fuente_y_mejor(self):
+        self.registrar(self.leche, "a", "1000")
+        self.registrar(self.leche, "b", "900")
+        self.registrar(self.leche, "b", "1200")  # b sube: ahora a es la mejor
+
+        self.assertEqual(PrecioVigente.objects.filter(item=self.leche).count(), 2)
+        mejor = MejorPrecio.objects.get(item=self.leche)
+        self.assertEqual((mejor.fuente, mejor.precio), ("a", Decimal("1000.00")))
+
+        reconstruir_precios_vigentes()
+        mejor = MejorPrecio.objects.get(item=self.leche)
+        self.assertEqual((mejor.fuente, mejor.precio), ("a", Decimal("1000.00")))
+
+    def test_endpoint_items_con_precios(self):
+        self.registrar(self.leche, "a", "1000")
+        url = f"/api/items/?lista_id={self.lista.pk}&precios=1"
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(len(consultas), 3)  # lista, fecha del último precio, items
+        items = {i["nombre"]: i for i in response.json()["items"]}
+        self.assertEqual(items["leche"]["mejor_precio"], "1000.00")
+        self.assertEqual(items["leche"]["mejor_precio_fuente"], "a")
+        self.assertIsNone(items["pan"]["mejor_precio"])
+
+        qs = Item.objects.filter(lista=self.lista).select_related("mejor_precio")
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render({"items": ItemConPreciosSerializer(qs, many=True).data}),
+        )
+
+        # Un precio nuevo invalida el ETag aunque la lista no cambie
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.registrar(self.pan, "a", "500")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_renombrar_olvida_los_precios_del_nombre_anterior(self):
+        self.registrar(self.leche, "a", "1000")
+        self.registrar(self.pan, "a", "500")
+        json = {"content_type": "application/json"}
+
+        # Mismo nombre normalizado: los precios siguen valiendo
+        self.client.put(f"/api/items/{self.leche.pk}/", {"nombre": "Leche"}, **json)
+        self.assertTrue(MejorPrecio.objects.filter(item=self.leche).exists())
+
+        self.client.put(f"/api/items/{self.leche.pk}/", {"nombre": "avena"}, **json)
+        self.client.post(
+            "/api/items/bulk/",
+            {"lista_id": self.lista.pk, "actualizar": [{"id": self.pan.pk, "nombre": "arepa"}]},
+            **json,
+        )
+        for item in (self.leche, self.pan):
+            self.assertFalse(MejorPrecio.objects.filter(item=item).exists())
+            self.assertFalse(PrecioVigente.objects.filter(item=item).exists())
+
+        # El historial queda, pero al reconstruir no vuelve; lo nuevo sí cuenta
+        self.assertEqual(reconstruir_precios_vigentes(), 0)
+        self.registrar(self.leche, "b", "800")
+        reconstruir_precios_vigentes()
+        mejor = MejorPrecio.objects.get(item=self.leche)
+        self.assertEqual((mejor.fuente, mejor.precio), ("b", Decimal("800.00")))
+        self.assertFalse(MejorPrecio.objects.filter(item=self.pan).exists())
+
+
+class OptimizadorTests(UsuarioTestCase):
+    """
+    Mochila por prioridad bajo el presupuesto que queda en la lista.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lista = Lista.objects.create(
+            usuario=cls.usuario, nombre="Quincena", presupuesto=Decimal("100")
+        )
+        valores = [
+            ("arroz", "A", "60"),
+            ("aceite", "A", "50"),
+            ("galletas", "B", "30"),
+            ("queso", "M", "40"),
+            ("pan", "M", "10", True),
+        ]
+        for nombre, prioridad, precio, *comprado in valores:
+            Item.objects.create(
+                lista=cls.lista,
+                nombre=nombre,
+                prioridad=prioridad,
+                precio_unitario=Decimal(precio),
+                comprado=bool(comprado),
+            )
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_exacta_igual_a_fuerza_bruta(self):
+        aleatorio = random.Random(7)
+        for _ in range(30):
+            candidatos = [
+                (i, aleatorio.randint(0, 6), Decimal(aleatorio.randint(0, 5000)) / 100)
+                for i in range(aleatorio.randint(1, 9))
+            ]
+            capacidad = Decimal(aleatorio.randint(0, 15000)) / 100
+            mejor = max(
+                sum(c[1] for c in combinacion)
+                for n in range(len(candidatos) + 1)
+                for combinacion in itertools.combinations(candidatos, n)
+                if sum((c[2] for c in combinacion), Decimal("0")) <= capacidad
+            )
+            elegidos, valor = mochila_exacta(candidatos, capacidad)
+            por_id = {c[0]: c for c in candidatos}
+            self.assertEqual(valor, mejor)
+            self.assertEqual(sum(por_id[i][1] for i in elegidos), mejor)
+            self.assertLessEqual(sum((por_id[i][2] for i in elegidos), Decimal("0")), capacidad)
+
+    def test_voraz_dentro_de_la_cota(self):
+        aleatorio = random.Random(11)
+        candidatos = [
+            (i, aleatorio.randint(1, 5), Decimal(aleatorio.randint(1, 9000)) / 100)
+            for i in range(300)
+        ]
+        capacidad = Decimal("2000")
+        elegidos, cota = mochila_voraz(candidatos, capacidad)
+        por_id = {c[0]: c for c in candidatos}
+        valor = sum(por_id[i][1] for i in elegidos)
+        self.assertLessEqual(sum((por_id[i][2] for i in elegidos), Decimal("0")), capacidad)
+        self.assertLessEqual(valor, cota)
+        self.assertGreaterEqual(valor * 2, cota)
+
+    def test_endpoint_persiste_y_memoiza(self):
+        url = f"/api/listas/{self.lista.pk}/optimizar/"
+        data = self.client.post(url, {}, content_type="application/json").json()
+        # Quedan 90 (pan ya está comprado): aceite (A, 50) + queso (M, 40)
+        # valen 8; arroz (A, 60) + galletas (B, 30) sólo 6
+        self.assertEqual(data["metodo"], "exacto")
+        self.assertEqual([i["nombre"] for i in data["items"]], ["aceite", "queso"])
+        self.assertEqual(Decimal(str(data["presupuesto_no_usado"])), Decimal("0"))
+        recomendacion = Recomendacion.objects.get(pk=data["recomendacion_id"])
+        self.assertEqual(
+            list(
+                recomendacion.items_recomendados.order_by("orden").values_list(
+                    "item__nombre", flat=True
+                )
+            ),
+            ["aceite", "queso"],
+        )
+
+        with CaptureQueriesContext(connection) as consultas:
+            otra = self.client.post(url, {}, content_type="application/json").json()
+        self.assertEqual(otra["recomendacion_id"], data["recomendacion_id"])
+        self.assertEqual(len(consultas), 1)  # sólo leer la lista
+
+        # A igual valor gana lo más barato: queso + galletas (70) y no queso + aceite (90)
+        pesos = {"pesos": {"A": 1, "M": 5}}
+        data = self.client.post(url, pesos, content_type="application/json").json()
+        self.assertEqual([i["nombre"] for i in data["items"]], ["queso", "galletas"])
+        self.assertEqual(Recomendacion.objects.filter(lista=self.lista).count(), 2)
+
+        # Con la lista cambiada se recalcula sobre la misma fila (lista, criterios)
+        queso = Item.objects.get(lista=self.lista, nombre="queso")
+        self.client.put(f"/api/items/{queso.pk}/", {"comprado": True}, content_type="application/json")
+        otra = self.client.post(url, {}, content_type="application/json").json()
+        self.assertEqual(otra["recomendacion_id"], recomendacion.pk)
+        self.assertEqual(Recomendacion.objects.filter(lista=self.lista).count(), 2)
+        self.assertEqual(
+            sorted(recomendacion.items_recomendados.values_list("item__nombre", flat=True)),
+            sorted(i["nombre"] for i in otra["items"]),
+        )
+
+        respuesta = self.client.post(url, {"pesos": {"Z": 1}}, content_type="application/json")
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class HistorialTests(UsuarioTestCase):
+    """
+    Historial por (usuario, mes): borrar una lista y los lotes de items lo
+    mueven por diferencia y queda igual que reconstruyéndolo.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.lista = Lista.objects.create(usuario=self.usuario, nombre="Semana")
+        self.otra = Lista.objects.create(usuario=self.usuario, nombre="Fiesta")
+        for lista, nombre, categoria, precio in (
+            (self.lista, "arroz", "Granos", "2000"),
+            (self.lista, "leche", "Lácteos", "1000"),
+            (self.otra, "gaseosa", "Bebidas", "3000"),
+        ):
+            Item.objects.create(
+                lista=lista, nombre=nombre, categoria=categoria, precio_unitario=Decimal(precio)
+            )
+        reconstruir_historial([self.usuario.pk])
+
+    def foto(self):
+        meses = Historial.objects.filter(usuario=self.usuario, numero_items__gt=0)
+        return (
+            sorted(meses.values_list("mes", "total", "numero_items")),
+            sorted(
+                HistorialCategoria.objects.filter(
+                    historial__usuario=self.usuario, numero_items__gt=0
+                ).values_list("historial__mes", "categoria", "total", "numero_items")
+            ),
+        )
+
+    def assertIgualAReconstruir(self):
+        incremental = self.foto()
+        reconstruir_historial([self.usuario.pk])
+        self.assertEqual(incremental, self.foto())
+
+    def test_lote_mueve_por_diferencia(self):
+        leche = Item.objects.get(nombre="leche")
+        arroz = Item.objects.get(nombre="arroz")
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(
+                "/api/items/bulk/",
+                {
+                    "lista_id": self.lista.pk,
+                    "crear": [{"nombre": "pan", "categoria": "Panadería", "precio_unitario": "500"}],
+                    "actualizar": [
+                        {"id": leche.pk, "comprado": True, "precio_pagado": "1200", "cantidad_comprada": "1"}
+                    ],
+                    "eliminar": [arroz.pk],
+                },
+                content_type="application/json",
+            )
+        self.assertEqual(respuesta.status_code, 200)
+        # Sin el DELETE + INSERT de todo el historial del usuario
+        self.assertFalse(any(c["sql"].startswith("DELETE") for c in consultas.captured_queries))
+        self.assertIgualAReconstruir()
+
+    def test_borrar_lista_resta_sus_items(self):
+        respuesta = self.client.delete(f"/api/listas/{self.lista.pk}/")
+        self.assertEqual(respuesta.status_code, 204)
+        self.assertEqual(Historial.objects.get(usuario=self.usuario).total, Decimal("3000"))
+        self.assertIgualAReconstruir()
+
+    def test_post_no_escribe_totales_del_cliente(self):
+        mes = mes_de(timezone.now())
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(
+                "/api/historial/", {"mes": mes, "total": "1"}, content_type="application/json"
+            )
+        self.assertEqual(respuesta.status_code, 200)
+        # Sólo lee: el agregado ya lo mantienen las escrituras de items
+        self.assertTrue(all(c["sql"].startswith("SELECT") for c in consultas.captured_queries))
+        self.assertEqual(
+            [(h["mes"], Decimal(str(h["total"]))) for h in respuesta.json()["historial"]],
+            [(mes, Decimal("6000"))],
+        )
+        self.assertEqual(Historial.objects.get(usuario=self.usuario, mes=mes).total, Decimal("6000"))
+
+    def test_get_por_mes_con_cursor(self):
+        # Meses viejos registrados después: el orden no depende de fecha_registro
+        Historial.objects.create(usuario=self.usuario, mes="2024-01")
+        Historial.objects.create(usuario=self.usuario, mes="2024-12")
+        url, cursor, meses = f"/api/historial/{self.usuario.pk}/?page_size=1", None, []
+        while True:
+            respuesta = self.client.get(url + (f"&cursor={cursor}" if cursor else ""))
+            self.assertEqual(respuesta.status_code, 200)
+            meses += [h["mes"] for h in respuesta.json()["historial"]]
+            cursor = respuesta.json()["siguiente_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(meses, [mes_de(timezone.now()), "2024-12", "2024-01"])
+        self.assertEqual(
+            [h["mes"] for h in self.client.get(f"/api/historial/{self.usuario.pk}/").json()["historial"]],
+            meses,
+        )
+
+
+class RollupKpisTests(UsuarioTestCase):
+    """
+    rollup_kpis avanza por orden de llegada: un evento con ts anterior al
+    watermark (cliente offline) igual se agrega, sin contar dos veces un
+    día que ya estaba activo.
+    """
+
+    def evento(self, dia):
+        return Evento.objects.create(
+            usuario=self.usuario,
+            tipo="ABRE_APP",
+            ts=datetime(2025, 10, dia, 12, tzinfo=dt_timezone.utc),
+        )
+
+    def rollup(self):
+        call_command("rollup_kpis", retraso=0, stdout=StringIO())
+        return KpiMensualUsuario.objects.get(usuario=self.usuario, mes="2025-10", tipo="ABRE_APP")
+
+    def test_eventos_atrasados_se_agregan(self):
+        self.evento(10)
+        self.evento(12)
+        mensual = self.rollup()
+        self.assertEqual((mensual.total_eventos, mensual.dias_activos), (2, 2))
+
+        # Llegan después, con ts anterior al último día ya agregado
+        self.evento(11)
+        self.evento(10)
+        mensual = self.rollup()
+        self.assertEqual((mensual.total_eventos, mensual.dias_activos), (4, 3))
+        self.assertEqual(mensual.ultimo_dia, date(2025, 10, 12))
+        diarios = {
+            k.dia.day: (k.total_eventos, k.usuarios_activos)
+            for k in KpiDiario.objects.filter(tipo="ABRE_APP")
+        }
+        self.assertEqual(diarios, {10: (2, 1), 11: (1, 1), 12: (1, 1)})
+
+        # Sin eventos nuevos no cambia nada
+        self.assertEqual(self.rollup().total_eventos, 4)
+
+    def test_recibido_es_la_hora_del_insert(self):
+        # Encolado hace rato: cuenta cuándo lo escribió el buffer
+        evento = Evento(
+            usuario=self.usuario, tipo="ABRE_APP", recibido=timezone.now() - timedelta(hours=1)
+        )
+        antes = timezone.now()
+        BufferEventos()._guardar([evento])
+        self.assertGreaterEqual(Evento.objects.get(usuario=self.usuario).recibido, antes)
+
+    def test_kpis_diarios_solo_administradores(self):
+        self.evento(10)
+        otro = Usuario.objects.create(nombre="Mia", correo="mia@test.com", contrasena="x")
+        Evento.objects.create(usuario=otro, tipo="ABRE_APP", ts=timezone.now())
+        self.rollup()
+
+        self.assertEqual(self.client.get("/api/kpis/diarios/").status_code, 403)
+        with self.settings(SMARTCAR_ADMINISTRADORES=[self.usuario.correo]):
+            respuesta = self.client.get("/api/kpis/diarios/")
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(sum(k["usuarios_activos"] for k in respuesta.json()["kpis"]), 2)
+
+        # Los mensuales son siempre los del usuario del token
+        mensuales = self.client.get("/api/kpis/mensuales/").json()["kpis"]
+        self.assertEqual({k["usuario"] for k in mensuales}, {self.usuario.pk})
+        respuesta = self.client.get(f"/api/kpis/mensuales/?usuario_id={otro.pk}")
+        self.assertEqual(respuesta.status_code, 403)
+
+
+class AnaliticaTests(UsuarioTestCase):
+    """
+    /api/gastos/<usuario_id>/<vista>/: un query agregado por vista y cache
+    hasta la próxima escritura del usuario.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lista = Lista.objects.create(usuario=cls.usuario, nombre="Marzo")
+        ahora = timezone.now()
+        leche = Item.objects.create(
+            lista=cls.lista,
+            nombre="leche",
+            categoria="Lácteos",
+            cantidad=Decimal("2"),
+            precio_unitario=Decimal("1000"),
+            comprado=True,
+            fecha_comprado=ahora,
+            precio_pagado=Decimal("1100"),
+            cantidad_comprada=Decimal("2"),
+        )
+        Item.objects.create(
+            lista=cls.lista, nombre="pan", categoria="Panadería", precio_unitario=Decimal("500")
+        )
+        Compra.objects.create(
+            item=leche, cantidad=Decimal("2"), precio_unitario=Decimal("1100"), tienda="Éxito"
+        )
+        reconstruir_historial([cls.usuario.pk])
+        cls.mes = mes_de(ahora)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def url(self, vista):
+        return f"/api/gastos/{self.usuario.pk}/{vista}/"
+
+    def test_vistas(self):
+        categorias = self.client.get(self.url("categorias")).json()["categorias"]
+        self.assertEqual(
+            [(c["categoria"], Decimal(str(c["total"]))) for c in categorias],
+            [("Lácteos", Decimal("2200")), ("Panadería", Decimal("500"))],
+        )
+        meses = self.client.get(self.url("meses")).json()["meses"]
+        self.assertEqual([(m["mes"], m["numero_items"]) for m in meses], [(self.mes, 2)])
+        tiendas = self.client.get(self.url("tiendas")).json()["tiendas"]
+        self.assertEqual([(t["tienda"], t["numero_compras"]) for t in tiendas], [("Éxito", 1)])
+        comparacion = self.client.get(self.url("planeado_vs_pagado")).json()["planeado_vs_pagado"]
+        self.assertEqual(Decimal(str(comparacion[0]["diferencia"])), Decimal("200"))
+
+        self.assertEqual(self.client.get(self.url("otra")).status_code, 404)
+        self.assertEqual(self.client.get(self.url("meses") + "?desde=2025-13").status_code, 400)
+
+    def test_cache_hasta_la_proxima_escritura(self):
+        self.client.get(self.url("categorias"))
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(self.url("categorias"))
+        self.assertEqual(len(consultas), 1)  # sólo la marca de última escritura
+
+        respuesta = self.client.post(
+            "/api/items/",
+            {
+                "lista": self.lista.pk,
+                "nombre": "queso",
+                "categoria": "Lácteos",
+                "precio_unitario": "300",
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(respuesta.status_code, 201)
+        categorias = self.client.get(self.url("categorias")).json()["categorias"]
+        self.assertEqual(Decimal(str(categorias[0]["total"])), Decimal("2500"))
+
+
+@skipIf(columnar.np is None, "numpy no está instalado")
+class SnapshotColumnarTests(UsuarioTestCase):
+    """
+    El snapshot columnar da los mismos números que las consultas SQL.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        otro = Usuario.objects.create(nombre="Hugo", correo="hugo@test.com", contrasena="x")
+        precios = ["10.50", "3.25", "8.00", "1200.99", "0.10", "45.00"]
+        for usuario in (cls.usuario, otro):
+            lista = Lista.objects.create(usuario=usuario, nombre="Casa")
+            for i, precio in enumerate(precios):
+                item = Item.objects.create(
+                    lista=lista,
+                    nombre=f"producto {i}",
+                    categoria=("Aseo", "Frutas", None)[i % 3],
+                    cantidad=Decimal(i + 1),
+                    precio_unitario=Decimal(precio),
+                )
+                Compra.objects.create(
+                    item=item,
+                    cantidad=Decimal("1"),
+                    precio_unitario=Decimal(precio),
+                    tienda=("D1", "Ara")[i % 2],
+                )
+        borrada = Lista.objects.create(usuario=otro, nombre="Vieja", deleted_at=timezone.now())
+        Item.objects.create(lista=borrada, nombre="no cuenta", precio_unitario=Decimal("999"))
+
+    def setUp(self):
+        super().setUp()
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, True)
+        self.snapshot = columnar.Snapshot(columnar.exportar_snapshot(self.directorio, lote=4))
+
+    def test_filas_y_diccionarios(self):
+        self.assertEqual(self.snapshot.filas("items"), 12)
+        self.assertEqual(self.snapshot.filas("compras"), 12)
+        self.assertEqual(self.snapshot.etiquetas("items", "categoria")[0], None)
+        self.assertEqual(columnar.Snapshot.actual(self.directorio).ruta, self.snapshot.ruta)
+
+    def test_gasto_por_categoria_igual_a_sql(self):
+        esperado = {
+            f["categoria"] or None: columnar.np.int64(f["total"] * 100)
+            for f in Item.objects.filter(lista__deleted_at__isnull=True)
+            .values("categoria")
+            .annotate(total=Sum(SUBTOTAL_ITEM))
+        }
+        obtenido = {g: c for g, c, _ in columnar.gasto_por_categoria(self.snapshot)}
+        self.assertEqual(obtenido, esperado)
+
+        del_usuario = columnar.gasto_por_categoria(self.snapshot, usuario=self.usuario.pk)
+        self.assertEqual(sum(c for _, c, _ in del_usuario) * 2, sum(esperado.values()))
+
+    def test_tiendas_y_percentiles(self):
+        tiendas = dict((g, n) for g, _, n in columnar.gasto_por_tienda(self.snapshot))
+        self.assertEqual(tiendas, {"D1": 6, "Ara": 6})
+
+        percentiles = columnar.percentiles_precio_por_categoria(self.snapshot, (50, 90))
+        for categoria, valores in percentiles.items():
+            precios = [
+                float(p * 100)
+                for p in Item.objects.filter(
+                    categoria=categoria, lista__deleted_at__isnull=True
+                ).values_list(
+                    "precio_unitario", flat=True
+                )
+            ]
+            self.assertEqual(
+                [round(v, 6) for v in valores],
+                [round(v, 6) for v in columnar.np.percentile(precios, (50, 90))],
+            )
+
+
+class AnomaliasTests(UsuarioTestCase):
+    """
+    Precio de referencia (mediana y MAD) por nombre normalizado, actualizado
+    por watermark, y marca de precio atípico al escribir items.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lista = Lista.objects.create(usuario=cls.usuario, nombre="Semana")
+        cls.cafe = Item.objects.create(lista=cls.lista, nombre="Café Molido")
+        for precio in ("9800", "10000", "10100", "10200", "9900"):
+            Compra.objects.create(
+                item=cls.cafe, cantidad=Decimal("1"), precio_unitario=Decimal(precio)
+            )
+        PrecioOnline.objects.create(
+            item=cls.cafe, fuente="local", precio_consultado=Decimal("10050")
+        )
+
+    def test_estadisticos_y_puntaje(self):
+        mediana, mad = estadisticos([Decimal(p) for p in ("1", "2", "3", "4", "100")])
+        self.assertEqual((mediana, mad), (Decimal("3.00"), Decimal("1.00")))
+        referencia = {"mediana": Decimal("10000"), "mad": Decimal("100"), "muestras": 6}
+        self.assertFalse(es_atipico(Decimal("10400"), referencia))
+        self.assertTrue(es_atipico(Decimal("100000"), referencia))
+        self.assertFalse(es_atipico(Decimal("0"), referencia))
+        self.assertFalse(es_atipico(Decimal("100000"), dict(referencia, muestras=2)))
+
+    def test_actualizacion_incremental(self):
+        self.assertEqual(actualizar_referencias(), (6, 1))
+        referencia = ReferenciaPrecio.objects.get(nombre="cafe molido")
+        self.assertEqual((referencia.mediana, referencia.muestras), (Decimal("10025.00"), 6))
+
+        # Sólo se leen las filas nuevas
+        Compra.objects.create(
+            item=self.cafe, cantidad=Decimal("1"), precio_unitario=Decimal("10300")
+        )
+        self.assertEqual(actualizar_referencias(), (1, 1))
+        self.assertEqual(actualizar_referencias(), (0, 0))
+        referencia.refresh_from_db()
+        self.assertEqual((referencia.mediana, referencia.muestras), (Decimal("10050.00"), 7))
+
+        # Sus watermarks no se mezclan con el de los KPIs
+        self.assertFalse(KpiWatermark.objects.exists())
+        self.assertEqual(
+            WatermarkReferencia.objects.get(nombre="referencias:compras").ultimo_id,
+            Compra.objects.latest("id").pk,
+        )
+
+    def test_escrituras_marcan_con_un_lookup(self):
+        actualizar_referencias()
+        cache.clear()
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(
+                "/api/items/",
+                {"lista": self.lista.pk, "nombre": "cafe  molido", "precio_unitario": "95000"},
+                content_type="application/json",
+            )
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertTrue(respuesta.json()["precio_atipico"])
+        self.assertEqual(
+            sum("referencias_precio" in c["sql"] for c in consultas.captured_queries), 1
+        )
+        recomendaciones = self.client.get(f"/api/recomendaciones/{self.lista.pk}/").json()
+        self.assertTrue(any("'cafe  molido'" in r for r in recomendaciones))
+
+        item_id = respuesta.json()["id"]
+        respuesta = self.client.put(
+            f"/api/items/{item_id}/", {"precio_unitario": "9950"}, content_type="application/json"
+        )
+        self.assertFalse(respuesta.json()["precio_atipico"])
+
+        respuesta = self.client.post(
+            "/api/items/bulk/",
+            {
+                "lista_id": self.lista.pk,
+                "crear": [{"nombre": "Cafe molido!", "precio_unitario": 1}],
+                "actualizar": [{"id": self.cafe.pk, "precio_unitario": "500"}],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([i["precio_atipico"] for i in respuesta.json()["actualizados"]], [True])
+        # Otro nombre normalizado: sin referencia, no se marca
+        self.assertEqual([i["precio_atipico"] for i in respuesta.json()["creados"]], [False])
+
+
+class AutenticacionTests(TestCase):
+    """
+    Contraseñas con hash, token firmado en login y cada lista/item visible
+    sólo para su dueño.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dueno = Usuario.objects.create(nombre="Ivo", correo="ivo@test.com", contrasena="x")
+        cls.otro = Usuario.objects.create(nombre="Jo", correo="jo@test.com", contrasena="x")
+        cls.lista = Lista.objects.create(usuario=cls.dueno, nombre="Mía")
+        cls.item = Item.objects.create(lista=cls.lista, nombre="pan")
+
+    def test_registro_guarda_hash_y_login_da_token(self):
+        respuesta = self.client.post(
+            "/api/usuarios/crear/",
+            {"nombre": "Kim", "correo": "kim@test.com", "contrasena": "secreta"},
+            content_type="application/json",
+        )
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertNotIn("contrasena", respuesta.json())
+        guardada = Usuario.objects.get(correo="kim@test.com").contrasena
+        self.assertTrue(check_password("secreta", guardada))
+
+        login = self.client.post(
+            "/api/login/",
+            {"correo": "kim@test.com", "contrasena": "secreta"},
+            content_type="application/json",
+        )
+        token = login.json()["token"]
+        respuesta = self.client.get("/api/listas/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(respuesta.json(), {"listas": []})
+
+        malo = self.client.post(
+            "/api/login/",
+            {"correo": "kim@test.com", "contrasena": "otra"},
+            content_type="application/json",
+        )
+        self.assertEqual(malo.status_code, 400)
+
+    def test_migracion_hashea_contrasenas_en_texto_plano(self):
+        Usuario.objects.filter(pk=self.otro.pk).update(contrasena="plana")
+        # Sin la migración, login ya no compara en texto plano
+        datos = {"correo": "jo@test.com", "contrasena": "plana"}
+        self.assertEqual(
+            self.client.post("/api/login/", datos, content_type="application/json").status_code, 400
+        )
+
+        hash_dueno = make_password("x")
+        Usuario.objects.filter(pk=self.dueno.pk).update(contrasena=hash_dueno)
+        migracion = import_module("smartcar_app.migrations.0016_hashear_contrasenas")
+        migracion.hashear_contrasenas(apps, None)
+        guardada = Usuario.objects.get(pk=self.otro.pk).contrasena
+        self.assertNotEqual(guardada, "plana")
+        self.assertTrue(check_password("plana", guardada))
+        # Los que ya tenían hash no se tocan
+        self.assertEqual(Usuario.objects.get(pk=self.dueno.pk).contrasena, hash_dueno)
+        self.assertEqual(
+            self.client.post("/api/login/", datos, content_type="application/json").status_code, 200
+        )
+
+    def test_sin_token_401(self):
+        self.assertEqual(self.client.get("/api/health/").status_code, 200)
+        self.assertEqual(self.client.get(f"/api/listas/{self.lista.pk}/").status_code, 401)
+        self.assertEqual(self.client.get(f"/api/items/{self.item.pk}/").status_code, 401)
+        self.assertEqual(self.client.post("/api/listas/", {"nombre": "x"}).status_code, 401)
+        self.assertEqual(
+            self.client.get("/api/listas/", HTTP_AUTHORIZATION="Bearer basura").status_code, 401
+        )
+
+    def test_listas_e_items_de_otro_usuario(self):
+        autenticar(self.client, self.otro)
+        json = {"content_type": "application/json"}
+        lista_url, item_url = f"/api/listas/{self.lista.pk}/", f"/api/items/{self.item.pk}/"
+        for respuesta in (
+            self.client.get(lista_url),
+            self.client.put(lista_url, {"nombre": "robada"}, **json),
+            self.client.delete(lista_url),
+            self.client.get(item_url),
+            self.client.put(item_url, {"nombre": "robado"}, **json),
+            self.client.delete(item_url),
+            self.client.get(f"/api/items/?lista_id={self.lista.pk}"),
+            self.client.post("/api/items/", {"lista_id": self.lista.pk, "nombre": "x"}, **json),
+            self.client.post("/api/items/bulk/", {"lista_id": self.lista.pk}, **json),
+            self.client.get(f"/api/resumen_lista/{self.lista.pk}/"),
+            self.client.get(f"/api/recomendaciones/{self.lista.pk}/"),
+            self.client.get(f"/api/listas/{self.lista.pk}/pantalla/"),
+            self.client.post(f"/api/listas/{self.lista.pk}/optimizar/", {}, **json),
+            self.client.get(f"/api/listas/{self.lista.pk}/alertas/"),
+            self.client.post(f"/api/listas/{self.lista.pk}/alertas/vistas/"),
+        ):
+            self.assertEqual(respuesta.status_code, 404, respuesta.request["PATH_INFO"])
+
+        self.assertEqual(
+            self.client.get(f"/api/listas/?usuario_id={self.dueno.pk}").status_code, 403
+        )
+        self.assertEqual(self.client.get(f"/api/usuarios/{self.dueno.pk}/").status_code, 403)
+        # Tampoco se puede mover un item propio a la lista de otro
+        propia = Lista.objects.create(usuario=self.otro, nombre="Suya")
+        mio = Item.objects.create(lista=propia, nombre="leche")
+        respuesta = self.client.put(f"/api/items/{mio.pk}/", {"lista": self.lista.pk}, **json)
+        self.assertEqual(respuesta.status_code, 404)
 
-# Create your tests here.
+        lista = Lista.todos.get(pk=self.lista.pk)
+        self.assertEqual((lista.nombre, lista.deleted_at), ("Mía", None))
+        self.assertEqual(Item.objects.get(pk=self.item.pk).nombre, "pan")
@@ -0,0 +1,164 @@
+from decimal import Decimal
+
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Lista, Item
+
+
+# ===========================
+# Expresión SQL del subtotal de un item
+# ===========================
+SUBTOTAL_ITEM = ExpressionWrapper(
+    F("cantidad") * F("precio_unitario"),
+    output_field=DecimalField(max_digits=20, decimal_places=4),
+)
+
+# Agregados de una lista que se mantienen en la propia fila de Lista.
+# nombre del campo en Lista -> agregado SQL equivalente sobre sus items
+AGREGADOS_LISTA = {
+    "total_calculado": Sum(SUBTOTAL_ITEM),
+    "numero_items": Count("id"),
+    "items_comprados": Count("id", filter=Q(comprado=True)),
+    "total_pendiente": Sum(SUBTOTAL_ITEM, filter=Q(comprado=False)),
+}
+
+CAMPOS_CONTADOR = ("numero_items", "items_comprados")
+
+
+def subtotal_de(cantidad, precio_unitario):
+    """
+    Subtotal de un item a partir de sus valores (None cuenta como 0).
+    """
+    return (cantidad or Decimal("0")) * (precio_unitario or Decimal("0"))
+
+
+# Campos de un item que afectan los agregados de su lista y el historial
+CAMPOS_APORTE = (
+    "lista_id",
+    "categoria",
+    "cantidad",
+    "precio_unitario",
+    "comprado",
+    "precio_pagado",
+    "cantidad_comprada",
+    "fecha_agregado",
+    "fecha_comprado",
+)
+
+
+def valores_item(item):
+    """
+    Los campos de un item que afectan los agregados (ver CAMPOS_APORTE).
+    """
+    return {campo: getattr(item, campo) for campo in CAMPOS_APORTE}
+
+
+def aporte_item(valores):
+    """
+    Lo que un item aporta a cada agregado de su lista.
+    """
+    subtotal = subtotal_de(valores["cantidad"], valores["precio_unitario"])
+    return {
+        "total_calculado": subtotal,
+        "numero_items": 1,
+        "items_comprados": 1 if valores["comprado"] else 0,
+        "total_pendiente": Decimal("0") if valores["comprado"] else subtotal,
+    }
+
+
+def aplicar_cambio_item(lista_id, anterior=None, nuevo=None):
+    """
+    Aplica a la lista la diferencia entre el aporte 'anterior' y el 'nuevo'
+    de un item (dicts como los de valores_item; None = no existía / ya no
+    existe), directamente en la base de datos:
+
+        UPDATE listas SET total_calculado = total_calculado + delta, ...
+
+    No lee los items ni la lista, y como la suma la hace el motor no se
+    pisan dos ediciones concurrentes. Debe llamarse dentro de la misma
+    transacción que la escritura del item.
+
+    También incrementa Lista.version: cualquier cambio en un item invalida
+    lo que se haya memoizado por versión.
+    """
+    cambios = {"version": F("version") + 1, "updated_at": timezone.now()}
+    antes = aporte_item(anterior) if anterior else {}
+    despues = aporte_item(nuevo) if nuevo else {}
+    for campo in AGREGADOS_LISTA:
+        delta = despues.get(campo, 0) - antes.get(campo, 0)
+        if delta:
+            cambios[campo] = F(campo) + delta
+    Lista.objects.filter(pk=lista_id).update(**cambios)
+
+
+def agregado_real_subquery(campo):
+    """
+    Subquery con el valor real de un agregado para cada lista (OuterRef("pk")).
+    """
+    valor = (
+        Item.objects.filter(lista_id=OuterRef("pk"))
+        .order_by()
+        .values("lista_id")
+        .annotate(valor=AGREGADOS_LISTA[campo])
+        .values("valor")
+    )
+    if campo in CAMPOS_CONTADOR:
+        output_field = IntegerField()
+        cero = 0
+    else:
+        output_field = DecimalField(max_digits=20, decimal_places=4)
+        cero = Decimal("0")
+    return Coalesce(
+        Subquery(valor, output_field=output_field),
+        cero,
+        output_field=output_field,
+    )
+
+
+def agregado_vigente(campo):
+    """
+    El valor guardado en Lista si está al día; si no, el agregado real
+    calculado en SQL (el CASE sólo evalúa la subquery en listas desfasadas).
+    """
+    real = agregado_real_subquery(campo)
+    return Case(
+        When(resumen_al_dia=True, then=F(campo)),
+        default=real,
+        output_field=real.output_field,
+    )
+
+
+def recalcular_total(lista, incrementar_version=False):
+    """
+    Recalcula desde cero los agregados de una lista con un solo query de
+    SUM/COUNT en la base de datos y los deja marcados como al día. Se usa
+    para reparar totales o tras operaciones masivas (con
+    incrementar_version=True si los items cambiaron); las escrituras
+    normales de items usan aplicar_cambio_item.
+    """
+    valores = lista.items.aggregate(**AGREGADOS_LISTA)
+    for campo, valor in valores.items():
+        if valor is None:
+            valores[campo] = 0 if campo in CAMPOS_CONTADOR else Decimal("0")
+    cambios = dict(valores, resumen_al_dia=True, updated_at=timezone.now())
+    if incrementar_version:
+        cambios["version"] = F("version") + 1
+    Lista.objects.filter(pk=lista.pk).update(**cambios)
+    for campo, valor in valores.items():
+        setattr(lista, campo, valor)
+    lista.resumen_al_dia = True
+    return valores["total_calculado"]
@@ -13,22 +13,52 @@ urlpatterns = [
 
     # ✅ NUEVO: detalle de una lista específica
     path("listas/<int:lista_id>/", views.lista_detalle, name="lista_detalle"),
+    # Pantalla de una lista: lista + items + resumen + recomendaciones en una petición
+    path("listas/<int:lista_id>/pantalla/", views.pantalla_lista, name="pantalla_lista"),
+    # Alertas de presupuesto de una lista
+    path("listas/<int:lista_id>/alertas/", views.alertas_lista, name="alertas_lista"),
+    path(
+        "listas/<int:lista_id>/alertas/vistas/",
+        views.marcar_alertas_vistas,
+        name="marcar_alertas_vistas",
+    ),
+
+    # Dispositivos para notificaciones push
+    path("dispositivos/", views.dispositivos, name="dispositivos"),
 
     # ✅ Items (obtener y crear)
     path("items/", views.items, name="items"),
 
+    # Items en lote (crear/editar/borrar varios de una lista)
+    path("items/bulk/", views.items_bulk, name="items_bulk"),
+
     # ✅ NUEVO: detalle de un item específico
     path("items/<int:item_id>/", views.item_detalle, name="item_detalle"),
     
+    # Sync incremental (cambios y tombstones desde un watermark)
+    path("sync/", views.sync, name="sync"),
+    
     #Resumen
     path("resumen_lista/<int:lista_id>/", views.resumen_lista, name="resumen_lista"),
+    # Resumen de todas las listas de un usuario (un solo query)
+    path("resumen_listas/", views.resumen_listas, name="resumen_listas"),
 
     #Recomendaciones
     path("recomendaciones/<int:lista_id>/", views.recomendaciones, name="recomendaciones"),
+    # Qué comprar con el presupuesto que queda (mochila por prioridad)
+    path("listas/<int:lista_id>/optimizar/", views.optimizar_compra, name="optimizar_compra"),
+
+    # Eventos de KPIs (se reciben en lote y se guardan en segundo plano)
+    path("eventos/", views.eventos, name="eventos"),
+    # KPIs (leen sólo los rollups de eventos)
+    path("kpis/diarios/", views.kpis_diarios, name="kpis_diarios"),
+    path("kpis/mensuales/", views.kpis_mensuales, name="kpis_mensuales"),
 
-    # 🧾 Historial - crear registro
+    # 🧾 Historial - recalcular desde los items
     path("historial/", views.guardar_historial, name="guardar_historial"),
     # 🧾 Historial - obtener historial de un usuario
     path("historial/<int:usuario_id>/", views.historial_usuario, name="historial_usuario"),
+    # Analítica de gasto: por categoría, mes, tienda y planeado vs pagado
+    path("gastos/<int:usuario_id>/<str:vista>/", views.gastos_usuario, name="gastos_usuario"),
 
 ]
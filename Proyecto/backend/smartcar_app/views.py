@@ -1,9 +1,75 @@
-from rest_framework.decorators import api_view
+from decimal import Decimal
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-
-from .models import Usuario, Lista, Item, Historial
-from .serializers import UsuarioSerializer, ListaSerializer, ItemSerializer, HistorialSerializer
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.db.models import F, Max, Prefetch, prefetch_related_objects
+
+from .models import (
+    Usuario,
+    Lista,
+    Item,
+    MejorPrecio,
+    Alerta,
+    Dispositivo,
+    Historial,
+    Evento,
+    KpiDiario,
+    KpiMensualUsuario,
+)
+from .serializers import (
+    UsuarioSerializer,
+    ListaSerializer,
+    ItemSerializer,
+    ItemConPreciosSerializer,
+    ItemBulkSerializer,
+    HistorialSerializer,
+    EventoEntradaSerializer,
+    KpiDiarioSerializer,
+    KpiMensualUsuarioSerializer,
+    AlertaSerializer,
+    DispositivoSerializer,
+    ListaSyncSerializer,
+    ItemSyncSerializer,
+    TombstoneSerializer,
+)
+from .totales import (
+    CAMPOS_APORTE,
+    aplicar_cambio_item,
+    valores_item,
+    recalcular_total,
+    agregado_vigente,
+)
+from .condicional import (
+    con_validadores,
+    etag_item,
+    etag_lista,
+    no_modificado,
+    variante_de,
+    version_esperada,
+)
+from .gastos import (
+    aplicar_cambio_historial,
+    aplicar_cambios_historial,
+    usuario_de_lista,
+)
+from .reglas import recomendaciones_para
+from .optimizador import CriteriosInvalidos, leer_criterios, optimizar_lista
+from .alertas import estado_de, evaluar_alerta, nivel_alerta
+from .anomalias import marcar_atipicos, precio_atipico
+from .analitica import VISTAS_GASTO, PeriodoInvalido, analitica_gasto, leer_periodo
+from .lectura_rapida import LECTURA_ITEMS, LECTURA_ITEMS_PRECIOS, LECTURA_LISTAS
+from .precios import normalizar_nombre, olvidar_precios
+from .paginacion import CursorInvalido, paginar_keyset, quiere_paginar
+from .autenticacion import EsAdministrador, emitir_token, TOKEN_MAX_AGE
+from .eventos import buffer_eventos, ColaLlena
+from .sincronizacion import WatermarkInvalido, cambios_desde, codificar_watermark, leer_watermark
 
 
 # ===========================
@@ -20,15 +86,108 @@ def get_demo_user():
         usuario = Usuario.objects.create(
             nombre="Demo",
             correo="demo@smartcar.test",
-            contrasena="1234",
+            contrasena=make_password("1234"),
         )
     return usuario
 
 
+# ===========================
+# Helper: usuario de la petición
+# ===========================
+def resolver_usuario_id(request, usuario_id):
+    """
+    El usuario sale del token (request.user, sin ir a la base de datos).
+    Todos los endpoints salvo login, registro y salud exigen token
+    (DEFAULT_PERMISSION_CLASSES); el usuario_id que mande el cliente es
+    opcional y, si no es el del token, responde 403.
+
+    Devuelve (usuario_id, None) o (None, Response de error).
+    """
+    if usuario_id and str(usuario_id) != str(request.user.id):
+        return None, Response(
+            {"detail": "No puedes acceder a datos de otro usuario."},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+    return request.user.id, None
+
+
+def lista_no_encontrada():
+    # También cuando la lista es de otro usuario: no se revela que existe
+    return Response({"detail": "Lista no encontrada"}, status=status.HTTP_404_NOT_FOUND)
+
+
+# ===========================
+# Helper: respuesta de listados (con paginación opcional por cursor)
+# ===========================
+def responder_listado(
+    request, qs, clave, serializer_class, campo_fecha, descendente=True, lectura=None
+):
+    """
+    Devuelve {clave: [...]} como siempre. Si el cliente manda 'cursor' o
+    'page_size' en la URL, pagina por (campo_fecha, id) y agrega
+    'siguiente_cursor' (null en la última página) al mismo envelope.
+
+    Con 'lectura' (ver lectura_rapida.py) se lee con .values() y se arma
+    el mismo JSON que daría serializer_class, sin instanciar modelos.
+    """
+    if lectura is not None:
+        qs = lectura.consulta(qs)
+        representar = lectura.representar
+    else:
+        representar = lambda objetos: serializer_class(objetos, many=True).data
+
+    if not quiere_paginar(request):
+        return Response({clave: representar(qs)}, status=status.HTTP_200_OK)
+
+    try:
+        objetos, siguiente = paginar_keyset(qs, request, campo_fecha, descendente)
+    except CursorInvalido as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(
+        {clave: representar(objetos), "siguiente_cursor": siguiente},
+        status=status.HTTP_200_OK,
+    )
+
+
+# ===========================
+# Helper: conflicto de versión (concurrencia optimista)
+# ===========================
+def leer_version_esperada(request, pk):
+    """
+    (version, error_response): la versión que manda el cliente en If-Match
+    o en el body, o un 400 si no se puede leer.
+    """
+    try:
+        return version_esperada(request, pk), None
+    except ValueError as e:
+        return None, Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def responder_conflicto(actual, serializer_class, etag):
+    """
+    409 con el estado vigente del recurso, para que el cliente pueda
+    mezclar sus cambios y reintentar con la nueva versión.
+    """
+    return con_validadores(
+        Response(
+            {
+                "detail": "El recurso cambió desde que lo leíste; recarga y reintenta.",
+                "version": actual.version,
+                "actual": serializer_class(actual).data,
+            },
+            status=status.HTTP_409_CONFLICT,
+        ),
+        etag,
+        actual.updated_at,
+    )
+
+
 # ===========================
 # ENDPOINT DE SALUD
 # ===========================
 @api_view(["GET"])
+@permission_classes([AllowAny])
 def health(request):
     """
     Endpoint simple para probar que el backend está vivo.
@@ -41,6 +200,7 @@ def health(request):
 # HOLA MUNDO (PRUEBA)
 # ===========================
 @api_view(["GET"])
+@permission_classes([AllowAny])
 def hola_mundo(request):
     """
     GET /api/hola/
@@ -52,6 +212,7 @@ def hola_mundo(request):
 # USUARIOS
 # ===========================
 @api_view(["POST"])
+@permission_classes([AllowAny])
 def crear_usuario(request):
     """
     Crea un usuario nuevo.
@@ -82,9 +243,12 @@ def crear_usuario(request):
 @api_view(["GET"])
 def obtener_usuario(request, user_id):
     """
-    Obtiene la info de un usuario por id.
+    Obtiene la info de un usuario por id (sólo la del propio usuario).
     GET /api/usuarios/<user_id>/
     """
+    user_id, error = resolver_usuario_id(request, user_id)
+    if error:
+        return error
     try:
         usuario = Usuario.objects.get(pk=user_id)
     except Usuario.DoesNotExist:
@@ -98,15 +262,18 @@ def obtener_usuario(request, user_id):
 
 
 @api_view(["POST"])
+@permission_classes([AllowAny])
 def login(request):
     """
-    Login muy sencillo (NO para producción).
+    Login: verifica la contraseña (con hash) y devuelve un token firmado.
     POST /api/login/
     Body JSON:
     {
         "correo": "lina@example.com",
         "contrasena": "1234"
     }
+
+    Las siguientes peticiones deben mandar "Authorization: Bearer <token>".
     """
     correo = request.data.get("correo")
     contrasena = request.data.get("contrasena")
@@ -117,84 +284,101 @@ def login(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
+    credenciales_invalidas = Response(
+        {"detail": "Credenciales inválidas"},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
     try:
-        # OJO: esto compara la contraseña en texto plano.
-        usuario = Usuario.objects.get(correo=correo, contrasena=contrasena)
+        usuario = Usuario.objects.get(correo=correo)
     except Usuario.DoesNotExist:
-        return Response(
-            {"detail": "Credenciales inválidas"},
-            status=status.HTTP_400_BAD_REQUEST,
-        )
+        return credenciales_invalidas
+
+    # Todas las contraseñas están con hash (las viejas las pasó la migración 0016)
+    if not check_password(contrasena, usuario.contrasena):
+        return credenciales_invalidas
 
     # Lo que le vamos a devolver al frontend
     data = {
         "id": usuario.id,
         "nombre": usuario.nombre,
         "correo": usuario.correo,
+        "token": emitir_token(usuario),
+        "expira_en": TOKEN_MAX_AGE,
     }
     return Response(data, status=status.HTTP_200_OK)
 
 @api_view(["POST"])
 def guardar_historial(request):
     """
-    Crea un registro de historial.
-
-    POST /api/historial/
+    POST /api/historial/  -> devuelve el historial del usuario, el mismo
+    que GET /api/historial/<usuario_id>/ sin paginar.
+
+    Historial es un agregado por (usuario, mes) que se mantiene solo con
+    cada escritura de items (ver gastos.py): ya no se aceptan totales del
+    cliente ni se recalcula nada aquí (para reparar desvíos está el comando
+    reconstruir_historial). Los campos "mes", "total", etc. del body se
+    ignoran; sólo se revisa "usuario_id" (o "usuario") si viene.
+    """
+    usuario_id, error = resolver_usuario_id(
+        request, request.data.get("usuario") or request.data.get("usuario_id")
+    )
+    if error:
+        return error
+
+    qs = Historial.objects.filter(usuario_id=usuario_id).order_by("-mes", "-id")
+    return Response(
+        {"historial": HistorialSerializer(qs, many=True).data},
+        status=status.HTTP_200_OK,
+    )
 
-    Body JSON esperado:
-    {
-        "usuario_id": 3,
-        "mes": "2025-10",
-        "total": 250000,
-        "numero_items": 12,
-        "promedio_por_categoria": 35000
-    }
+@api_view(["GET"])
+def historial_usuario(request, usuario_id):
     """
+    GET /api/historial/3/
+    Devuelve historial completo del usuario con id=3, del mes más reciente
+    al más viejo (paginado con ?page_size=50&cursor=... si se pide)
+    """
+    usuario_id, error = resolver_usuario_id(request, usuario_id)
+    if error:
+        return error
+    qs = Historial.objects.filter(usuario_id=usuario_id).order_by("-mes", "-id")
+    return responder_listado(request, qs, "historial", HistorialSerializer, "mes")
 
-    data = request.data.copy()
 
-    # Aceptamos tanto "usuario" como "usuario_id"
-    usuario_id = data.get("usuario") or data.get("usuario_id")
 
-    if not usuario_id:
+# ===========================
+# ANALÍTICA DE GASTO (ver analitica.py)
+# ===========================
+@api_view(["GET"])
+def gastos_usuario(request, usuario_id, vista):
+    """
+    GET /api/gastos/<usuario_id>/<vista>/?desde=2025-01&hasta=2025-06
+        vista: categorias | meses | tiendas | planeado_vs_pagado
+    Cada vista es un solo query agregado en la base, cacheado hasta la
+    próxima escritura del usuario.
+    """
+    usuario_id, error = resolver_usuario_id(request, usuario_id)
+    if error:
+        return error
+    if vista not in VISTAS_GASTO:
         return Response(
-            {"detail": "Debes enviar 'usuario_id' (o 'usuario') en el body."},
-            status=status.HTTP_400_BAD_REQUEST,
+            {"detail": f"Vista desconocida. Opciones: {', '.join(VISTAS_GASTO)}."},
+            status=status.HTTP_404_NOT_FOUND,
         )
-
     try:
-        usuario = Usuario.objects.get(pk=usuario_id)
-    except Usuario.DoesNotExist:
-        return Response(
-            {"detail": f"Usuario con id={usuario_id} no existe."},
-            status=status.HTTP_404_NOT_FOUND,
+        desde, hasta = leer_periodo(
+            request.query_params.get("desde"), request.query_params.get("hasta")
         )
+    except PeriodoInvalido as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Lo que espera el serializer
-    data["usuario"] = usuario.id
-
-    serializer = HistorialSerializer(data=data)
-    if serializer.is_valid():
-        registro = serializer.save()
+    resultado = analitica_gasto(usuario_id, vista, desde, hasta)
+    if resultado is None:
         return Response(
-            HistorialSerializer(registro).data,
-            status=status.HTTP_201_CREATED,
+            {"detail": "Usuario no encontrado"},
+            status=status.HTTP_404_NOT_FOUND,
         )
-
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-@api_view(["GET"])
-def historial_usuario(request, usuario_id):
-    """
-    GET /api/historial/3/
-    Devuelve historial completo del usuario con id=3
-    """
-    qs = Historial.objects.filter(usuario_id=usuario_id).order_by("-fecha_registro")
-    serializer = HistorialSerializer(qs, many=True)
-    return Response({"historial": serializer.data}, status=status.HTTP_200_OK)
-
-
-
+    return Response({vista: resultado}, status=status.HTTP_200_OK)
 
 
 # ===========================
@@ -203,73 +387,44 @@ def historial_usuario(request, usuario_id):
 @api_view(["GET", "POST"])
 def listas(request):
     """
-    GET /api/listas/?usuario_id=1   -> devuelve listas del usuario
-    POST /api/listas/              -> crea una lista nueva
+    GET /api/listas/   -> devuelve listas del usuario del token
+        (opcional: &page_size=50&cursor=... para paginar por cursor)
+    POST /api/listas/  -> crea una lista nueva del usuario del token
 
     Body POST esperado desde Flutter ahora:
     {
         "nombre": "Lista mercado",
         "presupuesto": 150000,   (opcional)
-        "usuario_id": 3          (obligatorio ahora para multiusuario)
     }
 
-    También aceptamos "usuario" en lugar de "usuario_id".
+    "usuario_id" (o "usuario") se acepta pero tiene que ser el del token.
     """
 
     # ---------- GET ----------
     if request.method == "GET":
-        usuario_id = request.query_params.get("usuario_id")
-
-        if not usuario_id:
-            return Response(
-                {"detail": "Parametro 'usuario_id' es requerido en la URL."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        usuario_id, error = resolver_usuario_id(request, request.query_params.get("usuario_id"))
+        if error:
+            return error
 
         qs = Lista.objects.filter(usuario_id=usuario_id).order_by("-fecha_creacion")
-        serializer = ListaSerializer(qs, many=True)
         # Para que cuadre con ApiService: envolvemos en {"listas": [...]}
-        return Response({"listas": serializer.data}, status=status.HTTP_200_OK)
+        return responder_listado(
+            request, qs, "listas", ListaSerializer, "fecha_creacion", lectura=LECTURA_LISTAS
+        )
 
     # ---------- POST ----------
-    # Aquí YA NO usamos get_demo_user por defecto;
-    # exigimos que nos digan para qué usuario es la lista.
+    # El usuario sale del token y no se consulta la tabla usuarios.
     data = request.data.copy()
+    usuario_id, error = resolver_usuario_id(
+        request, data.get("usuario") or data.get("usuario_id")
+    )
+    if error:
+        return error
+    serializer = ListaSerializer(data=data, context={"usuario_id": usuario_id})
 
-    # Aceptamos tanto "usuario" como "usuario_id" desde el frontend
-    usuario_id = data.get("usuario") or data.get("usuario_id")
-
-    if not usuario_id:
-        return Response(
-            {
-                "detail": "Debes enviar 'usuario_id' (o 'usuario') en el body para crear una lista."
-            },
-            status=status.HTTP_400_BAD_REQUEST,
-        )
-
-    try:
-        usuario = Usuario.objects.get(pk=usuario_id)
-    except Usuario.DoesNotExist:
-        return Response(
-            {"detail": f"Usuario con id={usuario_id} no existe."},
-            status=status.HTTP_404_NOT_FOUND,
-        )
-
-    # El serializer espera el campo 'usuario' (FK)
-    data["usuario"] = usuario.id
-
-    serializer = ListaSerializer(data=data)
     if serializer.is_valid():
-        lista = serializer.save()
-        usuario = lista.usuario
-        mes = lista.fecha_creacion.strftime("%Y-%m")
-  # 1. Crea un NUEVO registro de Historial para esta lista
-        Historial.objects.create(
-            usuario=usuario,
-            mes=lista.fecha_creacion.strftime("%Y-%m"), # El mes de la lista
-            numero_items=lista.items.count(),
-            total=lista.presupuesto or 0,               # El presupuesto de esta lista
-        )
+        # El historial mensual ya no se toca aquí: lo mantienen los items.
+        lista = serializer.save(usuario_id=usuario_id)
         return Response(
             ListaSerializer(lista).data,
             status=status.HTTP_201_CREATED,
@@ -281,156 +436,398 @@ def listas(request):
 def lista_detalle(request, lista_id):
     """
     GET    /api/listas/<lista_id>/   -> detalle de una lista
+        (con ETag / Last-Modified; If-None-Match responde 304)
     PUT    /api/listas/<lista_id>/   -> actualizar una lista
     DELETE /api/listas/<lista_id>/   -> borrar una lista
+
+    PUT y DELETE aceptan If-Match (el ETag del GET) o "version" en el body:
+    si la lista cambió mientras tanto responden 409 con el estado actual.
     """
     try:
-        lista = Lista.objects.get(pk=lista_id)
+        lista = Lista.objects.get(pk=lista_id, usuario_id=request.user.id)
     except Lista.DoesNotExist:
-        return Response(
-            {"detail": "Lista no encontrada"},
-            status=status.HTTP_404_NOT_FOUND,
-        )
+        return lista_no_encontrada()
 
     if request.method == "GET":
+        etag = etag_lista(lista.pk, lista.version, lista.updated_at)
+        no_cambio = no_modificado(request, etag, lista.updated_at)
+        if no_cambio:
+            return no_cambio
         serializer = ListaSerializer(lista)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return con_validadores(
+            Response(serializer.data, status=status.HTTP_200_OK), etag, lista.updated_at
+        )
 
     if request.method == "PUT":
         data = request.data.copy()
 
-        # Si quisieran cambiar el usuario de la lista, controlamos igual:
-        if "usuario_id" in data and "usuario" not in data:
-            data["usuario"] = data["usuario_id"]
+        # El dueño no se cambia: con context["usuario_id"] el campo es de sólo lectura
+        serializer = ListaSerializer(
+            lista, data=data, partial=True, context={"usuario_id": request.user.id}
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        esperada, error = leer_version_esperada(request, lista.pk)
+        if error:
+            return error
+        if esperada is not None and esperada != lista.version:
+            return responder_conflicto(
+                lista, ListaSerializer, etag_lista(lista.pk, lista.version, lista.updated_at)
+            )
 
-        serializer = ListaSerializer(lista, data=data, partial=True)
-        if serializer.is_valid():
-            lista = serializer.save()
-            return Response(
-                ListaSerializer(lista).data,
-                status=status.HTTP_200_OK,
+        # Un solo UPDATE ... WHERE version = n, con la versión leída arriba
+        # (igual a la esperada si el cliente la mandó), como en item_detalle
+        cambios = dict(serializer.validated_data, updated_at=timezone.now())
+        with transaction.atomic():
+            actualizadas = Lista.objects.filter(pk=lista.pk, version=lista.version).update(
+                version=F("version") + 1, **cambios
             )
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            if actualizadas and "presupuesto" in cambios:
+                evaluar_alerta(lista.pk)
+        if not actualizadas:
+            actual = Lista.objects.filter(pk=lista.pk).first()
+            if actual is None:
+                return Response({"detail": "Lista no encontrada"}, status=status.HTTP_404_NOT_FOUND)
+            return responder_conflicto(
+                actual, ListaSerializer, etag_lista(actual.pk, actual.version, actual.updated_at)
+            )
+
+        for campo, valor in cambios.items():
+            setattr(lista, campo, valor)
+        lista.version += 1
+        if "presupuesto" in cambios:
+            lista.estado = estado_de(lista.total_calculado, lista.presupuesto)
+            lista.alerta_activa = nivel_alerta(lista.total_calculado, lista.presupuesto)
+        return con_validadores(
+            Response(ListaSerializer(lista).data, status=status.HTTP_200_OK),
+            etag_lista(lista.pk, lista.version, lista.updated_at),
+            lista.updated_at,
+        )
 
     if request.method == "DELETE":
-        lista.delete()
+        esperada, error = leer_version_esperada(request, lista.pk)
+        if error:
+            return error
+        if esperada is not None and esperada != lista.version:
+            return responder_conflicto(
+                lista, ListaSerializer, etag_lista(lista.pk, lista.version, lista.updated_at)
+            )
+        filtro = {"pk": lista.pk, "version": lista.version}
+        # Borrado lógico (queda como tombstone para /api/sync/), con sus items
+        ahora = timezone.now()
+        borrado = {"deleted_at": ahora, "updated_at": ahora, "version": F("version") + 1}
+        with transaction.atomic():
+            borradas = Lista.objects.filter(**filtro).update(**borrado)
+            if borradas:
+                # El aporte de cada item vigente se resta de su mes antes de borrarlo
+                anteriores = list(Item.objects.filter(lista_id=lista.pk).values(*CAMPOS_APORTE))
+                Item.objects.filter(lista_id=lista.pk).update(**borrado)
+                for valores in anteriores:
+                    valores["usuario_id"] = lista.usuario_id
+                aplicar_cambios_historial(anteriores=anteriores)
+        if not borradas:
+            actual = Lista.objects.filter(pk=lista.pk).first()
+            if actual is None:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            return responder_conflicto(
+                actual, ListaSerializer, etag_lista(actual.pk, actual.version, actual.updated_at)
+            )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def armar_resumen(presupuesto, total, numero_items, items_comprados, total_pendiente):
+    return {
+        "presupuesto": presupuesto,
+        "total": total,
+        "supera_presupuesto": total > presupuesto,
+        "numero_items": numero_items,
+        "items_comprados": items_comprados,
+        "total_pendiente": total_pendiente,
+    }
+
+
 @api_view(["GET"])
 def resumen_lista(request, lista_id):
+    """
+    GET /api/resumen_lista/<lista_id>/
+    Sale de los agregados guardados en la lista (un solo SELECT por pk).
+    Si la lista está marcada como desfasada se recalcula con un SUM en SQL.
+    """
     try:
-        lista = Lista.objects.get(id=lista_id)
+        lista = Lista.objects.get(id=lista_id, usuario_id=request.user.id)
     except Lista.DoesNotExist:
-        return Response(
-            {"detail": "Lista no encontrada"},
-            status=status.HTTP_404_NOT_FOUND,
-        )
+        return lista_no_encontrada()
 
-    total = sum(item.cantidad * item.precio_unitario for item in lista.items.all())
-    data = {
-        "presupuesto": lista.presupuesto,
-        "total": total,
-        "supera_presupuesto": total > lista.presupuesto,
-    }
+    if not lista.resumen_al_dia:
+        recalcular_total(lista)
+
+    data = armar_resumen(
+        lista.presupuesto,
+        lista.total_calculado,
+        lista.numero_items,
+        lista.items_comprados,
+        lista.total_pendiente,
+    )
     return Response(data)
 
 
+@api_view(["GET"])
+def resumen_listas(request):
+    """
+    GET /api/resumen_listas/
+    Resumen de todas las listas del usuario del token en un solo query.
+    """
+    usuario_id, error = resolver_usuario_id(request, request.query_params.get("usuario_id"))
+    if error:
+        return error
+
+    filas = (
+        Lista.objects.filter(usuario_id=usuario_id)
+        .order_by("-fecha_creacion")
+        .values("id", "nombre", "presupuesto")
+        .annotate(
+            total=agregado_vigente("total_calculado"),
+            n_items=agregado_vigente("numero_items"),
+            n_comprados=agregado_vigente("items_comprados"),
+            pendiente=agregado_vigente("total_pendiente"),
+        )
+    )
+    resumenes = []
+    for fila in filas:
+        resumen = {"lista_id": fila["id"], "nombre": fila["nombre"]}
+        resumen.update(
+            armar_resumen(
+                fila["presupuesto"],
+                fila["total"],
+                fila["n_items"],
+                fila["n_comprados"],
+                fila["pendiente"],
+            )
+        )
+        resumenes.append(resumen)
+    return Response({"resumenes": resumenes}, status=status.HTTP_200_OK)
+
+
 @api_view(["GET"])
 def recomendaciones(request, lista_id):
+    """
+    GET /api/recomendaciones/<lista_id>/
+    Las reglas están en reglas.py y se alimentan de un query agregado (más
+    un .first() por cada regla que nombra un item y aplica); el resultado
+    queda memoizado por Lista.version.
+    """
     try:
-        lista = Lista.objects.get(id=lista_id)
+        lista = Lista.objects.get(id=lista_id, usuario_id=request.user.id)
     except Lista.DoesNotExist:
-        return Response(
-            {"detail": "Lista no encontrada"},
-            status=status.HTTP_404_NOT_FOUND,
-        )
+        return lista_no_encontrada()
 
-    items = lista.items.all()
-    recomendaciones = []
-
-    # 1. Si supera presupuesto
-    total = sum(i.cantidad * i.precio_unitario for i in items)
-    if total > lista.presupuesto:
-        recomendaciones.append("Has superado el presupuesto, considera reducir gastos.")
-
-    # 2. Categorías con más gasto
-    categorias = {}
-    for i in items:
-        subtotal = i.cantidad * i.precio_unitario
-        if i.categoria:
-            categorias[i.categoria] = categorias.get(i.categoria, 0) + subtotal
-    if categorias:
-        cat_mayor = max(categorias, key=categorias.get)
-        recomendaciones.append(f"Estás gastando mucho en '{cat_mayor}'.")
-
-    # 3. Cantidades demasiado grandes
-    for i in items:
-        if i.cantidad >= 10:
-            recomendaciones.append(
-                f"La cantidad del ítem '{i.nombre}' es bastante alta. Revisa si realmente necesitas tanto."
-            )
-            break
+    return Response(recomendaciones_para(lista))
 
-    # 4. Ítems de precio elevado
-    for i in items:
-        if i.precio_unitario > 30000:
-            recomendaciones.append(
-                f"El ítem '{i.nombre}' tiene un precio elevado. Considera buscar alternativas más económicas."
-            )
-            break
-
-    # 5. Ítems duplicados
-    nombres = {}
-    for i in items:
-        nombres[i.nombre] = nombres.get(i.nombre, 0) + 1
-
-    duplicados = [n for n, count in nombres.items() if count > 1]
-    if duplicados:
-        recomendaciones.append(
-            f"Tienes ítems duplicados en la lista: {', '.join(duplicados)}. "
-            "Elimina uno de ellos para evitar compras innecesarias."
-        )
 
-    # 6. Lista con pocos ítems
-    if len(items) <= 2:
-        recomendaciones.append(
-            "Tu lista tiene pocos ítems. ¿Seguro que no olvidaste agregar algo importante?"
-        )
+@api_view(["POST"])
+def optimizar_compra(request, lista_id):
+    """
+    POST /api/listas/<lista_id>/optimizar/
+        body (opcional): { "pesos": {"A": 5, "M": 3, "B": 1}, "presupuesto": "120000" }
+        -> qué items pendientes comprar, y en qué orden, para aprovechar mejor
+        el presupuesto según la prioridad (ver optimizador.py). Queda guardado
+        como Recomendacion; repetirlo sin cambios en la lista sale de la cache.
+    """
+    try:
+        criterios = leer_criterios(request.data)
+    except CriteriosInvalidos as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    lista = (
+        Lista.objects.filter(pk=lista_id, usuario_id=request.user.id)
+        .only("id", "version", "presupuesto")
+        .first()
+    )
+    if lista is None:
+        return lista_no_encontrada()
+
+    return Response(optimizar_lista(lista, criterios), status=status.HTTP_200_OK)
+
+
+# ===========================
+# PANTALLA DE UNA LISTA (lista + items + resumen + recomendaciones)
+# ===========================
+SECCIONES_PANTALLA = ("items", "resumen", "recomendaciones")
 
-    # 7. Valores mal formateados (cantidad o precio 0 o negativo)
-    for i in items:
-        if i.cantidad <= 0:
-            recomendaciones.append(
-                f"El ítem '{i.nombre or '(sin nombre)'}' tiene una cantidad inválida (debe ser mayor a 0)."
+
+@api_view(["GET"])
+def pantalla_lista(request, lista_id):
+    """
+    GET /api/listas/<lista_id>/pantalla/?secciones=items,resumen,recomendaciones
+
+    Todo lo que muestra la pantalla de una lista en una sola petición (en
+    vez de /api/items/, /api/resumen_lista/ y /api/recomendaciones/). Los
+    items se cargan una sola vez y de ellos salen el resumen y las
+    estadísticas de las reglas. 'secciones' es opcional (por defecto
+    todas); "lista" siempre viene. Con ETag: If-None-Match responde 304
+    sin cargar los items.
+    """
+    secciones = request.query_params.get("secciones")
+    if secciones is None:
+        secciones = set(SECCIONES_PANTALLA)
+    else:
+        secciones = {s.strip() for s in secciones.split(",") if s.strip()}
+        desconocidas = secciones - set(SECCIONES_PANTALLA)
+        if desconocidas:
+            return Response(
+                {
+                    "detail": f"Secciones desconocidas: {', '.join(sorted(desconocidas))}. "
+                    f"Válidas: {', '.join(SECCIONES_PANTALLA)}."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            break
 
-        if i.precio_unitario < 0:
-            recomendaciones.append(
-                f"El ítem '{i.nombre or '(sin nombre)'}' tiene un precio negativo, revisa su valor."
+    try:
+        lista = Lista.objects.get(pk=lista_id, usuario_id=request.user.id)
+    except Lista.DoesNotExist:
+        return lista_no_encontrada()
+
+    variante = "pantalla?" + ",".join(sorted(secciones))
+    etag = etag_lista(lista.pk, lista.version, lista.updated_at, variante)
+    no_cambio = no_modificado(request, etag, lista.updated_at)
+    if no_cambio:
+        return no_cambio
+
+    data = {"lista": ListaSerializer(lista).data}
+
+    items_lista = None
+    if "items" in secciones or "recomendaciones" in secciones:
+        prefetch_related_objects(
+            [lista],
+            Prefetch("items", queryset=Item.objects.order_by("fecha_agregado", "id")),
+        )
+        items_lista = list(lista.items.all())
+
+    if "items" in secciones:
+        data["items"] = ItemSerializer(items_lista, many=True).data
+
+    if "resumen" in secciones:
+        if items_lista is not None:
+            # Del mismo conjunto de items que se devuelve
+            total = pendiente = Decimal("0")
+            comprados = 0
+            for item in items_lista:
+                subtotal = item.cantidad * item.precio_unitario
+                total += subtotal
+                if item.comprado:
+                    comprados += 1
+                else:
+                    pendiente += subtotal
+            data["resumen"] = armar_resumen(
+                lista.presupuesto, total, len(items_lista), comprados, pendiente
+            )
+        else:
+            if not lista.resumen_al_dia:
+                recalcular_total(lista)
+            data["resumen"] = armar_resumen(
+                lista.presupuesto,
+                lista.total_calculado,
+                lista.numero_items,
+                lista.items_comprados,
+                lista.total_pendiente,
             )
-            break
 
-    print("RECOMENDACIONES FINALES:", recomendaciones)
-    return Response(recomendaciones)
+    if "recomendaciones" in secciones:
+        data["recomendaciones"] = recomendaciones_para(lista, items_lista)
+
+    return con_validadores(Response(data, status=status.HTTP_200_OK), etag, lista.updated_at)
+
+
+# ===========================
+# ALERTAS DE PRESUPUESTO (las genera alertas.py en cada escritura)
+# ===========================
+@api_view(["GET"])
+def alertas_lista(request, lista_id):
+    """
+    GET /api/listas/<lista_id>/alertas/
+        -> historial de alertas de la lista (más nuevas primero) y cuántas
+        no se han visto. Paginable con ?page_size=&cursor=.
+    """
+    lista = (
+        Lista.objects.filter(pk=lista_id, usuario_id=request.user.id)
+        .values("alerta_ultima_vista_at")
+        .first()
+    )
+    if lista is None:
+        return lista_no_encontrada()
+
+    qs = Alerta.objects.filter(lista_id=lista_id).order_by("-fecha_hora")
+    response = responder_listado(request, qs, "alertas", AlertaSerializer, "fecha_hora")
+    if response.status_code == status.HTTP_200_OK:
+        no_vistas = Alerta.objects.filter(lista_id=lista_id)
+        if lista["alerta_ultima_vista_at"] is not None:
+            no_vistas = no_vistas.filter(fecha_hora__gt=lista["alerta_ultima_vista_at"])
+        response.data["no_vistas"] = no_vistas.count()
+    return response
+
+
+@api_view(["POST"])
+def marcar_alertas_vistas(request, lista_id):
+    """
+    POST /api/listas/<lista_id>/alertas/vistas/
+        -> marca como vistas las alertas de la lista (alerta_ultima_vista_at).
+    """
+    ahora = timezone.now()
+    actualizadas = Lista.objects.filter(pk=lista_id, usuario_id=request.user.id).update(
+        alerta_ultima_vista_at=ahora, updated_at=ahora, version=F("version") + 1
+    )
+    if not actualizadas:
+        return lista_no_encontrada()
+    return Response({"alerta_ultima_vista_at": ahora}, status=status.HTTP_200_OK)
+
+
+# ===========================
+# DISPOSITIVOS (destino de las notificaciones push, ver push.py)
+# ===========================
+@api_view(["POST"])
+def dispositivos(request):
+    """
+    POST /api/dispositivos/
+        body: { "push_token": "...", "plataforma": "ANDROID" }
+        -> registra el dispositivo del usuario del token o, si el token push
+        ya existía (por ejemplo lo desactivó el worker de push, o el teléfono
+        cambió de usuario), lo reasigna a este usuario y lo reactiva.
+    """
+    data = request.data.copy()
+    usuario_id, error = resolver_usuario_id(request, data.get("usuario"))
+    if error:
+        return error
+    data["usuario"] = usuario_id
+    existente = Dispositivo.objects.filter(push_token=data.get("push_token")).first()
+    serializer = DispositivoSerializer(existente, data=data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    dispositivo = serializer.save(activo=True)
+    return Response(
+        DispositivoSerializer(dispositivo).data,
+        status=status.HTTP_200_OK if existente else status.HTTP_201_CREATED,
+    )
 
 
 # ===========================
 # ITEMS
 # ===========================
 
-# Función para actualizar el total de una lista
-def recalcular_total(lista):
-    total = sum(item.cantidad * item.precio_unitario for item in lista.items.all())
-    lista.total_calculado = total
-    lista.save()
+# El total de la lista se mantiene por deltas (ver totales.py):
+# cada escritura de item suma/resta su diferencia de subtotal en la
+# misma transacción. 'python manage.py reconciliar_totales' repara
+# cualquier total que se haya desviado.
 
 
 @api_view(["GET", "POST"])
 def items(request):
     """
     GET  /api/items/?lista_id=10  -> items de una lista
+        (opcional: &page_size=50&cursor=... para paginar por cursor;
+        &precios=1 agrega mejor_precio y mejor_precio_fuente de cada item;
+        con ETag / Last-Modified de la lista: If-None-Match responde 304
+        sin leer los items)
     POST /api/items/              -> crea un item nuevo
     """
 
@@ -443,9 +840,45 @@ def items(request):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        con_precios = request.query_params.get("precios") in ("1", "true")
+
+        # Cualquier cambio en los items incrementa la versión de la lista;
+        # los precios online no, así que con ?precios=1 el ETag incluye
+        # también la fecha del último mejor precio de la lista
+        lista = (
+            Lista.objects.filter(pk=lista_id, usuario_id=request.user.id)
+            .values("version", "updated_at")
+            .first()
+        )
+        if lista is None:
+            return lista_no_encontrada()
+        ultima = lista["updated_at"]
+        variante = variante_de(request, "items")
+        if con_precios:
+            precios_at = MejorPrecio.objects.filter(item__lista_id=lista_id).aggregate(
+                ultima=Max("fecha_consulta")
+            )["ultima"]
+            variante += f"+precios@{precios_at.timestamp() if precios_at else 0}"
+            if precios_at and precios_at > ultima:
+                ultima = precios_at
+        etag = etag_lista(lista_id, lista["version"], lista["updated_at"], variante)
+        no_cambio = no_modificado(request, etag, ultima)
+        if no_cambio:
+            return no_cambio
+
         qs = Item.objects.filter(lista_id=lista_id)
-        serializer = ItemSerializer(qs, many=True)
-        return Response({"items": serializer.data}, status=status.HTTP_200_OK)
+        response = responder_listado(
+            request,
+            qs,
+            "items",
+            ItemConPreciosSerializer if con_precios else ItemSerializer,
+            "fecha_agregado",
+            descendente=False,
+            lectura=LECTURA_ITEMS_PRECIOS if con_precios else LECTURA_ITEMS,
+        )
+        if response.status_code == status.HTTP_200_OK:
+            con_validadores(response, etag, ultima)
+        return response
 
     # ---------- POST ----------
     if request.method == "POST":
@@ -462,8 +895,20 @@ def items(request):
 
         serializer = ItemSerializer(data=data)
         if serializer.is_valid():
-            item = serializer.save()
-            recalcular_total(item.lista)
+            if serializer.validated_data["lista"].usuario_id != request.user.id:
+                return lista_no_encontrada()
+            with transaction.atomic():
+                extra = {"fecha_comprado": timezone.now()} if serializer.validated_data.get("comprado") else {}
+                extra["precio_atipico"] = precio_atipico(
+                    serializer.validated_data.get("nombre"),
+                    serializer.validated_data.get("precio_unitario"),
+                )
+                item = serializer.save(**extra)
+                nuevo = valores_item(item)
+                aplicar_cambio_item(item.lista_id, nuevo=nuevo)
+                evaluar_alerta(item.lista_id)
+                nuevo["usuario_id"] = usuario_de_lista(item.lista_id)
+                aplicar_cambio_historial(nuevo=nuevo)
             return Response(
                 ItemSerializer(item).data,
                 status=status.HTTP_201_CREATED,
@@ -471,10 +916,194 @@ def items(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(["POST"])
+def items_bulk(request):
+    """
+    POST /api/items/bulk/  -> crea, edita y borra varios items de una lista
+    en una sola petición. Todo o nada: si alguna fila tiene errores no se
+    escribe nada y se devuelven los errores por fila (mismo índice que en
+    el body). El total de la lista se recalcula una sola vez.
+
+    Body JSON:
+    {
+        "lista_id": 10,
+        "crear": [{"nombre": "Pan", "cantidad": 2, "precio_unitario": 3500}],
+        "actualizar": [{"id": 7, "comprado": true}],
+        "eliminar": [8, 9]
+    }
+    """
+    data = request.data
+    lista_id = data.get("lista") or data.get("lista_id")
+    if not lista_id:
+        return Response(
+            {"detail": "Debes enviar 'lista_id' (o 'lista') en el body."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        lista = Lista.objects.get(pk=lista_id, usuario_id=request.user.id)
+    except (Lista.DoesNotExist, ValueError):
+        return lista_no_encontrada()
+
+    crear = data.get("crear") or []
+    actualizar = data.get("actualizar") or []
+    eliminar = data.get("eliminar") or []
+    if not all(isinstance(x, list) for x in (crear, actualizar, eliminar)):
+        return Response(
+            {"detail": "'crear', 'actualizar' y 'eliminar' deben ser arreglos."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    errores = {
+        "crear": [{} for _ in crear],
+        "actualizar": [{} for _ in actualizar],
+        "eliminar": [{} for _ in eliminar],
+    }
+
+    # Validación de campos: un serializer many=True por tipo de operación
+    creacion = ItemBulkSerializer(data=crear, many=True)
+    if not creacion.is_valid():
+        errores["crear"] = list(creacion.errors)
+    edicion = ItemBulkSerializer(data=actualizar, many=True, partial=True)
+    if not edicion.is_valid():
+        errores["actualizar"] = list(edicion.errors)
+
+    # Un solo query con los items actuales de la lista (id -> nombre)
+    nombres_actuales = dict(
+        Item.objects.filter(lista_id=lista.id).values_list("id", "nombre")
+    )
+
+    # bool es subclase de int (y True == 1): sin esto 'true' editaría el item 1
+    def es_id(valor):
+        return isinstance(valor, int) and not isinstance(valor, bool)
+
+    ids_eliminar = set()
+    for i, item_id in enumerate(eliminar):
+        if isinstance(item_id, bool):
+            errores["eliminar"][i] = {"id": ["El id debe ser un entero."]}
+        elif not es_id(item_id) or item_id not in nombres_actuales:
+            errores["eliminar"][i] = {"id": ["El item no existe en esta lista."]}
+        else:
+            ids_eliminar.add(item_id)
+
+    ids_actualizar = []
+    for i, fila in enumerate(actualizar):
+        item_id = fila.get("id") if isinstance(fila, dict) else None
+        ids_actualizar.append(item_id if es_id(item_id) else None)
+        if isinstance(item_id, bool):
+            errores["actualizar"][i]["id"] = ["El id debe ser un entero."]
+        elif not es_id(item_id) or item_id not in nombres_actuales:
+            errores["actualizar"][i]["id"] = ["El item no existe en esta lista."]
+        elif item_id in ids_eliminar or ids_actualizar.count(item_id) > 1:
+            errores["actualizar"][i]["id"] = ["El item aparece más de una vez en el lote."]
+
+    # uq_item_nombre_por_lista: nombres finales de la lista tras el lote.
+    # Se revisa aunque otras filas tengan errores, para reportarlo todo junto.
+    def nombre_de(fila):
+        if isinstance(fila, dict) and isinstance(fila.get("nombre"), str):
+            return fila["nombre"].strip()
+        return None
+
+    renombrados = set()
+    for item_id, fila in zip(ids_actualizar, actualizar):
+        if item_id in nombres_actuales and nombre_de(fila):
+            if nombres_actuales[item_id] != nombre_de(fila):
+                renombrados.add(item_id)
+            nombres_actuales[item_id] = nombre_de(fila)
+    duenos = {}
+    for item_id, nombre in nombres_actuales.items():
+        if item_id not in ids_eliminar:
+            duenos.setdefault(nombre, []).append(("actualizar", item_id))
+    for i, fila in enumerate(crear):
+        if nombre_de(fila):
+            duenos.setdefault(nombre_de(fila), []).append(("crear", i))
+    for nombre, filas in duenos.items():
+        if len(filas) < 2:
+            continue
+        for operacion, ref in filas:
+            mensaje = [f"Ya existe un item '{nombre}' en esta lista."]
+            if operacion == "crear":
+                errores["crear"][ref]["nombre"] = mensaje
+            elif ref in renombrados:
+                errores["actualizar"][ids_actualizar.index(ref)]["nombre"] = mensaje
+
+    if any(any(fila) for filas in errores.values() for fila in filas):
+        return Response({"errores": errores}, status=status.HTTP_400_BAD_REQUEST)
+
+    ahora = timezone.now()
+    try:
+        with transaction.atomic():
+            # Aportes al historial antes y después del lote, para moverlos por diferencia
+            anteriores, posteriores = [], []
+            if ids_eliminar:
+                anteriores += Item.objects.filter(
+                    lista_id=lista.id, pk__in=ids_eliminar
+                ).values(*CAMPOS_APORTE)
+                Item.objects.filter(lista_id=lista.id, pk__in=ids_eliminar).update(
+                    deleted_at=ahora, updated_at=ahora, version=F("version") + 1
+                )
+
+            editados, sin_precios = [], []
+            if actualizar:
+                instancias = Item.objects.in_bulk(ids_actualizar)
+                campos = {"updated_at", "version"}
+                for item_id, valores in zip(ids_actualizar, edicion.validated_data):
+                    item = instancias[item_id]
+                    anteriores.append(valores_item(item))
+                    if cambia_nombre_de_precios(item.nombre, valores.get("nombre", item.nombre)):
+                        sin_precios.append(item_id)
+                    if "comprado" in valores and valores["comprado"] != item.comprado:
+                        item.fecha_comprado = ahora if valores["comprado"] else None
+                        campos.add("fecha_comprado")
+                    for campo, valor in valores.items():
+                        setattr(item, campo, valor)
+                    item.updated_at = ahora
+                    item.version += 1
+                    campos.update(valores)
+                    editados.append(item)
+
+            nuevos = [
+                Item(
+                    lista=lista,
+                    fecha_comprado=ahora if valores.get("comprado") else None,
+                    **valores,
+                )
+                for valores in creacion.validated_data
+            ]
+            # Un solo query de referencias de precio para todo el lote
+            marcar_atipicos(editados + nuevos)
+            if editados:
+                Item.objects.bulk_update(editados, sorted(campos | {"precio_atipico"}))
+            olvidar_precios(sin_precios, ahora)
+            creados = Item.objects.bulk_create(nuevos)
+
+            recalcular_total(lista, incrementar_version=True)
+            evaluar_alerta(lista.pk)
+            posteriores = [valores_item(item) for item in editados + creados]
+            for valores in anteriores + posteriores:
+                valores["usuario_id"] = lista.usuario_id
+            aplicar_cambios_historial(anteriores=anteriores, nuevos=posteriores)
+    except IntegrityError:
+        # Otro cliente escribió un nombre repetido entre la validación y el INSERT
+        return Response(
+            {"detail": "Conflicto con otro cambio en la lista, vuelve a intentarlo."},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    return Response(
+        {
+            "creados": ItemSerializer(creados, many=True).data,
+            "actualizados": ItemSerializer(editados, many=True).data,
+            "eliminados": sorted(ids_eliminar),
+            "total_calculado": lista.total_calculado,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
 @api_view(["GET", "PUT", "DELETE"])
 def item_detalle(request, item_id):
     try:
-        item = Item.objects.get(pk=item_id)
+        item = Item.objects.get(pk=item_id, lista__usuario_id=request.user.id)
     except Item.DoesNotExist:
         return Response(
             {"detail": "Item no encontrado"},
@@ -483,8 +1112,26 @@ def item_detalle(request, item_id):
 
     # GET <-- Obtener informacion de un item
     if request.method == "GET":
+        etag = etag_item(item)
+        no_cambio = no_modificado(request, etag, item.updated_at)
+        if no_cambio:
+            return no_cambio
         serializer = ItemSerializer(item)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return con_validadores(
+            Response(serializer.data, status=status.HTTP_200_OK), etag, item.updated_at
+        )
+
+    # PUT y DELETE son condicionales a la versión leída arriba: el
+    # UPDATE/DELETE lleva "WHERE version = n", así que si se aplica, el
+    # estado anterior es justo el que tenemos en memoria (los deltas de la
+    # lista salen de ahí sin volver a leer). Si el cliente manda If-Match o
+    # "version" y no coincide, 409 con el estado actual.
+    esperada, error = leer_version_esperada(request, item.pk)
+    if error:
+        return error
+    if esperada is not None and esperada != item.version:
+        return responder_conflicto(item, ItemSerializer, etag_item(item))
+    anterior = valores_item(item)
 
     # PUT <-- Editar informacion de un item
     if request.method == "PUT":
@@ -494,15 +1141,228 @@ def item_detalle(request, item_id):
             data["lista"] = data["lista_id"]
 
         serializer = ItemSerializer(item, data=data, partial=True)
-        if serializer.is_valid():
-            item = serializer.save()
-            recalcular_total(item.lista)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        destino = serializer.validated_data.get("lista")
+        if destino is not None and destino.usuario_id != request.user.id:
+            return lista_no_encontrada()
+
+        cambios = dict(serializer.validated_data, updated_at=timezone.now())
+        # Al marcar/desmarcar como comprado se registra cuándo
+        comprado = cambios.get("comprado")
+        if comprado is not None and comprado != item.comprado:
+            cambios["fecha_comprado"] = timezone.now() if comprado else None
+        renombrado = cambia_nombre_de_precios(item.nombre, cambios.get("nombre", item.nombre))
+        if "nombre" in cambios or "precio_unitario" in cambios:
+            cambios["precio_atipico"] = precio_atipico(
+                cambios.get("nombre", item.nombre),
+                cambios.get("precio_unitario", item.precio_unitario),
+            )
+
+        with transaction.atomic():
+            actualizados = Item.objects.filter(pk=item.pk, version=item.version).update(
+                version=F("version") + 1, **cambios
+            )
+            if actualizados:
+                for campo, valor in cambios.items():
+                    setattr(item, campo, valor)
+                item.version += 1
+                nuevo = valores_item(item)
+                anterior["usuario_id"] = usuario_de_lista(anterior["lista_id"])
+                if anterior["lista_id"] == item.lista_id:
+                    aplicar_cambio_item(item.lista_id, anterior=anterior, nuevo=nuevo)
+                    nuevo["usuario_id"] = anterior["usuario_id"]
+                else:
+                    # El item se movió de lista
+                    aplicar_cambio_item(anterior["lista_id"], anterior=anterior)
+                    aplicar_cambio_item(item.lista_id, nuevo=nuevo)
+                    evaluar_alerta(anterior["lista_id"])
+                    nuevo["usuario_id"] = usuario_de_lista(item.lista_id)
+                evaluar_alerta(item.lista_id)
+                aplicar_cambio_historial(anterior=anterior, nuevo=nuevo)
+                if renombrado:
+                    olvidar_precios([item.pk], cambios["updated_at"])
+
+        if not actualizados:
+            return conflicto_item(item.pk)
+        return con_validadores(
+            Response(ItemSerializer(item).data, status=status.HTTP_200_OK),
+            etag_item(item),
+            item.updated_at,
+        )
 
     # DELETE <-- Eliminar un item
     if request.method == "DELETE":
-        lista = item.lista
-        item.delete()
-        recalcular_total(lista)
+        ahora = timezone.now()
+        with transaction.atomic():
+            # Borrado lógico: queda como tombstone para /api/sync/
+            borrados = Item.objects.filter(pk=item.pk, version=item.version).update(
+                deleted_at=ahora, updated_at=ahora, version=F("version") + 1
+            )
+            if borrados:
+                aplicar_cambio_item(anterior["lista_id"], anterior=anterior)
+                evaluar_alerta(anterior["lista_id"])
+                anterior["usuario_id"] = usuario_de_lista(anterior["lista_id"])
+                aplicar_cambio_historial(anterior=anterior)
+        if not borrados:
+            return conflicto_item(item.pk)
         return Response({"message": "Item eliminado"}, status=status.HTTP_200_OK)
+
+
+def cambia_nombre_de_precios(anterior, nuevo):
+    """
+    Si con el nombre nuevo los precios online se buscan con otro nombre
+    normalizado: los que tiene el item dejan de valer.
+    """
+    return normalizar_nombre(nuevo) != normalizar_nombre(anterior)
+
+
+def conflicto_item(item_id):
+    actual = Item.objects.filter(pk=item_id).first()
+    if actual is None:
+        return Response({"detail": "Item no encontrado"}, status=status.HTTP_404_NOT_FOUND)
+    return responder_conflicto(actual, ItemSerializer, etag_item(actual))
+
+
+# ===========================
+# SYNC (offline-first)
+# ===========================
+@api_view(["GET"])
+def sync(request):
+    """
+    GET /api/sync/?desde=<watermark>   (usuario del token)
+
+    Sin 'desde' devuelve todas las listas e items vigentes del usuario. Con
+    'desde' (el watermark del sync anterior) sólo lo creado, editado o
+    borrado después; lo borrado sale como tombstone {id, version, deleted_at}.
+    Siempre devuelve el 'watermark' para el siguiente sync. Si 'completo'
+    es true (primer sync, o watermark más viejo que la retención de los
+    borrados) la respuesta trae todo y reemplaza la copia local.
+    """
+    usuario_id, error = resolver_usuario_id(request, request.query_params.get("usuario_id"))
+    if error:
+        return error
+
+    desde = request.query_params.get("desde")
+    try:
+        desde = leer_watermark(desde) if desde else None
+    except WatermarkInvalido as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    cambios = cambios_desde(usuario_id, desde)
+    return Response(
+        {
+            "listas": ListaSyncSerializer(cambios["listas"], many=True).data,
+            "items": ItemSyncSerializer(cambios["items"], many=True).data,
+            "listas_eliminadas": TombstoneSerializer(cambios["listas_eliminadas"], many=True).data,
+            "items_eliminados": TombstoneSerializer(cambios["items_eliminados"], many=True).data,
+            "completo": cambios["completo"],
+            "watermark": codificar_watermark(cambios["watermark"]),
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+# ===========================
+# EVENTOS (KPIs)
+# ===========================
+@api_view(["POST"])
+def eventos(request):
+    """
+    POST /api/eventos/  -> recibe un lote de eventos de uso de la app.
+    Body JSON:
+    {
+        "eventos": [
+            {"tipo": "ABRE_APP"},
+            {"tipo": "CREA_LISTA", "entidad": "listas", "entidad_id": 10,
+             "ts": "2025-10-01T12:00:00Z"}
+        ]
+    }
+
+    Los eventos se encolan en memoria y se guardan en lote en segundo plano
+    (ver eventos.py), por eso responde 202. Si el buffer está lleno responde
+    503 con Retry-After y el cliente debe reenviar el lote.
+    """
+    data = request.data
+    usuario_id, error = resolver_usuario_id(
+        request, data.get("usuario") or data.get("usuario_id")
+    )
+    if error:
+        return error
+
+    filas = data.get("eventos")
+    maximo = getattr(settings, "SMARTCAR_EVENTOS_MAX_POR_PETICION", 500)
+    if not isinstance(filas, list) or not filas:
+        return Response(
+            {"detail": "'eventos' debe ser un arreglo con al menos un evento."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(filas) > maximo:
+        return Response(
+            {"detail": f"Máximo {maximo} eventos por petición."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    serializer = EventoEntradaSerializer(data=filas, many=True)
+    if not serializer.is_valid():
+        return Response({"errores": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    lote = [Evento(usuario_id=usuario_id, **valores) for valores in serializer.validated_data]
+    try:
+        aceptados = buffer_eventos.encolar(lote)
+    except ColaLlena:
+        return Response(
+            {"detail": "El servidor está ocupado, reintenta en unos segundos."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(max(1, int(buffer_eventos.intervalo)))},
+        )
+    return Response({"aceptados": aceptados}, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(["GET"])
+@permission_classes([EsAdministrador])
+def kpis_diarios(request):
+    """
+    GET /api/kpis/diarios/?desde=2025-10-01&hasta=2025-10-31&tipo=ABRE_APP
+    Eventos y usuarios activos por día y tipo (DAU = tipo ABRE_APP), de
+    todos los usuarios: sólo para administradores (403 para el resto).
+    Lee sólo la tabla de rollups que mantiene 'manage.py rollup_kpis'.
+    """
+    qs = KpiDiario.objects.all()
+    for parametro, lookup in (("desde", "dia__gte"), ("hasta", "dia__lte")):
+        valor = request.query_params.get(parametro)
+        if valor:
+            fecha = parse_date(valor)
+            if fecha is None:
+                return Response(
+                    {"detail": f"'{parametro}' debe tener formato AAAA-MM-DD."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            qs = qs.filter(**{lookup: fecha})
+    tipo = request.query_params.get("tipo")
+    if tipo:
+        qs = qs.filter(tipo=tipo)
+    qs = qs.order_by("dia", "tipo")
+    return Response({"kpis": KpiDiarioSerializer(qs, many=True).data}, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+def kpis_mensuales(request):
+    """
+    GET /api/kpis/mensuales/?mes=2025-10&tipo=ABRE_APP   (usuario del token)
+    Eventos y días activos por usuario, mes y tipo (frecuencia de uso).
+    Lee sólo la tabla de rollups.
+    """
+    usuario_id, error = resolver_usuario_id(request, request.query_params.get("usuario_id"))
+    if error:
+        return error
+    qs = KpiMensualUsuario.objects.filter(usuario_id=usuario_id)
+    for parametro in ("mes", "tipo"):
+        valor = request.query_params.get(parametro)
+        if valor:
+            qs = qs.filter(**{parametro: valor})
+    qs = qs.order_by("mes", "tipo")
+    return Response(
+        {"kpis": KpiMensualUsuarioSerializer(qs, many=True).data},
+        status=status.HTTP_200_OK,
+    )
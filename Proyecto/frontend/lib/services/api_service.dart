@@ -4,6 +4,16 @@ import 'package:http/http.dart' as http;
 class ApiService {
   static const String baseUrl = 'http://127.0.0.1:8000';
 
+  /// Token que devuelve /api/login/; el resto de endpoints lo exige.
+  static String? token;
+
+  Map<String, String> _headers({bool json = false}) {
+    return {
+      if (json) 'Content-Type': 'application/json',
+      if (token != null) 'Authorization': 'Bearer $token',
+    };
+  }
+
   Future<bool> healthCheck() async {
     final url = Uri.parse('$baseUrl/api/health/');
     final response = await http.get(url);
@@ -46,14 +56,18 @@ class ApiService {
       }),
     );
 
+    final body = jsonDecode(response.body);
+    if (response.statusCode == 200 && body is Map) {
+      token = body['token'];
+    }
     return {
       'status': response.statusCode,
-      'body': jsonDecode(response.body),
+      'body': body,
     };
   }
   Future<Map<String, dynamic>> obtenerHistorial(int usuarioId) async {
     final url = Uri.parse('$baseUrl/api/historial/$usuarioId/');
-    final response = await http.get(url);
+    final response = await http.get(url, headers: _headers());
     return {
       "status": response.statusCode,
       "body": jsonDecode(response.body),
@@ -64,7 +78,7 @@ class ApiService {
   /// ✅ Obtener listas de un usuario (soporta lista directa o objeto con "results"/"listas")
   Future<List<dynamic>> getListas(int usuarioId) async {
     final url = Uri.parse('$baseUrl/api/listas/?usuario_id=$usuarioId');
-    final response = await http.get(url);
+    final response = await http.get(url, headers: _headers());
 
     if (response.statusCode == 200) {
       final decoded = jsonDecode(response.body);
@@ -95,7 +109,7 @@ class ApiService {
     final url = Uri.parse('$baseUrl/api/listas/');
     final response = await http.post(
       url,
-      headers: {'Content-Type': 'application/json'},
+      headers: _headers(json: true),
       body: jsonEncode({
         'nombre': nombre,
         'presupuesto': presupuesto,
@@ -115,7 +129,7 @@ class ApiService {
     final url = Uri.parse('$baseUrl/api/listas/$id/');
     final response = await http.put(
       url,
-      headers: {'Content-Type': 'application/json'},
+      headers: _headers(json: true),
       body: jsonEncode({
         'nombre': nombre,
         'presupuesto': presupuesto,
@@ -130,7 +144,7 @@ class ApiService {
   Future<bool> eliminarLista(int id) async {
     // Asumo endpoint REST estándar de DRF: /api/listas/<id>/
     final url = Uri.parse('$baseUrl/api/listas/$id/');
-    final response = await http.delete(url);
+    final response = await http.delete(url, headers: _headers());
 
     // DRF suele devolver 204, pero por si acaso aceptamos 200 también
     return response.statusCode == 204 || response.statusCode == 200;
@@ -138,7 +152,7 @@ class ApiService {
 
   Future<Map<String, dynamic>?> getResumenLista(int listaId) async {
     final url = Uri.parse('$baseUrl/api/resumen_lista/$listaId/');
-    final response = await http.get(url);
+    final response = await http.get(url, headers: _headers());
     if (response.statusCode == 200) {
       return jsonDecode(response.body) as Map<String, dynamic>;
     }
@@ -148,7 +162,7 @@ class ApiService {
   Future<List<String>> getRecomendaciones(int listaId) async {
     final url = Uri.parse('$baseUrl/api/recomendaciones/$listaId/');
 
-    final response = await http.get(url);
+    final response = await http.get(url, headers: _headers());
 
     if (response.statusCode == 200) {
       final data = jsonDecode(response.body);
@@ -171,7 +185,7 @@ class ApiService {
 
     final response = await http.post(
       url,
-      headers: {"Content-Type": "application/json"},
+      headers: _headers(json: true),
       body: jsonEncode({
         "lista_id": listaId,
         "nombre": nombre,
@@ -187,7 +201,7 @@ class ApiService {
   Future<List<dynamic>> getItems(int listaId) async {
     final url = Uri.parse('$baseUrl/api/items/?lista_id=$listaId');
 
-    final response = await http.get(url);
+    final response = await http.get(url, headers: _headers());
 
     if (response.statusCode == 200) {
       final data = jsonDecode(response.body);
@@ -204,7 +218,7 @@ class ApiService {
   Future<Map<String, dynamic>?> getItemDetalle(int id) async {
     final url = Uri.parse('$baseUrl/api/items/$id/');
 
-    final response = await http.get(url);
+    final response = await http.get(url, headers: _headers());
 
     if (response.statusCode == 200) {
       return jsonDecode(response.body);
@@ -224,7 +238,7 @@ class ApiService {
 
     final response = await http.put(
       url,
-      headers: {"Content-Type": "application/json"},
+      headers: _headers(json: true),
       body: jsonEncode({
         "nombre": nombre,
         'cantidad': cantidad,
@@ -239,7 +253,7 @@ class ApiService {
   Future<bool> borrarItem(int id) async {
     final url = Uri.parse('$baseUrl/api/items/$id/');
 
-    final response = await http.delete(url);
+    final response = await http.delete(url, headers: _headers());
 
     return response.statusCode == 200;
   }